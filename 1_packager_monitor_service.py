@@ -6,16 +6,22 @@ Pushes metrics to InfluxDB / Prometheus
 """
 
 import requests
+import urllib3
+import asyncio
 import time
 import json
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from concurrent.futures import ThreadPoolExecutor
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, asdict, replace
+from operator import attrgetter
 from typing import List, Dict, Optional
+from urllib.parse import urlsplit
 import m3u8
 from influxdb_client import InfluxDBClient, Point
 from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.rest import ApiException
 import hashlib
 import socket
 import struct
@@ -23,8 +29,21 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
 import subprocess
-import tempfile
 import base64
+import zlib
+import threading
+import selectors
+import select
+import ctypes
+import errno
+import sys
+import re
+import math
+import random
+import queue
+import signal
+import numpy as np
+from snapshot_store import SnapshotStore
 
 # ============================================================================
 # CONFIGURATION
@@ -47,6 +66,13 @@ class MonitorConfig:
     influxdb_token: str = None
     influxdb_org: str = None
     influxdb_bucket: str = None
+    influxdb_batch_size: int = None  # points per write request
+    influxdb_flush_interval: float = None  # seconds between flushes of a partial batch
+    influxdb_queue_mb: int = None  # queued line protocol before writers block, then drop oldest
+    metrics_schema: str = None  # 'narrow' (one measurement per metric group), 'wide' (input_health) or 'both'
+    metrics_spool_dir: str = None  # on-disk spool for points InfluxDB did not accept; '' disables it
+    metrics_spool_mb: int = None  # spool quota; oldest segments are evicted beyond it
+    metrics_spool_replay_rate: int = None  # points/s replayed once InfluxDB is back
 
     # Database
     database_url: str = None
@@ -65,12 +91,40 @@ class MonitorConfig:
     udp_timeout: float = 5.0  # seconds
     udp_buffer_size: int = 188 * 7  # TS packets (188 bytes each)
     min_ts_packets: int = 100  # minimum packets to receive for valid probe
+    tr101290_engine: str = None  # 'numpy' (vectorized) or 'python' (per-packet reference)
+    udp_mode: str = None  # 'probe' (join/leave every cycle) or 'listener' (long-lived sockets)
+    listener_report_interval: int = None  # seconds between metric reports in listener mode
+    listener_socket_buffer: int = 4 * 1024 * 1024  # SO_RCVBUF per listener socket
+    capture_buffer_mb: int = None  # per listener capture bank (two banks per input)
+    udp_kernel_timestamps: bool = None  # SO_TIMESTAMPNS arrival times for MDI
+
+    # Persistent ffmpeg decode workers (listener mode)
+    decode_worker_tiers: str = None  # '' (off), 'all' or comma-separated channel tiers; black/freeze detection needs one
+    decode_worker_cpu_percent: int = None  # per-worker CPU budget (% of one core)
+    decode_worker_frame_interval: int = None  # seconds between decoded frames
 
     # Snapshot/Thumbnail
     enable_snapshots: bool = None
-    snapshot_duration: int = 3  # seconds to capture for snapshot
     snapshot_interval: int = None
     snapshot_dir: str = None
+    snapshot_history_count: int = None  # snapshots kept per input besides the latest
+    snapshot_history_mb: int = None  # history size cap per input
+    snapshot_history_hours: int = None  # history age cap
+    snapshot_thumbnail_format: str = None  # 'webp', 'jpg' or '' (none)
+    snapshot_thumbnail_width: int = None
+
+    # Codec info cache (ffprobe only when the stream signature changes)
+    codec_cache_ttl: int = None  # seconds before re-probing an unchanged stream
+
+    # HTTP (HLS playlists and segments)
+    http_timeout: float = None  # seconds per attempt
+    http_retries: int = None  # extra attempts on connection errors, timeouts and 429/5xx
+    http_retry_backoff: float = None  # first retry delay cap (s), doubled per attempt, full jitter
+    hls_concurrency: int = None  # HLS requests in flight across all channels
+    hls_host_concurrency: int = None  # HLS requests in flight per packager host
+    hls_channel_deadline: float = None  # seconds for one channel's playlists and segments
+    playlist_stall_target_durations: float = None  # live playlist is stalled after this many target durations without a new segment
+    hls_sample_segments: int = None  # newest new segments downloaded per rendition and cycle
 
     # Polling
     poll_interval: int = None
@@ -91,6 +145,20 @@ class MonitorConfig:
             self.influxdb_org = os.getenv('INFLUXDB_ORG', 'fpt-play')
         if self.influxdb_bucket is None:
             self.influxdb_bucket = os.getenv('INFLUXDB_BUCKET', 'packager_metrics')
+        if self.influxdb_batch_size is None:
+            self.influxdb_batch_size = int(os.getenv('INFLUXDB_BATCH_SIZE', '5000'))
+        if self.influxdb_flush_interval is None:
+            self.influxdb_flush_interval = float(os.getenv('INFLUXDB_FLUSH_INTERVAL', '1.0'))
+        if self.influxdb_queue_mb is None:
+            self.influxdb_queue_mb = int(os.getenv('INFLUXDB_QUEUE_MB', '32'))
+        if self.metrics_schema is None:
+            self.metrics_schema = os.getenv('METRICS_SCHEMA', 'narrow').lower()
+        if self.metrics_spool_dir is None:
+            self.metrics_spool_dir = os.getenv('METRICS_SPOOL_DIR', '/var/lib/packager-monitor/spool')
+        if self.metrics_spool_mb is None:
+            self.metrics_spool_mb = int(os.getenv('METRICS_SPOOL_MB', '1024'))
+        if self.metrics_spool_replay_rate is None:
+            self.metrics_spool_replay_rate = int(os.getenv('METRICS_SPOOL_REPLAY_RATE', '20000'))
         if self.packager_url is None:
             self.packager_url = os.getenv('PACKAGER_URL', 'http://packager-01.internal')
         if self.poll_interval is None:
@@ -101,6 +169,50 @@ class MonitorConfig:
             self.snapshot_interval = int(os.getenv('SNAPSHOT_INTERVAL', '60'))
         if self.snapshot_dir is None:
             self.snapshot_dir = os.getenv('SNAPSHOT_DIR', '/tmp/inspector_snapshots')
+        if self.snapshot_history_count is None:
+            self.snapshot_history_count = int(os.getenv('SNAPSHOT_HISTORY_COUNT', '60'))
+        if self.snapshot_history_mb is None:
+            self.snapshot_history_mb = int(os.getenv('SNAPSHOT_HISTORY_MB', '50'))
+        if self.snapshot_history_hours is None:
+            self.snapshot_history_hours = int(os.getenv('SNAPSHOT_HISTORY_HOURS', '24'))
+        if self.snapshot_thumbnail_format is None:
+            self.snapshot_thumbnail_format = os.getenv('SNAPSHOT_THUMBNAIL_FORMAT', 'webp').lower()
+        if self.snapshot_thumbnail_width is None:
+            self.snapshot_thumbnail_width = int(os.getenv('SNAPSHOT_THUMBNAIL_WIDTH', '320'))
+        if self.tr101290_engine is None:
+            self.tr101290_engine = os.getenv('TR101290_ENGINE', 'numpy').lower()
+        if self.udp_mode is None:
+            self.udp_mode = os.getenv('UDP_MODE', 'probe').lower()
+        if self.listener_report_interval is None:
+            self.listener_report_interval = int(os.getenv('LISTENER_REPORT_INTERVAL', '5'))
+        if self.capture_buffer_mb is None:
+            self.capture_buffer_mb = int(os.getenv('CAPTURE_BUFFER_MB', '16'))
+        if self.udp_kernel_timestamps is None:
+            self.udp_kernel_timestamps = os.getenv('UDP_KERNEL_TIMESTAMPS', 'false').lower() in ('true', '1', 'yes')
+        if self.decode_worker_tiers is None:
+            self.decode_worker_tiers = os.getenv('DECODE_WORKER_TIERS', '').strip().lower()
+        if self.decode_worker_cpu_percent is None:
+            self.decode_worker_cpu_percent = int(os.getenv('DECODE_WORKER_CPU_PERCENT', '50'))
+        if self.decode_worker_frame_interval is None:
+            self.decode_worker_frame_interval = int(os.getenv('DECODE_WORKER_FRAME_INTERVAL', '10'))
+        if self.codec_cache_ttl is None:
+            self.codec_cache_ttl = int(os.getenv('CODEC_CACHE_TTL', '900'))
+        if self.http_timeout is None:
+            self.http_timeout = float(os.getenv('HTTP_TIMEOUT', '10'))
+        if self.http_retries is None:
+            self.http_retries = int(os.getenv('HTTP_RETRIES', '2'))
+        if self.http_retry_backoff is None:
+            self.http_retry_backoff = float(os.getenv('HTTP_RETRY_BACKOFF', '0.5'))
+        if self.hls_concurrency is None:
+            self.hls_concurrency = int(os.getenv('HLS_CONCURRENCY', '64'))
+        if self.hls_host_concurrency is None:
+            self.hls_host_concurrency = int(os.getenv('HLS_HOST_CONCURRENCY', '16'))
+        if self.hls_channel_deadline is None:
+            self.hls_channel_deadline = float(os.getenv('HLS_CHANNEL_DEADLINE', '25'))
+        if self.playlist_stall_target_durations is None:
+            self.playlist_stall_target_durations = float(os.getenv('PLAYLIST_STALL_TARGET_DURATIONS', '3'))
+        if self.hls_sample_segments is None:
+            self.hls_sample_segments = int(os.getenv('HLS_SAMPLE_SEGMENTS', '2'))
         if self.channels is None:
             self.channels = [
                 f"CH_TV_HD_{i:03d}" for i in range(1, 51)
@@ -123,6 +235,8 @@ class SegmentMetric:
     http_status: int
     content_hash: str
     timestamp: datetime
+    connect_ms: float = 0.0            # DNS + TCP + TLS; 0.0 on a kept-alive connection
+    attempts: int = 1                  # Including retries
 
 @dataclass
 class ABRLadderInfo:
@@ -142,6 +256,20 @@ class PlaylistValidation:
     errors: List[str]
     last_updated: datetime
 
+@dataclass
+class PlaylistFreshness:
+    """How recently a live rendition playlist gained a segment"""
+    channel_id: str
+    rung_id: str
+    media_sequence: int                # EXT-X-MEDIA-SEQUENCE
+    last_sequence: int                 # Media sequence number of the newest segment
+    new_segments: int                  # Segments added since the previous cycle
+    seconds_since_update: float        # Since the newest segment first appeared
+    stall_threshold_sec: float
+    is_stalled: bool
+    not_modified: bool                 # Playlist unchanged (304 or identical body)
+    timestamp: datetime
+
 
 @dataclass
 class InputSource:
@@ -156,6 +284,9 @@ class InputSource:
     probe_id: int
     is_primary: bool
     enabled: bool
+    tier: Optional[int] = None  # Channel tier (1, 2, 3)
+    black_threshold_ms: int = 500    # From the channel's template
+    freeze_threshold_ms: int = 1000
 
 
 @dataclass
@@ -170,6 +301,30 @@ class UDPProbeMetric:
     errors: List[str]
     timestamp: datetime
 
+@dataclass
+class UDPCapture:
+    """Datagrams received from one UDP input over a probe or report window"""
+    ts_data: memoryview                # View into the input's capture ring
+    packet_timestamps: np.ndarray      # Arrival time per datagram
+    packet_sizes: np.ndarray           # Payload bytes per datagram
+    packets_received: int
+    bytes_received: int
+    duration_sec: float
+    contiguous: bool = False           # Directly follows the previous capture of this input
+    errors: List[str] = None
+    clock_source: str = "monotonic"    # kernel (SO_TIMESTAMPNS) or monotonic
+
+@dataclass
+class RTPStats:
+    """RTP sequence/timing analysis of one capture window"""
+    rtp_packets: int = 0
+    packets_lost: int = 0
+    packets_out_of_order: int = 0
+    packets_duplicated: int = 0
+    jitter_ms: float = 0.0             # RFC 3550 interarrival jitter
+    header_bytes: int = 0              # RTP header bytes stripped from the payload
+    loss_per_packet: np.ndarray = None # Sequence numbers missing just before each packet
+
 @dataclass
 class TR101290Metrics:
     """TR 101 290 DVB Measurement Guidelines metrics"""
@@ -204,6 +359,68 @@ class TR101290Metrics:
     pcr_interval_ms: float = 0.0
     timestamp: datetime = None
 
+@dataclass
+class ElementaryStream:
+    """Elementary stream entry from a PMT"""
+    pid: int
+    stream_type: int
+    program_number: int
+    codec: str = "unknown"             # e.g., h264, aac, ac3
+    kind: str = "other"                # video, audio, subtitle, data, other
+    descriptor_tags: List[int] = None  # ES_info descriptor tags
+
+@dataclass
+class VideoParameters:
+    """Video format decoded from H.264/HEVC parameter sets"""
+    codec: str
+    profile: str
+    level: str
+    width: int
+    height: int
+    fps: Optional[float] = None        # From VUI (or HEVC VPS) timing info
+
+@dataclass
+class AudioFrame:
+    """One audio frame header (ADTS, AC-3/E-AC-3 syncframe, MPEG audio)"""
+    codec: str
+    sample_rate: int
+    channels: int
+    layout: str
+    frame_size: int                    # Bytes, header included
+    samples: int                       # PCM samples per channel
+    independent: bool = True           # False for dependent E-AC-3 substreams
+    atmos: bool = False                # E-AC-3 joint object coding (Dolby Atmos)
+
+@dataclass
+class AudioParameters:
+    """Audio format and measured bitrate from the frames at a PES start"""
+    codec: str
+    sample_rate: int
+    channels: int
+    layout: str
+    atmos: bool = False
+    frames: int = 0
+    samples: int = 0
+    frame_bytes: int = 0
+
+    @property
+    def bitrate_kbps(self) -> float:
+        if not self.samples:
+            return 0.0
+        return self.frame_bytes * 8 * self.sample_rate / self.samples / 1000
+
+@dataclass
+class MDIInterval:
+    """RFC 4445 DF/MLR for one measurement interval of a capture window"""
+    offset_sec: float                  # Interval start, relative to the first packet
+    df: float = 0.0                    # Delay Factor (ms)
+    mlr: float = 0.0                   # Media Loss Rate (TS packets/sec)
+    vb_bytes: int = 0                  # Virtual buffer excursion (bytes)
+    packets: int = 0
+    bytes: int = 0
+    media_rate_mbps: float = 0.0       # Virtual buffer drain rate
+    timestamp: datetime = None         # Wall-clock interval start
+
 @dataclass
 class MDIMetrics:
     """Media Delivery Index (MDI) - RFC 4445 Network Transport Metrics"""
@@ -211,13 +428,18 @@ class MDIMetrics:
     input_name: str
 
     # MDI Core Metrics
-    df: float = 0.0                    # Delay Factor (ms) - IP packet jitter
-    mlr: float = 0.0                   # Media Loss Rate (packets/sec)
+    df: float = 0.0                    # Delay Factor (ms) - worst interval
+    mlr: float = 0.0                   # Media Loss Rate (TS packets/sec)
 
     # Network Statistics
     packets_received: int = 0
     packets_lost: int = 0
     packets_out_of_order: int = 0
+    packets_duplicated: int = 0
+
+    # RTP (when the input is RTP-encapsulated)
+    rtp_detected: bool = False
+    rtp_jitter_ms: float = 0.0         # RFC 3550 interarrival jitter
 
     # Buffer Management
     buffer_depth: int = 0              # Current buffer fill (bytes)
@@ -233,6 +455,9 @@ class MDIMetrics:
     inter_arrival_time_ms: float = 0.0 # Average packet inter-arrival time
     jitter_ms: float = 0.0             # Packet delay variation
     max_jitter_ms: float = 0.0         # Maximum jitter observed
+    clock_source: str = "monotonic"    # Arrival timestamps: kernel or monotonic
+
+    intervals: List[MDIInterval] = None # Per-interval DF/MLR time series
 
     timestamp: datetime = None
 
@@ -255,9 +480,38 @@ class CodecInfo:
     audio_channels: str = "Unknown"    # e.g., stereo, 5.1
     audio_sample_rate: str = "Unknown" # e.g., 48000 Hz
     audio_bitrate_kbps: float = 0.0    # Audio bitrate
+    audio_atmos: bool = False          # Dolby Atmos (E-AC-3 JOC) signalled
 
     timestamp: datetime = None
 
+@dataclass
+class CodecCacheEntry:
+    """Last ffprobe result for an input and the stream signature it was probed for"""
+    signature: tuple
+    codec_info: CodecInfo
+    probed_at: float                   # time.monotonic() of the probe
+    pushed: dict = None                # Codec fields last written to InfluxDB
+
+@dataclass
+class RenditionState:
+    """What the previous cycles saw of one live rendition playlist"""
+    etag: Optional[str] = None         # Validators for the next conditional GET
+    last_modified: Optional[str] = None
+    body: Optional[str] = None         # Last playlist text, for servers without validators
+    playlist: object = None            # Parsed m3u8 playlist of `body`
+    validation: Optional[PlaylistValidation] = None
+    last_sequence: int = -1            # Newest segment's media sequence number
+    sampled_through: int = -1          # Newest media sequence number already sampled
+    advanced_at: float = 0.0           # time.monotonic() when last_sequence last grew
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
 @dataclass
 class QoEMetrics:
     """Quality of Experience (QoE) Metrics - Video & Audio Quality"""
@@ -267,6 +521,8 @@ class QoEMetrics:
     # Video Quality
     black_frames_detected: int = 0     # Number of black frames
     freeze_frames_detected: int = 0    # Number of frozen frames
+    black_run_ms: float = 0.0          # Length of the current black run
+    freeze_run_ms: float = 0.0         # Length of the current freeze run
     video_pid_active: bool = False     # Video PID is transmitting
     video_bitrate_mbps: float = 0.0    # Video stream bitrate
 
@@ -283,7 +539,3690 @@ class QoEMetrics:
     audio_quality_score: float = 5.0   # 1.0 (poor) to 5.0 (excellent)
     overall_mos: float = 5.0           # Mean Opinion Score
 
-    timestamp: datetime = None
+    timestamp: datetime = None
+
+# ============================================================================
+# PSI TABLES
+# ============================================================================
+
+# Bit-reversal table. CRC-32/MPEG-2 uses zlib's polynomial but runs MSB-first,
+# so reflecting every input byte lets zlib's C table-driven CRC do the work.
+_BIT_REVERSE = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+
+def mpeg_crc32(data: bytes) -> int:
+    """CRC-32/MPEG-2 (poly 0x04C11DB7, init 0xFFFFFFFF, no final XOR)
+
+    Running it over a complete PSI section including its CRC_32 field
+    yields 0 for an intact section.
+    """
+    crc = zlib.crc32(bytes(data).translate(_BIT_REVERSE)) ^ 0xFFFFFFFF
+    return int(f"{crc:032b}"[::-1], 2)
+
+
+# stream_type -> (codec, kind) per ISO/IEC 13818-1 and ATSC A/52
+STREAM_TYPES = {
+    0x01: ('mpeg1video', 'video'),
+    0x02: ('mpeg2video', 'video'),
+    0x10: ('mpeg4', 'video'),
+    0x1B: ('h264', 'video'),
+    0x24: ('hevc', 'video'),
+    0x42: ('cavs', 'video'),
+    0xEA: ('vc1', 'video'),
+    0x03: ('mp2', 'audio'),
+    0x04: ('mp2', 'audio'),
+    0x0F: ('aac', 'audio'),
+    0x11: ('aac_latm', 'audio'),
+    0x81: ('ac3', 'audio'),
+    0x87: ('eac3', 'audio'),
+    0x05: ('private_sections', 'data'),
+    0x0B: ('dsmcc', 'data'),
+    0x0C: ('dsmcc', 'data'),
+    0x0D: ('dsmcc', 'data'),
+    0x15: ('metadata', 'data'),
+    0x86: ('scte35', 'data'),
+}
+
+# Private PES (stream_type 0x06) is identified by its ES descriptors (DVB)
+PRIVATE_DESCRIPTOR_CODECS = {
+    0x6A: ('ac3', 'audio'),
+    0x7A: ('eac3', 'audio'),
+    0x7B: ('dts', 'audio'),
+    0x7C: ('aac', 'audio'),
+    0x56: ('dvb_teletext', 'subtitle'),
+    0x59: ('dvb_subtitle', 'subtitle'),
+}
+
+
+class PSIParser:
+    """PAT/CAT/NIT/PMT section reassembler with a version-keyed table cache
+
+    Sections are rebuilt per PID from TS packets (pointer_field aware) and
+    CRC-checked. A section is only parsed when its version_number changes;
+    a byte-identical repeat of a cached section skips the CRC as well.
+    """
+
+    def __init__(self):
+        self.nit_pid = 0x0010
+        self.pmt_pids = {}          # program_number -> PMT PID
+        self.streams = {}           # elementary PID -> ElementaryStream
+        self.pcr_pids = set()
+        self.ca_pids = set()        # EMM/ECM PIDs from CAT/PMT CA descriptors
+        self.last_pmt_times = {}    # PMT PID -> monotonic time of last valid PMT
+        self.cat_received = False
+        self.nit_received = False
+
+        self._sections = {}         # (pid, table_id, table_id_extension, section_number) -> (version, raw)
+        self._pat_sections = {}     # section_number -> {program_number: PID}
+        self._program_pcr = {}      # program_number -> PCR PID
+        self._program_ca = {}       # program_number -> ECM PIDs
+        self._cat_ca = set()
+        self._assembly = {}         # PID -> [section buffer, last CC]
+        self._rebuild_references()
+
+    @property
+    def psi_pids(self) -> List[int]:
+        """PIDs carrying tables this parser reassembles, PAT first"""
+        return list(dict.fromkeys([0x0000, 0x0001, self.nit_pid] + sorted(self.pmt_pids.values())))
+
+    @property
+    def pmt_complete(self) -> bool:
+        """True once a PMT has been parsed for every program in the PAT"""
+        return bool(self.pmt_pids) and all(pid in self.last_pmt_times for pid in self.pmt_pids.values())
+
+    @property
+    def signature(self) -> tuple:
+        """PMT versions and the (PID, stream_type) set - changes when the programme layout does"""
+        pmt_versions = tuple(sorted(
+            (key[0], key[2], version) for key, (version, _) in self._sections.items() if key[1] == 0x02
+        ))
+        streams = tuple(sorted((es.pid, es.stream_type) for es in self.streams.values()))
+        return pmt_versions, streams
+
+    def reset_assembly(self):
+        """Drop partially assembled sections (capture gap)"""
+        self._assembly.clear()
+
+    def push_packet(self, packet: bytes, metrics: TR101290Metrics):
+        """Feed one 188-byte TS packet of a PSI PID"""
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+
+        # P1/P2: PSI must never be scrambled
+        if packet[3] & 0xC0:
+            if pid == 0x0000:
+                metrics.pat_error += 1
+            elif pid == 0x0001:
+                metrics.cat_error += 1
+            elif pid in self.pmt_pids.values():
+                metrics.pmt_error += 1
+            return
+
+        adaptation_field = (packet[3] >> 4) & 0x03
+        if not adaptation_field & 0x01:
+            return
+        offset = 4 + (1 + packet[4] if adaptation_field & 0x02 else 0)
+        if offset >= 188:
+            return
+
+        # Continuity: drop duplicates, discard the partial section on loss
+        cc = packet[3] & 0x0F
+        state = self._assembly.setdefault(pid, [bytearray(), -1])
+        buffer, last_cc = state
+        if last_cc >= 0:
+            if cc == last_cc:
+                return
+            if cc != (last_cc + 1) & 0x0F:
+                buffer.clear()
+        state[1] = cc
+
+        payload = packet[offset:]
+        if packet[1] & 0x40:
+            pointer = payload[0]
+            if buffer:
+                buffer += payload[1:1 + pointer]
+                self._drain(pid, buffer, metrics)
+                buffer.clear()
+            buffer += payload[1 + pointer:]
+        elif buffer:
+            buffer += payload
+        else:
+            return  # Continuation of a section whose start we missed
+
+        self._drain(pid, buffer, metrics)
+
+    def _drain(self, pid: int, buffer: bytearray, metrics: TR101290Metrics):
+        """Emit every complete section at the head of the buffer"""
+        while len(buffer) >= 3:
+            if buffer[0] == 0xFF:  # Stuffing until the next payload unit
+                buffer.clear()
+                return
+            length = 3 + (((buffer[1] & 0x0F) << 8) | buffer[2])
+            if len(buffer) < length:
+                return
+            section = bytes(buffer[:length])
+            del buffer[:length]
+            self._on_section(pid, section, metrics)
+
+    def _on_section(self, pid: int, section: bytes, metrics: TR101290Metrics):
+        """Validate a complete section and parse it if its version changed"""
+        table_id = section[0]
+
+        if pid == 0x0000 and table_id != 0x00:
+            metrics.pat_error += 1
+            return
+        if pid == 0x0001 and table_id != 0x01:
+            metrics.cat_error += 1
+            return
+        if pid == self.nit_pid and table_id not in (0x40, 0x41, 0x72):
+            metrics.nit_error += 1
+            return
+
+        # PAT, CAT, PMT and NIT all use the long section syntax
+        if not section[1] & 0x80 or len(section) < 12:
+            return
+        if not section[5] & 0x01:
+            return  # current_next_indicator = 0: not applicable yet
+
+        key = (pid, table_id, (section[3] << 8) | section[4], section[6])
+        version = (section[5] >> 1) & 0x1F
+        cached = self._sections.get(key)
+
+        if cached is None or cached[1] != section:
+            if mpeg_crc32(section) != 0:
+                metrics.crc_error += 1
+                return
+            self._sections[key] = (version, section)
+            if cached is None or cached[0] != version:
+                if table_id == 0x00:
+                    self._parse_pat(section)
+                elif table_id == 0x01:
+                    self._parse_cat(section)
+                elif table_id == 0x02:
+                    self._parse_pmt(section)
+
+        if table_id == 0x00:
+            metrics.pat_received = True
+        elif table_id == 0x02:
+            metrics.pmt_received = True
+            self.last_pmt_times[pid] = time.monotonic()
+        elif table_id == 0x01:
+            self.cat_received = True
+        elif table_id in (0x40, 0x41):
+            self.nit_received = True
+
+    def _parse_pat(self, section: bytes):
+        programs = {}
+        for i in range(8, len(section) - 4, 4):
+            program_number = (section[i] << 8) | section[i + 1]
+            pid = ((section[i + 2] & 0x1F) << 8) | section[i + 3]
+            if program_number == 0:
+                self.nit_pid = pid
+            else:
+                programs[program_number] = pid
+        self._pat_sections[section[6]] = programs
+
+        self.pmt_pids = {}
+        for part in self._pat_sections.values():
+            self.pmt_pids.update(part)
+
+        # Forget programs (and their streams) that left the PAT
+        for program_number in list(self._program_pcr):
+            if program_number not in self.pmt_pids:
+                self._program_pcr.pop(program_number, None)
+                self._program_ca.pop(program_number, None)
+        self.streams = {pid: es for pid, es in self.streams.items() if es.program_number in self.pmt_pids}
+        active_pmt_pids = set(self.pmt_pids.values())
+        self.last_pmt_times = {pid: t for pid, t in self.last_pmt_times.items() if pid in active_pmt_pids}
+        self._rebuild_references()
+
+    def _parse_cat(self, section: bytes):
+        self._cat_ca = set(self._ca_pids(section, 8, len(section) - 4))
+        self._rebuild_references()
+
+    def _parse_pmt(self, section: bytes):
+        program_number = (section[3] << 8) | section[4]
+        self._program_pcr[program_number] = ((section[8] & 0x1F) << 8) | section[9]
+        program_info_length = ((section[10] & 0x0F) << 8) | section[11]
+        self._program_ca[program_number] = set(self._ca_pids(section, 12, 12 + program_info_length))
+
+        streams = {}
+        i = 12 + program_info_length
+        end = len(section) - 4
+        while i + 5 <= end:
+            stream_type = section[i]
+            pid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+            es_info_length = ((section[i + 3] & 0x0F) << 8) | section[i + 4]
+            descriptors_end = min(i + 5 + es_info_length, end)
+
+            tags = []
+            j = i + 5
+            while j + 2 <= descriptors_end:
+                tags.append(section[j])
+                j += 2 + section[j + 1]
+            self._program_ca[program_number].update(self._ca_pids(section, i + 5, descriptors_end))
+
+            codec, kind = STREAM_TYPES.get(stream_type, ('unknown', 'other'))
+            if stream_type == 0x06:
+                codec, kind = next(
+                    (PRIVATE_DESCRIPTOR_CODECS[tag] for tag in tags if tag in PRIVATE_DESCRIPTOR_CODECS),
+                    ('private', 'data')
+                )
+            streams[pid] = ElementaryStream(
+                pid=pid,
+                stream_type=stream_type,
+                program_number=program_number,
+                codec=codec,
+                kind=kind,
+                descriptor_tags=tags
+            )
+            i = descriptors_end
+
+        self.streams = {pid: es for pid, es in self.streams.items() if es.program_number != program_number}
+        self.streams.update(streams)
+        self._rebuild_references()
+
+    @staticmethod
+    def _ca_pids(section: bytes, start: int, end: int):
+        """Yield CA_PIDs from CA descriptors (tag 0x09) in a descriptor loop"""
+        i = start
+        while i + 2 <= end:
+            tag, length = section[i], section[i + 1]
+            if tag == 0x09 and length >= 4 and i + 6 <= end:
+                yield ((section[i + 4] & 0x1F) << 8) | section[i + 5]
+            i += 2 + length
+
+    def _rebuild_references(self):
+        """Recompute the lookup of PIDs referenced by PSI"""
+        referenced = np.zeros(8192, dtype=bool)
+        referenced[:0x20] = True  # PSI/SI reserved range
+        referenced[0x1FFF] = True  # Null packets
+        referenced[self.nit_pid] = True
+        for pids in (self.pmt_pids.values(), self.streams, self._program_pcr.values(), self._cat_ca,
+                     *self._program_ca.values()):
+            for pid in pids:
+                referenced[pid] = True
+        self.pcr_pids = set(self._program_pcr.values())
+        self.ca_pids = set(self._cat_ca).union(*self._program_ca.values())
+        self.referenced = referenced
+
+    def pids_of_kind(self, kind: str) -> List[int]:
+        """Elementary PIDs of a given kind ('video', 'audio', ...) from the PMTs"""
+        return sorted(pid for pid, es in self.streams.items() if es.kind == kind)
+
+    def table_packets(self) -> bytes:
+        """Cached PAT and PMT sections re-packetized as TS packets (one section per packet run)"""
+        out = bytearray()
+        for (pid, table_id, _, _), (_, section) in sorted(self._sections.items()):
+            if table_id not in (0x00, 0x02):
+                continue
+            data = b'\x00' + section  # pointer_field
+            for cc, start in enumerate(range(0, len(data), 184)):
+                chunk = data[start:start + 184]
+                out += bytes([0x47, (0x40 if start == 0 else 0x00) | (pid >> 8), pid & 0xFF, 0x10 | (cc & 0x0F)])
+                out += chunk + b'\xff' * (184 - len(chunk))
+        return bytes(out)
+
+# ============================================================================
+# TS DEMUX
+# ============================================================================
+
+class TSBatch:
+    """TS packet headers of one demux pass, parsed once for all consumers
+
+    Header columns cover the packets with a valid sync byte; `rows` are
+    their indices in `packets`. Views shared by several consumers (per-PID
+    counts, PCR values) are computed on first use and cached.
+    """
+
+    def __init__(self, ts_data, usable: int):
+        self.data = ts_data
+        self.usable = usable
+        self.packet_count = usable // 188
+        self.packets = np.frombuffer(ts_data, dtype=np.uint8, count=usable).reshape(self.packet_count, 188)
+        self.rows = np.flatnonzero(self.packets[:, 0] == 0x47)
+
+        b1 = self.packets[self.rows, 1]
+        b3 = self.packets[self.rows, 3]
+        self.pid = ((b1 & 0x1F).astype(np.uint16) << 8) | self.packets[self.rows, 2]
+        self.transport_error = (b1 & 0x80) != 0
+        self.payload_unit_start = (b1 & 0x40) != 0
+        self.adaptation_field = (b3 >> 4) & 0x03
+        self.cc = (b3 & 0x0F).astype(np.int16)
+
+        self._pid_counts = None
+        self._pcr = None
+
+    @property
+    def synced_packets(self) -> int:
+        return len(self.rows)
+
+    @property
+    def pid_counts(self) -> np.ndarray:
+        """Packets per PID (indexed by PID)"""
+        if self._pid_counts is None:
+            self._pid_counts = np.bincount(self.pid, minlength=8192)
+        return self._pid_counts
+
+    def offsets(self, pid: int) -> List[int]:
+        """Byte offsets of one PID's packets in data"""
+        return (self.rows[self.pid == pid] * 188).tolist()
+
+    def pcr(self) -> tuple:
+        """(PIDs, PCR values in ms) of the packets carrying a PCR"""
+        if self._pcr is None:
+            # Adaptation field long enough to carry a PCR, PCR flag set
+            b4 = self.packets[self.rows, 4]
+            candidates = np.flatnonzero(((self.adaptation_field & 0x02) != 0) & (b4 >= 7) & (b4 < 183))
+            candidates = candidates[(self.packets[self.rows[candidates], 5] & 0x10) != 0]
+
+            pcr_bytes = self.packets[self.rows[candidates], 6:11].astype(np.int64)
+            pcr_base = ((pcr_bytes[:, 0] << 25) | (pcr_bytes[:, 1] << 17) | (pcr_bytes[:, 2] << 9) |
+                        (pcr_bytes[:, 3] << 1) | (pcr_bytes[:, 4] >> 7))
+            self._pcr = (self.pid[candidates], pcr_base / 90.0)  # Convert to milliseconds
+        return self._pcr
+
+
+class TSConsumer:
+    """Plugin interface for TSDemux consumers
+
+    on_batch() receives every TSBatch of the input in order; reset() is
+    called before a batch that does not directly follow the previous one.
+    """
+
+    def on_batch(self, batch: TSBatch):
+        raise NotImplementedError
+
+    def reset(self):
+        pass
+
+
+class PIDCounter(TSConsumer):
+    """Per-PID packet accounting"""
+
+    def __init__(self):
+        self.counts = np.zeros(8192, dtype=np.int64)        # Latest batch
+        self.total_counts = np.zeros(8192, dtype=np.int64)  # Since creation
+        self.packets = 0                                    # Synced packets in the latest batch
+
+    def on_batch(self, batch: TSBatch):
+        self.counts = batch.pid_counts
+        self.total_counts += batch.pid_counts
+        self.packets = batch.synced_packets
+
+    def share(self, pids: List[int]) -> float:
+        """Fraction of the latest batch's packets carried on the given PIDs"""
+        if self.packets == 0:
+            return 0.0
+        return float(self.counts[pids].sum()) / self.packets
+
+
+class TSDemux:
+    """Single-pass TS demux for one input
+
+    Cuts fed bytes into whole 188-byte packets (a trailing partial packet
+    is carried over to the next feed), parses the headers once into a
+    TSBatch and hands it to every registered consumer in registration
+    order. New metrics register a consumer instead of re-parsing the data.
+    """
+
+    def __init__(self, input_name: str = ''):
+        self.input_name = input_name
+        self.consumers = {}   # name -> TSConsumer
+        self.remainder = b''  # Trailing partial TS packet from the previous feed
+
+    def register(self, name: str, consumer: TSConsumer) -> TSConsumer:
+        self.consumers[name] = consumer
+        return consumer
+
+    def reset(self):
+        """Drop the partial packet and reset consumers (capture gap or new socket)"""
+        self.remainder = b''
+        for consumer in self.consumers.values():
+            consumer.reset()
+
+    def feed(self, ts_data, contiguous: bool = True) -> TSBatch:
+        """Parse new TS bytes and dispatch them to the consumers"""
+        if not contiguous:
+            self.reset()
+        if self.remainder:
+            ts_data = self.remainder + bytes(ts_data)
+
+        usable = len(ts_data) - len(ts_data) % 188
+        self.remainder = bytes(ts_data[usable:])
+
+        batch = TSBatch(ts_data, usable)
+        for name, consumer in self.consumers.items():
+            try:
+                consumer.on_batch(batch)
+            except Exception as e:
+                logger.error(f"TS consumer {name} failed for {self.input_name}: {e}")
+        return batch
+
+# ============================================================================
+# VIDEO PARAMETER SETS
+# ============================================================================
+
+class BitReader:
+    """MSB-first bit reader with Exp-Golomb codes (H.264/HEVC RBSP)"""
+
+    def __init__(self, data: bytes):
+        self.value = int.from_bytes(data, 'big')
+        self.size = len(data) * 8
+        self.pos = 0
+
+    def u(self, bits: int) -> int:
+        if self.pos + bits > self.size:
+            raise ValueError("read past end of RBSP")
+        self.pos += bits
+        return (self.value >> (self.size - self.pos)) & ((1 << bits) - 1)
+
+    def skip(self, bits: int):
+        self.u(bits)
+
+    def ue(self) -> int:
+        leading_zeros = 0
+        while self.u(1) == 0:
+            leading_zeros += 1
+            if leading_zeros > 31:
+                raise ValueError("invalid Exp-Golomb code")
+        return (1 << leading_zeros) - 1 + self.u(leading_zeros)
+
+    def se(self) -> int:
+        code = self.ue()
+        return (code + 1) // 2 if code & 1 else -(code // 2)
+
+
+def nal_to_rbsp(nal: bytes) -> bytes:
+    """Remove emulation prevention bytes (00 00 03 -> 00 00)"""
+    return nal.replace(b'\x00\x00\x03', b'\x00\x00')
+
+
+H264_PROFILES = {
+    66: 'Baseline', 77: 'Main', 88: 'Extended', 100: 'High', 110: 'High 10',
+    122: 'High 4:2:2', 244: 'High 4:4:4 Predictive', 44: 'CAVLC 4:4:4',
+}
+HEVC_PROFILES = {1: 'Main', 2: 'Main 10', 3: 'Main Still Picture', 4: 'Rext'}
+
+# H.264 profiles whose SPS carries chroma format, bit depth and scaling matrices
+_H264_HIGH_PROFILES = {100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135}
+
+
+def _skip_scaling_list(reader: BitReader, size: int):
+    last_scale = next_scale = 8
+    for _ in range(size):
+        if next_scale != 0:
+            next_scale = (last_scale + reader.se() + 256) % 256
+        last_scale = next_scale if next_scale != 0 else last_scale
+
+
+def _cropped_size(width: int, height: int, chroma_format_idc: int, crop: tuple,
+                  field_factor: int = 1) -> tuple:
+    """Apply a cropping/conformance window given in chroma sample units"""
+    sub_width = 2 if chroma_format_idc in (1, 2) else 1
+    sub_height = 2 if chroma_format_idc == 1 else 1
+    left, right, top, bottom = crop
+    return (width - sub_width * (left + right),
+            height - sub_height * field_factor * (top + bottom))
+
+
+def parse_h264_sps(nal: bytes) -> VideoParameters:
+    """Decode profile, level, size and frame rate from an H.264 SPS NAL unit"""
+    reader = BitReader(nal_to_rbsp(nal[1:]))
+    profile_idc = reader.u(8)
+    constraint_flags = reader.u(8)
+    level_idc = reader.u(8)
+    reader.ue()  # seq_parameter_set_id
+
+    chroma_format_idc = 1
+    if profile_idc in _H264_HIGH_PROFILES:
+        chroma_format_idc = reader.ue()
+        if chroma_format_idc == 3 and reader.u(1):  # separate_colour_plane_flag
+            chroma_format_idc = 0
+        reader.ue()  # bit_depth_luma_minus8
+        reader.ue()  # bit_depth_chroma_minus8
+        reader.skip(1)  # qpprime_y_zero_transform_bypass_flag
+        if reader.u(1):  # seq_scaling_matrix_present_flag
+            for i in range(12 if chroma_format_idc == 3 else 8):
+                if reader.u(1):
+                    _skip_scaling_list(reader, 16 if i < 6 else 64)
+
+    reader.ue()  # log2_max_frame_num_minus4
+    pic_order_cnt_type = reader.ue()
+    if pic_order_cnt_type == 0:
+        reader.ue()  # log2_max_pic_order_cnt_lsb_minus4
+    elif pic_order_cnt_type == 1:
+        reader.skip(1)
+        reader.se()
+        reader.se()
+        for _ in range(reader.ue()):
+            reader.se()
+    reader.ue()  # max_num_ref_frames
+    reader.skip(1)  # gaps_in_frame_num_value_allowed_flag
+    width_mbs = reader.ue() + 1
+    height_map_units = reader.ue() + 1
+    frame_mbs_only = reader.u(1)
+    if not frame_mbs_only:
+        reader.skip(1)  # mb_adaptive_frame_field_flag
+    reader.skip(1)  # direct_8x8_inference_flag
+    crop = (reader.ue(), reader.ue(), reader.ue(), reader.ue()) if reader.u(1) else (0, 0, 0, 0)
+
+    field_factor = 2 - frame_mbs_only
+    if chroma_format_idc == 0:
+        width = width_mbs * 16 - (crop[0] + crop[1])
+        height = height_map_units * 16 * field_factor - field_factor * (crop[2] + crop[3])
+    else:
+        width, height = _cropped_size(width_mbs * 16, height_map_units * 16 * field_factor,
+                                      chroma_format_idc, crop, field_factor)
+
+    fps = None
+    if reader.u(1):  # vui_parameters_present_flag
+        if reader.u(1):  # aspect_ratio_info_present_flag
+            if reader.u(8) == 255:
+                reader.skip(32)
+        if reader.u(1):  # overscan_info_present_flag
+            reader.skip(1)
+        if reader.u(1):  # video_signal_type_present_flag
+            reader.skip(4)
+            if reader.u(1):
+                reader.skip(24)
+        if reader.u(1):  # chroma_loc_info_present_flag
+            reader.ue()
+            reader.ue()
+        if reader.u(1):  # timing_info_present_flag
+            num_units_in_tick = reader.u(32)
+            time_scale = reader.u(32)
+            if num_units_in_tick:
+                fps = time_scale / (2 * num_units_in_tick)
+
+    profile = H264_PROFILES.get(profile_idc, str(profile_idc))
+    if profile_idc == 66 and constraint_flags & 0x40:
+        profile = 'Constrained Baseline'
+    if level_idc == 9 or (level_idc == 11 and constraint_flags & 0x10 and profile_idc in (66, 77, 88)):
+        level = '1b'
+    else:
+        level = f"{level_idc / 10:.1f}"
+
+    return VideoParameters(codec='h264', profile=profile, level=level, width=width, height=height, fps=fps)
+
+
+def _skip_profile_tier_level(reader: BitReader, max_sub_layers_minus1: int) -> tuple:
+    """Parse profile_tier_level(); returns (general_profile_idc, general_level_idc)"""
+    reader.skip(3)  # general_profile_space, general_tier_flag
+    profile_idc = reader.u(5)
+    reader.skip(32 + 48)  # compatibility flags, constraint flags
+    level_idc = reader.u(8)
+    sub_layer_flags = [(reader.u(1), reader.u(1)) for _ in range(max_sub_layers_minus1)]
+    if max_sub_layers_minus1 > 0:
+        reader.skip(2 * (8 - max_sub_layers_minus1))
+    for profile_present, level_present in sub_layer_flags:
+        if profile_present:
+            reader.skip(88)
+        if level_present:
+            reader.skip(8)
+    return profile_idc, level_idc
+
+
+def _skip_hevc_scaling_list_data(reader: BitReader):
+    for size_id in range(4):
+        for _ in range(0, 6, 3 if size_id == 3 else 1):
+            if not reader.u(1):  # scaling_list_pred_mode_flag
+                reader.ue()
+                continue
+            if size_id > 1:
+                reader.se()  # scaling_list_dc_coef_minus8
+            for _ in range(min(64, 1 << (4 + (size_id << 1)))):
+                reader.se()
+
+
+def _skip_st_ref_pic_sets(reader: BitReader, count: int):
+    """Parse the SPS short-term reference picture sets (only their sizes matter)"""
+    delta_pocs = []
+    for index in range(count):
+        if index != 0 and reader.u(1):  # inter_ref_pic_set_prediction_flag
+            reader.skip(1)  # delta_rps_sign
+            reader.ue()     # abs_delta_rps_minus1
+            kept = 0
+            for _ in range(delta_pocs[index - 1] + 1):
+                used_by_curr_pic = reader.u(1)
+                if used_by_curr_pic or reader.u(1):  # use_delta_flag
+                    kept += 1
+            delta_pocs.append(kept)
+        else:
+            negative = reader.ue()
+            positive = reader.ue()
+            for _ in range(negative + positive):
+                reader.ue()
+                reader.skip(1)
+            delta_pocs.append(negative + positive)
+
+
+def parse_hevc_vps_fps(nal: bytes) -> Optional[float]:
+    """Frame rate from the timing info of an HEVC VPS NAL unit, if signalled"""
+    reader = BitReader(nal_to_rbsp(nal[2:]))
+    reader.skip(4 + 2 + 6)  # vps_video_parameter_set_id, base layer flags, vps_max_layers_minus1
+    max_sub_layers_minus1 = reader.u(3)
+    reader.skip(1 + 16)
+    _skip_profile_tier_level(reader, max_sub_layers_minus1)
+    ordering_info_present = reader.u(1)
+    for _ in range(0 if ordering_info_present else max_sub_layers_minus1, max_sub_layers_minus1 + 1):
+        reader.ue()
+        reader.ue()
+        reader.ue()
+    max_layer_id = reader.u(6)
+    for _ in range(reader.ue()):  # vps_num_layer_sets_minus1
+        reader.skip(max_layer_id + 1)
+    if reader.u(1):  # vps_timing_info_present_flag
+        num_units_in_tick = reader.u(32)
+        time_scale = reader.u(32)
+        if num_units_in_tick:
+            return time_scale / num_units_in_tick
+    return None
+
+
+def parse_hevc_sps(nal: bytes, vps: bytes = None) -> VideoParameters:
+    """Decode profile, level, size and frame rate from an HEVC SPS (VPS timing as fallback)"""
+    reader = BitReader(nal_to_rbsp(nal[2:]))
+    reader.skip(4)  # sps_video_parameter_set_id
+    max_sub_layers_minus1 = reader.u(3)
+    reader.skip(1)  # sps_temporal_id_nesting_flag
+    profile_idc, level_idc = _skip_profile_tier_level(reader, max_sub_layers_minus1)
+    reader.ue()  # sps_seq_parameter_set_id
+    chroma_format_idc = reader.ue()
+    if chroma_format_idc == 3 and reader.u(1):  # separate_colour_plane_flag
+        chroma_format_idc = 0
+    width = reader.ue()
+    height = reader.ue()
+    if reader.u(1):  # conformance_window_flag
+        width, height = _cropped_size(width, height, chroma_format_idc,
+                                      (reader.ue(), reader.ue(), reader.ue(), reader.ue()))
+
+    profile = HEVC_PROFILES.get(profile_idc, str(profile_idc))
+    level = f"{level_idc / 30:.1f}"
+    params = VideoParameters(codec='hevc', profile=profile, level=level, width=width, height=height)
+
+    try:
+        reader.ue()  # bit_depth_luma_minus8
+        reader.ue()  # bit_depth_chroma_minus8
+        log2_max_poc_lsb = reader.ue() + 4
+        ordering_info_present = reader.u(1)
+        for _ in range(0 if ordering_info_present else max_sub_layers_minus1, max_sub_layers_minus1 + 1):
+            reader.ue()
+            reader.ue()
+            reader.ue()
+        for _ in range(6):  # coding/transform block sizes and hierarchy depths
+            reader.ue()
+        if reader.u(1) and reader.u(1):  # scaling_list_enabled_flag, sps_scaling_list_data_present_flag
+            _skip_hevc_scaling_list_data(reader)
+        reader.skip(2)  # amp_enabled_flag, sample_adaptive_offset_enabled_flag
+        if reader.u(1):  # pcm_enabled_flag
+            reader.skip(8)
+            reader.ue()
+            reader.ue()
+            reader.skip(1)
+        _skip_st_ref_pic_sets(reader, reader.ue())
+        if reader.u(1):  # long_term_ref_pics_present_flag
+            for _ in range(reader.ue()):
+                reader.skip(log2_max_poc_lsb + 1)
+        reader.skip(2)  # sps_temporal_mvp_enabled_flag, strong_intra_smoothing_enabled_flag
+
+        if reader.u(1):  # vui_parameters_present_flag
+            if reader.u(1):  # aspect_ratio_info_present_flag
+                if reader.u(8) == 255:
+                    reader.skip(32)
+            if reader.u(1):  # overscan_info_present_flag
+                reader.skip(1)
+            if reader.u(1):  # video_signal_type_present_flag
+                reader.skip(4)
+                if reader.u(1):
+                    reader.skip(24)
+            if reader.u(1):  # chroma_loc_info_present_flag
+                reader.ue()
+                reader.ue()
+            reader.skip(3)  # neutral_chroma, field_seq, frame_field_info_present
+            if reader.u(1):  # default_display_window_flag
+                for _ in range(4):
+                    reader.ue()
+            if reader.u(1):  # vui_timing_info_present_flag
+                num_units_in_tick = reader.u(32)
+                time_scale = reader.u(32)
+                if num_units_in_tick:
+                    params.fps = time_scale / num_units_in_tick
+    except ValueError:
+        pass  # Size/profile are known; timing is optional
+
+    if params.fps is None and vps:
+        try:
+            params.fps = parse_hevc_vps_fps(vps)
+        except ValueError:
+            pass
+    return params
+
+# ============================================================================
+# AUDIO FRAME HEADERS
+# ============================================================================
+
+ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+ADTS_CHANNELS = (0, 1, 2, 3, 4, 5, 6, 8)
+
+AC3_SAMPLE_RATES = (48000, 44100, 32000)
+AC3_BITRATES = (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384, 448, 512, 576, 640)
+AC3_ACMOD_CHANNELS = (2, 1, 2, 3, 3, 4, 4, 5)  # acmod 0 is dual mono (1+1)
+EAC3_REDUCED_SAMPLE_RATES = (24000, 22050, 16000)
+EAC3_BLOCKS = (1, 2, 3, 6)
+
+MPEG_AUDIO_SAMPLE_RATES = (44100, 48000, 32000)
+MPEG1_LAYER2_BITRATES = (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384)
+MPEG2_LAYER2_BITRATES = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+
+
+def channel_layout(channels: int, lfe: bool = False) -> str:
+    """Layout name in the style ffprobe reports (mono, stereo, 5.1, ...)"""
+    if lfe:
+        return f"{channels - 1}.1"
+    return {1: 'mono', 2: 'stereo'}.get(channels, f"{channels}.0")
+
+
+def parse_adts_header(data: bytes, offset: int = 0) -> Optional[AudioFrame]:
+    """ADTS (AAC) frame header"""
+    if len(data) - offset < 7:
+        return None
+    b = data[offset:offset + 7]
+    if b[0] != 0xFF or b[1] & 0xF6 != 0xF0:  # syncword, layer 0
+        return None
+    sample_rate_index = (b[2] >> 2) & 0x0F
+    channel_config = ((b[2] & 0x01) << 2) | (b[3] >> 6)
+    frame_length = ((b[3] & 0x03) << 11) | (b[4] << 3) | (b[5] >> 5)
+    if sample_rate_index >= len(ADTS_SAMPLE_RATES) or frame_length < 7:
+        return None
+    channels = ADTS_CHANNELS[channel_config]
+    return AudioFrame(
+        codec='aac',
+        sample_rate=ADTS_SAMPLE_RATES[sample_rate_index],
+        channels=channels,
+        layout=channel_layout(channels, lfe=channel_config >= 6),
+        frame_size=frame_length,
+        samples=1024 * ((b[6] & 0x03) + 1)
+    )
+
+
+def parse_mpeg_audio_header(data: bytes, offset: int = 0) -> Optional[AudioFrame]:
+    """MPEG-1/2 Layer II frame header"""
+    if len(data) - offset < 4:
+        return None
+    b = data[offset:offset + 4]
+    version = (b[1] >> 3) & 0x03  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    if b[0] != 0xFF or b[1] & 0xE0 != 0xE0 or version == 1 or (b[1] >> 1) & 0x03 != 2:
+        return None
+    bitrate_index = b[2] >> 4
+    sample_rate_index = (b[2] >> 2) & 0x03
+    if bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrates = MPEG1_LAYER2_BITRATES if version == 3 else MPEG2_LAYER2_BITRATES
+    sample_rate = MPEG_AUDIO_SAMPLE_RATES[sample_rate_index] >> {3: 0, 2: 1, 0: 2}[version]
+    channels = 1 if b[3] >> 6 == 3 else 2
+    return AudioFrame(
+        codec='mp2',
+        sample_rate=sample_rate,
+        channels=channels,
+        layout=channel_layout(channels),
+        frame_size=144 * bitrates[bitrate_index] * 1000 // sample_rate + ((b[2] >> 1) & 0x01),
+        samples=1152
+    )
+
+
+def parse_dolby_header(data: bytes, offset: int = 0) -> Optional[AudioFrame]:
+    """AC-3 or E-AC-3 syncframe header (E-AC-3 when bsid > 10)
+
+    For E-AC-3 the bit stream information is walked up to the additional
+    BSI, whose first byte carries flag_ec3_extension_type_a: joint object
+    coding, i.e. Dolby Atmos.
+    """
+    if len(data) - offset < 8 or data[offset] != 0x0B or data[offset + 1] != 0x77:
+        return None
+    bsid = data[offset + 5] >> 3
+    if bsid <= 10:
+        b = data[offset:offset + 8]
+        fscod = b[4] >> 6
+        frmsizecod = b[4] & 0x3F
+        if fscod == 3 or frmsizecod >= 38:
+            return None
+        bitrate = AC3_BITRATES[frmsizecod >> 1]
+        if fscod == 0:
+            frame_size = bitrate * 4
+        elif fscod == 1:
+            frame_size = 2 * (bitrate * 960 // 441 + (frmsizecod & 1))
+        else:
+            frame_size = bitrate * 6
+        reader = BitReader(b[6:8])
+        acmod = reader.u(3)
+        if acmod & 0x01 and acmod != 1:
+            reader.skip(2)  # cmixlev
+        if acmod & 0x04:
+            reader.skip(2)  # surmixlev
+        if acmod == 2:
+            reader.skip(2)  # dsurmod
+        lfe = bool(reader.u(1))
+        channels = AC3_ACMOD_CHANNELS[acmod] + lfe
+        return AudioFrame(
+            codec='ac3', sample_rate=AC3_SAMPLE_RATES[fscod], channels=channels,
+            layout=channel_layout(channels, lfe), frame_size=frame_size, samples=1536
+        )
+    if bsid > 16:
+        return None
+
+    reader = BitReader(data[offset + 2:offset + 2 + 48])
+    stream_type = reader.u(2)
+    substream_id = reader.u(3)
+    frame_size = (reader.u(11) + 1) * 2
+    fscod = reader.u(2)
+    if fscod == 3:
+        sample_rate = EAC3_REDUCED_SAMPLE_RATES[reader.u(2)]
+        blocks = 6
+    else:
+        sample_rate = AC3_SAMPLE_RATES[fscod]
+        blocks = EAC3_BLOCKS[reader.u(2)]
+    acmod = reader.u(3)
+    lfe = bool(reader.u(1))
+    channels = AC3_ACMOD_CHANNELS[acmod] + lfe
+    frame = AudioFrame(
+        codec='eac3', sample_rate=sample_rate, channels=channels, layout=channel_layout(channels, lfe),
+        frame_size=frame_size, samples=blocks * 256,
+        independent=stream_type != 1 and substream_id == 0
+    )
+
+    try:
+        reader.skip(5)  # bsid
+        programs = 1 if acmod else 2
+        for _ in range(programs):
+            reader.skip(5)  # dialnorm
+            if reader.u(1):
+                reader.skip(8)  # compr
+        if stream_type == 1 and reader.u(1):  # chanmape
+            reader.skip(16)
+        if reader.u(1):  # mixmdate
+            if acmod > 2:
+                reader.skip(2)
+                if acmod & 0x01:
+                    reader.skip(6)
+                if acmod & 0x04:
+                    reader.skip(6)
+            if lfe and reader.u(1):
+                reader.skip(5)
+            if stream_type == 0:
+                for _ in range(programs):
+                    if reader.u(1):
+                        reader.skip(6)
+                if reader.u(1):
+                    reader.skip(6)
+                mixdef = reader.u(2)
+                if mixdef == 1:
+                    reader.skip(5)
+                elif mixdef == 2:
+                    reader.skip(12)
+                elif mixdef == 3:
+                    reader.skip((reader.u(5) + 2) * 8)
+                if acmod < 2:
+                    for _ in range(programs):
+                        if reader.u(1):
+                            reader.skip(14)
+                if reader.u(1):  # frmmixcfginfoe
+                    for _ in range(blocks):
+                        if blocks == 1 or reader.u(1):
+                            reader.skip(5)
+        if reader.u(1):  # infomdate
+            reader.skip(5)
+            if acmod == 2:
+                reader.skip(4)
+            if acmod >= 6:
+                reader.skip(2)
+            for _ in range(programs):
+                if reader.u(1):
+                    reader.skip(8)
+            if fscod != 3:
+                reader.skip(1)
+        if stream_type == 0 and blocks != 6:
+            reader.skip(1)  # convsync
+        if stream_type == 2 and (blocks == 6 or reader.u(1)):
+            reader.skip(6)
+        if reader.u(1):  # addbsie
+            reader.skip(6)  # addbsil
+            frame.atmos = bool(reader.u(8) & 0x01)
+    except ValueError:
+        pass  # Header fields are known; Atmos signalling unreadable
+    return frame
+
+
+AUDIO_HEADER_PARSERS = {
+    'aac': parse_adts_header,
+    'mp2': parse_mpeg_audio_header,
+    'ac3': parse_dolby_header,
+    'eac3': parse_dolby_header,
+}
+
+
+def scan_audio_frames(payload: bytes, codec: str) -> Optional[AudioParameters]:
+    """Walk the complete frames at the start of an audio PES payload"""
+    parser = AUDIO_HEADER_PARSERS.get(codec)
+    if parser is None:
+        return None
+
+    params = None
+    offset = 0
+    while True:
+        frame = parser(payload, offset)
+        if frame is None or frame.frame_size <= 0 or offset + frame.frame_size > len(payload):
+            break
+        if params is None:
+            params = AudioParameters(
+                codec=frame.codec, sample_rate=frame.sample_rate,
+                channels=frame.channels, layout=frame.layout
+            )
+        params.atmos = params.atmos or frame.atmos
+        params.frame_bytes += frame.frame_size
+        if frame.independent:
+            params.frames += 1
+            params.samples += frame.samples
+        offset += frame.frame_size
+    return params
+
+# ============================================================================
+# ELEMENTARY STREAM HEADERS
+# ============================================================================
+
+def ts_payload(packet: bytes) -> bytes:
+    """Payload bytes of a TS packet (after the adaptation field)"""
+    adaptation_field = (packet[3] >> 4) & 0x03
+    if not adaptation_field & 0x01:
+        return b''
+    offset = 4
+    if adaptation_field & 0x02:
+        offset += 1 + packet[4]
+    return packet[offset:188]
+
+
+def pes_payload(packet: bytes) -> Optional[bytes]:
+    """Elementary stream bytes after the PES header of a payload-unit-start TS packet"""
+    pes = ts_payload(packet)
+    if len(pes) < 9 or pes[:3] != b'\x00\x00\x01':
+        return None
+    start = 9 + pes[8]
+    if start >= len(pes):
+        return None
+    return pes[start:]
+
+
+class ESConfigTracker(TSConsumer):
+    """Codec configuration headers per elementary PID
+
+    Looks only at payload-unit-start packets of the audio/video PIDs in
+    the PMT and keeps the latest configuration found there: the parameter
+    sets (H.264 SPS, HEVC VPS/SPS), the sequence header (MPEG-2) or the
+    fixed fields of the first audio frame header. These only change when
+    the encoder is reconfigured, so their hash is a cheap codec signature;
+    H.264/HEVC parameter sets are decoded into VideoParameters on change.
+    Video PES starts are inspected in order until one carries the
+    parameter sets, which encoders repeat only at random access points.
+    Audio frames are parsed on every batch, since their summed sizes give
+    the measured audio bitrate.
+    """
+
+    audio_pes_starts = 4    # payload-unit-start packets inspected per audio PID and batch
+    pes_bytes = 2048        # leading PES bytes reassembled when looking for parameter sets
+    audio_pes_bytes = 4096  # leading PES bytes reassembled when walking audio frames
+
+    def __init__(self, psi: PSIParser):
+        self.psi = psi
+        self.headers = {}  # PID -> raw configuration bytes
+        self.video = {}    # PID -> VideoParameters
+        self.audio = {}    # PID -> AudioParameters
+
+    def on_batch(self, batch: TSBatch):
+        streams = {pid: es for pid, es in self.psi.streams.items() if es.kind in ('video', 'audio')}
+        if not streams or batch.synced_packets == 0:
+            return
+
+        for pid, stream in streams.items():
+            in_pid = batch.pid == pid
+            pid_rows = batch.rows[in_pid]
+            starts = np.flatnonzero(batch.payload_unit_start[in_pid])
+            if stream.kind == 'audio':
+                self._scan_audio(pid, stream.codec, batch, pid_rows, starts[:self.audio_pes_starts])
+                continue
+            for start in starts:
+                payload = self._pes_start(batch, pid_rows, int(start))
+                parameter_sets = self._video_config(payload, stream.codec) if payload else None
+                if parameter_sets:
+                    header = b''.join(parameter_sets.values())
+                    if header != self.headers.get(pid):
+                        self._decode_video(pid, stream.codec, parameter_sets)
+                    self.headers[pid] = header
+                    break
+
+    def _scan_audio(self, pid: int, codec: str, batch: TSBatch, pid_rows: np.ndarray, starts: np.ndarray):
+        """Audio configuration header and frame statistics over the inspected PES starts"""
+        merged = None
+        for start in starts:
+            payload = self._pes_start(batch, pid_rows, int(start), self.audio_pes_bytes)
+            if not payload:
+                continue
+            params = scan_audio_frames(payload, codec)
+            if params is None:
+                header = self._audio_config(payload, codec)
+                if header:
+                    self.headers[pid] = header
+                continue
+            if merged is None:
+                merged = params
+                # Atmos is signalled in the additional BSI, outside the fixed header fields
+                self.headers[pid] = (self._audio_config(payload, codec) or b'') + bytes([params.atmos])
+            else:
+                merged.atmos = merged.atmos or params.atmos
+                merged.frames += params.frames
+                merged.samples += params.samples
+                merged.frame_bytes += params.frame_bytes
+        if merged is not None:
+            self.audio[pid] = merged
+
+    def _pes_start(self, batch: TSBatch, pid_rows: np.ndarray, start: int,
+                   limit: int = None) -> Optional[bytes]:
+        """Reassemble the leading bytes of the PES that starts at pid_rows[start]"""
+        limit = limit or self.pes_bytes
+        payload = pes_payload(batch.packets[pid_rows[start]].tobytes())
+        if payload is None:
+            return None
+        parts = [payload]
+        size = len(payload)
+        for row in pid_rows[start + 1:]:
+            if size >= limit or batch.packets[row, 1] & 0x40:
+                break  # Enough bytes, or the next PES starts
+            part = ts_payload(batch.packets[row].tobytes())
+            parts.append(part)
+            size += len(part)
+        return b''.join(parts)
+
+    def _decode_video(self, pid: int, codec: str, parameter_sets: dict):
+        try:
+            if codec == 'h264' and 'sps' in parameter_sets:
+                self.video[pid] = parse_h264_sps(parameter_sets['sps'])
+            elif codec == 'hevc' and 'sps' in parameter_sets:
+                self.video[pid] = parse_hevc_sps(parameter_sets['sps'], parameter_sets.get('vps'))
+        except (ValueError, IndexError) as e:
+            logger.debug(f"Could not decode {codec} parameter sets on PID {pid}: {e}")
+
+    @staticmethod
+    def _video_config(payload: bytes, codec: str) -> Optional[dict]:
+        """Parameter set NAL units (H.264/HEVC) or sequence header (MPEG-2) in a PES start"""
+        found = {}
+        position = payload.find(b'\x00\x00\x01')
+        while 0 <= position < len(payload) - 4:
+            start = position + 3
+            following = payload.find(b'\x00\x00\x01', start)
+            end = following if following >= 0 else len(payload)
+            header = payload[start]
+            if codec == 'h264' and header & 0x1F == 7:
+                found['sps'] = payload[start:end].rstrip(b'\x00')
+                break
+            if codec == 'hevc':
+                nal_type = (header >> 1) & 0x3F
+                if nal_type == 32:
+                    found['vps'] = payload[start:end].rstrip(b'\x00')
+                elif nal_type == 33:
+                    found['sps'] = payload[start:end].rstrip(b'\x00')
+                    break
+            if codec in ('mpeg2video', 'mpeg1video') and header == 0xB3:
+                found['sequence_header'] = payload[start:start + 9]
+                break
+            position = following
+        return found or None
+
+    @staticmethod
+    def _audio_config(payload: bytes, codec: str) -> Optional[bytes]:
+        """Fixed (per-configuration) fields of the audio frame header at a PES start"""
+        if len(payload) < 7:
+            return None
+        if payload[0] == 0x0B and payload[1] == 0x77:
+            # AC-3: fscod/frmsizecod, bsid/bsmod, acmod - E-AC-3: strmtyp..acmod/lfeon
+            return payload[2:7] if codec == 'eac3' else payload[4:7]
+        if payload[0] == 0xFF and payload[1] & 0xF0 == 0xF0:
+            if codec.startswith('aac'):
+                # ADTS: profile, sampling frequency index, channel configuration
+                return bytes([payload[1], payload[2], payload[3] & 0xF0])
+            # MPEG audio: version/layer, bitrate/sampling rate, channel mode
+            return bytes([payload[1], payload[2] & 0xFC, payload[3] & 0xC0])
+        return None
+
+    def signature(self) -> str:
+        """Hash of the configuration headers of all tracked PIDs"""
+        digest = hashlib.sha1()
+        for pid in sorted(self.headers):
+            digest.update(pid.to_bytes(2, 'big') + self.headers[pid])
+        return digest.hexdigest()
+
+def is_random_access(payload: bytes, codec: str) -> bool:
+    """True when a video PES start carries a decoder entry point
+
+    H.264 IDR or SPS, HEVC IRAP or VPS/SPS, MPEG-2 sequence header.
+    """
+    position = payload.find(b'\x00\x00\x01')
+    while 0 <= position < len(payload) - 3:
+        header = payload[position + 3]
+        if codec == 'h264' and header & 0x1F in (5, 7):
+            return True
+        if codec == 'hevc' and (16 <= (header >> 1) & 0x3F <= 21 or (header >> 1) & 0x3F in (32, 33)):
+            return True
+        if codec in ('mpeg2video', 'mpeg1video') and header == 0xB3:
+            return True
+        position = payload.find(b'\x00\x00\x01', position + 3)
+    return False
+
+
+class KeyframeBuffer(TSConsumer):
+    """Most recent decodable excerpt of an input: PSI + TS from the last random-access point
+
+    A random-access point is a video PES start flagged by the adaptation
+    field's random_access_indicator or carrying an entry point NAL unit /
+    sequence header. Packets of all PIDs are copied from there until the
+    next video PES starts, i.e. exactly the keyframe. That excerpt, behind
+    re-packetized PAT/PMT, decodes to one picture without re-reading the
+    network.
+    """
+
+    max_bytes = 4 * 1024 * 1024  # Give up on a keyframe larger than this
+
+    def __init__(self, psi: PSIParser):
+        self.psi = psi
+        self.keyframe = None      # PAT/PMT + TS packets of the latest complete keyframe
+        self.keyframe_time = 0.0  # time.time() when it completed
+        self._pending = None      # Packet arrays of the keyframe being collected
+        self._pending_bytes = 0
+
+    def reset(self):
+        self._pending = None
+
+    def on_batch(self, batch: TSBatch):
+        video_pids = self.psi.pids_of_kind('video')
+        if not video_pids or batch.synced_packets == 0:
+            return
+        pid = video_pids[0]
+        codec = self.psi.streams[pid].codec
+
+        starts = np.flatnonzero((batch.pid == pid) & batch.payload_unit_start)
+        position = 0
+        if self._pending is not None:
+            position = self._collect(batch, 0, starts)
+        for start in starts[self._random_access(batch, starts, codec)]:
+            if start < position:
+                continue
+            self._pending = []
+            self._pending_bytes = 0
+            position = self._collect(batch, int(start), starts[starts > start])
+
+    def _random_access(self, batch: TSBatch, starts: np.ndarray, codec: str) -> np.ndarray:
+        rows = batch.rows[starts]
+        flagged = ((batch.adaptation_field[starts] & 0x02) != 0) & (batch.packets[rows, 4] > 0) & \
+                  ((batch.packets[rows, 5] & 0x40) != 0)
+        for index in np.flatnonzero(~flagged):
+            payload = pes_payload(batch.packets[rows[index]].tobytes())
+            flagged[index] = bool(payload) and is_random_access(payload, codec)
+        return flagged
+
+    def _collect(self, batch: TSBatch, begin: int, following_starts: np.ndarray) -> int:
+        """Copy packets from position `begin` up to the next video PES start; returns the end position"""
+        end = int(following_starts[0]) if len(following_starts) else batch.synced_packets
+        self._pending.append(batch.packets[batch.rows[begin:end]])
+        self._pending_bytes += (end - begin) * 188
+        if self._pending_bytes > self.max_bytes:
+            self._pending = None
+        elif len(following_starts):
+            self.keyframe = self.psi.table_packets() + b''.join(part.tobytes() for part in self._pending)
+            self.keyframe_time = time.time()
+            self._pending = None
+        return end
+
+# ============================================================================
+# TR 101 290 ANALYZER
+# ============================================================================
+
+# Counter fields of TR101290Metrics that accumulate across feeds
+TR101290_COUNTERS = (
+    'ts_sync_loss', 'sync_byte_error', 'pat_error', 'continuity_count_error',
+    'pmt_error', 'pid_error', 'transport_error', 'crc_error', 'pcr_error',
+    'pcr_accuracy_error', 'pts_error', 'cat_error', 'nit_error',
+    'si_repetition_error', 'unreferenced_pid', 'total_packets',
+)
+
+
+class TR101290Analyzer(TSConsumer):
+    """Incremental TR 101 290 analyzer for a single input
+
+    Keeps per-PID continuity counters, the last PCR value, PAT/PMT
+    arrival timers and the PSI table cache between batches, so each batch
+    is parsed once and CC errors and PCR gaps are still caught at window
+    boundaries.
+    `metrics` holds the errors found in the latest batch; `cumulative`
+    holds the running totals since the analyzer was created.
+    """
+
+    psi_timeout = 0.5  # seconds - TR 101 290 PAT/PMT repetition limit
+
+    def __init__(self, input_source: InputSource, engine: str = 'numpy'):
+        self.input_id = input_source.input_id
+        self.input_name = input_source.input_name
+        self.engine = engine
+
+        self.last_cc = np.full(8192, -1, dtype=np.int16)  # -1 = PID not seen yet
+        self.last_pcr_ms = None
+        self.last_pat_time = None
+        self.psi = PSIParser()
+
+        self.metrics = TR101290Metrics(input_id=self.input_id, input_name=self.input_name)
+        self.cumulative = TR101290Metrics(input_id=self.input_id, input_name=self.input_name)
+
+    def reset(self):
+        """Forget CC, PCR and section-assembly state (capture gap or new socket)"""
+        self.last_cc.fill(-1)
+        self.last_pcr_ms = None
+        self.psi.reset_assembly()
+
+    def on_batch(self, batch: TSBatch):
+        """Analyze a batch and record the errors found in it"""
+        metrics = TR101290Metrics(
+            input_id=self.input_id,
+            input_name=self.input_name,
+            timestamp=datetime.utcnow()
+        )
+
+        if self.engine == 'python':
+            self._scan_python(batch.data, batch.usable, metrics)
+        else:
+            self._scan_numpy(batch, metrics)
+
+        # P1: PAT/PMT errors - not seen within the repetition limit
+        now = time.monotonic()
+        if metrics.pat_received:
+            self.last_pat_time = now
+        if self.last_pat_time is None or now - self.last_pat_time > self.psi_timeout:
+            metrics.pat_error += 1
+        if not self.psi.pmt_pids:
+            metrics.pmt_error += 1  # No PAT yet, so no PMT can be located
+        for pmt_pid in set(self.psi.pmt_pids.values()):
+            last_seen = self.psi.last_pmt_times.get(pmt_pid)
+            if last_seen is None or now - last_seen > self.psi_timeout:
+                metrics.pmt_error += 1
+
+        for name in TR101290_COUNTERS:
+            setattr(self.cumulative, name, getattr(self.cumulative, name) + getattr(metrics, name))
+        self.cumulative.pat_received = self.cumulative.pat_received or metrics.pat_received
+        self.cumulative.pmt_received = self.cumulative.pmt_received or metrics.pmt_received
+        self.cumulative.pcr_interval_ms = metrics.pcr_interval_ms or self.cumulative.pcr_interval_ms
+        self.cumulative.timestamp = metrics.timestamp
+
+        self.metrics = metrics
+
+    def _process_psi(self, ts_data: bytes, offsets_for_pid, present_pids, metrics: TR101290Metrics):
+        """Reassemble PSI sections and check PIDs against the PMTs
+
+        offsets_for_pid(pid) returns the byte offsets of that PID's packets
+        in ts_data. PIDs are independent, so the PAT is processed first and
+        PMTs it announces are picked up from the same data.
+        """
+        present = set(present_pids)
+        if 0x0000 in present:
+            for offset in offsets_for_pid(0x0000):
+                self.psi.push_packet(ts_data[offset:offset + 188], metrics)
+        for psi_pid in self.psi.psi_pids[1:]:
+            if psi_pid in present:
+                for offset in offsets_for_pid(psi_pid):
+                    self.psi.push_packet(ts_data[offset:offset + 188], metrics)
+
+        # P3: PIDs present in the stream but not referenced by PAT/CAT/PMT
+        if self.psi.pmt_complete:
+            metrics.unreferenced_pid = sum(1 for pid in present if not self.psi.referenced[pid])
+
+    def _scan_python(self, ts_data: bytes, usable: int, metrics: TR101290Metrics):
+        """Per-packet reference engine"""
+        cc_tracker = self.last_cc.tolist()
+        pcr_timestamps = [] if self.last_pcr_ms is None else [self.last_pcr_ms]
+        pid_offsets = {}  # PID -> offsets of its packets, for PSI processing
+
+        # Parse all TS packets
+        for offset in range(0, usable, 188):
+            packet = ts_data[offset:offset+188]
+            metrics.total_packets += 1
+
+            # P1: Check sync byte (0x47)
+            if packet[0] != 0x47:
+                metrics.sync_byte_error += 1
+                metrics.ts_sync_loss += 1
+                continue
+
+            # Parse TS header
+            transport_error = (packet[1] & 0x80) >> 7
+            pid = ((packet[1] & 0x1F) << 8) | packet[2]
+            adaptation_field = (packet[3] & 0x30) >> 4
+            cc = packet[3] & 0x0F
+            pid_offsets.setdefault(pid, []).append(offset)
+
+            # P2: Transport error indicator
+            if transport_error:
+                metrics.transport_error += 1
+
+            # P1: Check continuity counter
+            if cc_tracker[pid] >= 0:
+                expected_cc = (cc_tracker[pid] + 1) % 16
+                if cc != expected_cc and adaptation_field in (1, 3):  # Has payload
+                    metrics.continuity_count_error += 1
+            cc_tracker[pid] = cc
+
+            # Check for PCR
+            if adaptation_field in (2, 3):
+                adaptation_length = packet[4]
+                if adaptation_length > 0 and len(packet) > 5 + adaptation_length:
+                    pcr_flag = (packet[5] & 0x10) >> 4
+                    if pcr_flag and adaptation_length >= 7:
+                        # Extract PCR (33 bits + 6 bits reserved + 9 bits extension)
+                        pcr_base = (packet[6] << 25) | (packet[7] << 17) | (packet[8] << 9) | (packet[9] << 1) | ((packet[10] & 0x80) >> 7)
+                        pcr_ms = pcr_base / 90.0  # Convert to milliseconds
+                        pcr_timestamps.append(pcr_ms)
+
+        self.last_cc[:] = cc_tracker
+        self._process_psi(ts_data, pid_offsets.get, pid_offsets.keys(), metrics)
+
+        # Calculate PCR interval
+        if pcr_timestamps:
+            self.last_pcr_ms = pcr_timestamps[-1]
+        if len(pcr_timestamps) >= 2:
+            intervals = [pcr_timestamps[i+1] - pcr_timestamps[i] for i in range(len(pcr_timestamps)-1)]
+            metrics.pcr_interval_ms = sum(intervals) / len(intervals)
+
+            # P2: PCR accuracy error (should be < 40ms between PCRs)
+            for interval in intervals:
+                if interval > 40:
+                    metrics.pcr_accuracy_error += 1
+
+    def _scan_numpy(self, batch: TSBatch, metrics: TR101290Metrics):
+        """Vectorized engine
+
+        Works on the header columns of the batch with whole-array
+        operations. Produces the same counters as _scan_python.
+        """
+        metrics.total_packets = batch.packet_count
+        if batch.packet_count == 0:
+            return
+
+        # P1: Check sync byte (0x47) - packets without it are not parsed further
+        sync_errors = batch.packet_count - batch.synced_packets
+        metrics.sync_byte_error = sync_errors
+        metrics.ts_sync_loss = sync_errors
+        if batch.synced_packets == 0:
+            return
+
+        pid = batch.pid
+
+        # P2: Transport error indicator
+        metrics.transport_error = int(np.count_nonzero(batch.transport_error))
+
+        # P1: Continuity counter - compare each packet with the previous one on
+        # the same PID, or with the tracker for the first packet of each PID
+        order = np.argsort(pid, kind='stable')
+        pid_sorted = pid[order]
+        cc_sorted = batch.cc[order]
+        first = np.ones(len(pid_sorted), dtype=bool)
+        first[1:] = pid_sorted[1:] != pid_sorted[:-1]
+        last = np.ones(len(pid_sorted), dtype=bool)
+        last[:-1] = first[1:]
+
+        previous_cc = np.empty_like(cc_sorted)
+        previous_cc[1:] = cc_sorted[:-1]
+        previous_cc[first] = self.last_cc[pid_sorted[first]]
+        has_payload = (batch.adaptation_field[order] & 0x01) != 0
+        metrics.continuity_count_error = int(np.count_nonzero(
+            (previous_cc >= 0) & has_payload & (cc_sorted != ((previous_cc + 1) & 0x0F))
+        ))
+        self.last_cc[pid_sorted[last]] = cc_sorted[last]
+
+        # PSI tables: only the few packets on PAT/CAT/NIT/PMT PIDs go through Python
+        self._process_psi(
+            batch.data, batch.offsets, np.flatnonzero(batch.pid_counts).tolist(), metrics
+        )
+
+        # Check for PCR
+        _, pcr_timestamps = batch.pcr()
+        if len(pcr_timestamps) == 0:
+            return
+        if self.last_pcr_ms is not None:
+            pcr_timestamps = np.concatenate(([self.last_pcr_ms], pcr_timestamps))
+        self.last_pcr_ms = float(pcr_timestamps[-1])
+
+        # Calculate PCR interval
+        if len(pcr_timestamps) >= 2:
+            intervals = np.diff(pcr_timestamps)
+            metrics.pcr_interval_ms = float(intervals.mean())
+
+            # P2: PCR accuracy error (should be < 40ms between PCRs)
+            metrics.pcr_accuracy_error = int(np.count_nonzero(intervals > 40))
+
+# ============================================================================
+# RTP
+# ============================================================================
+
+def _rtp_header_lengths(buf: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """RTP header length per datagram: fixed header + CSRCs + extension"""
+    b0 = buf[offsets].astype(np.int64)
+    header_len = 12 + 4 * (b0 & 0x0F)
+    extension = np.flatnonzero(b0 & 0x10)
+    if len(extension) > 0:
+        ext_at = np.minimum(offsets[extension] + header_len[extension] + 2, len(buf) - 2)
+        ext_words = (buf[ext_at].astype(np.int64) << 8) | buf[ext_at + 1]
+        header_len[extension] += 4 + 4 * ext_words
+    return header_len
+
+
+def detect_rtp(ts_data, sizes: np.ndarray, sample: int = 16) -> bool:
+    """True if the first datagrams carry RTP v2 headers in front of TS packets"""
+    sizes = sizes[:sample].astype(np.int64)
+    if len(sizes) == 0 or np.any(sizes < 13):
+        return False
+    buf = np.frombuffer(ts_data, dtype=np.uint8, count=int(sizes.sum()))
+    offsets = np.cumsum(sizes) - sizes
+    if not np.all((buf[offsets] >> 6) == 2):
+        return False
+    header_len = _rtp_header_lengths(buf, offsets)
+    if np.any(header_len >= sizes):
+        return False
+    return bool(np.all(buf[offsets + header_len] == 0x47))
+
+
+class RTPTracker:
+    """RTP sequence and jitter state for one input
+
+    Strips RTP headers from a capture and analyzes the whole batch of
+    headers at once: loss, duplicates and reordering on the 16-bit
+    sequence number (with wraparound), and RFC 3550 interarrival jitter
+    on the 90 kHz MP2T timestamp. State carries across contiguous
+    captures.
+    """
+
+    clock_rate = 90000
+
+    def __init__(self):
+        self.highest_seq = None        # Highest extended sequence number received
+        self.last_seq = None           # Extended sequence number of the last packet received
+        self.last_arrival = None       # Arrival time (s) of the last packet
+        self.last_rtp_timestamp = None
+        self.jitter = 0.0              # RFC 3550 J, in RTP timestamp units
+
+    def reset(self):
+        """Forget sequence/timing continuity (capture gap or new socket)"""
+        self.highest_seq = None
+        self.last_seq = None
+        self.last_arrival = None
+        self.last_rtp_timestamp = None
+
+    def process(self, ts_data, timestamps: np.ndarray, sizes: np.ndarray, contiguous: bool = True) -> tuple:
+        """Return (TS payload without RTP headers, RTPStats) for one capture"""
+        if not contiguous:
+            self.reset()
+
+        sizes = sizes.astype(np.int64)
+        buf = np.frombuffer(ts_data, dtype=np.uint8, count=int(sizes.sum()))
+        offsets = np.cumsum(sizes) - sizes
+        header_len = np.minimum(_rtp_header_lengths(buf, offsets), sizes)
+
+        # Strip headers: reshape when every datagram has the same layout, mask otherwise
+        if np.all(sizes == sizes[0]) and np.all(header_len == header_len[0]):
+            payload = buf.reshape(len(sizes), int(sizes[0]))[:, int(header_len[0]):].ravel()
+        else:
+            boundaries = (np.bincount(offsets, minlength=len(buf) + 1) -
+                          np.bincount(offsets + header_len, minlength=len(buf) + 1))
+            payload = buf[np.cumsum(boundaries[:-1]) == 0]
+
+        stats = RTPStats(
+            rtp_packets=len(sizes),
+            header_bytes=int(header_len.sum())
+        )
+
+        # Extend 16-bit sequence numbers across wraparound
+        seq = (buf[offsets + 2].astype(np.int64) << 8) | buf[offsets + 3]
+        previous = np.empty_like(seq)
+        previous[1:] = seq[:-1]
+        previous[0] = seq[0] if self.last_seq is None else self.last_seq & 0xFFFF
+        steps = ((seq - previous + 0x8000) & 0xFFFF) - 0x8000
+        ext_seq = (seq[0] if self.last_seq is None else self.last_seq) + np.cumsum(steps)
+
+        # Duplicates, and late packets (below a sequence number already received)
+        unique_seq, first_index = np.unique(ext_seq, return_index=True)
+        is_first = np.zeros(len(ext_seq), dtype=bool)
+        is_first[first_index] = True
+        stats.packets_duplicated = len(ext_seq) - len(unique_seq)
+
+        prior = self.highest_seq if self.highest_seq is not None else int(ext_seq[0]) - 1
+        running_max = np.maximum.accumulate(np.maximum(ext_seq, prior))
+        highest_before = np.empty_like(ext_seq)
+        highest_before[0] = prior
+        highest_before[1:] = running_max[:-1]
+        late = is_first & (ext_seq < highest_before)
+        stats.packets_out_of_order = int(np.count_nonzero(late))
+
+        # Loss: sequence numbers skipped just before each packet, less gaps filled by late packets
+        stats.loss_per_packet = np.maximum(ext_seq - highest_before - 1, 0) - (late & (ext_seq > prior))
+        stats.packets_lost = max(0, int(stats.loss_per_packet.sum()))
+        highest = int(running_max[-1])
+
+        # RFC 3550 interarrival jitter: J += (|D| - J) / 16, closed form over the batch
+        rtp_ts = ((buf[offsets + 4].astype(np.int64) << 24) | (buf[offsets + 5].astype(np.int64) << 16) |
+                  (buf[offsets + 6].astype(np.int64) << 8) | buf[offsets + 7])
+        arrival = timestamps * self.clock_rate
+        if self.last_arrival is not None:
+            arrival = np.concatenate(([self.last_arrival * self.clock_rate], arrival))
+            rtp_ts = np.concatenate(([self.last_rtp_timestamp], rtp_ts))
+        transit_delta = np.abs(
+            np.diff(arrival) - (((np.diff(rtp_ts) + 0x80000000) & 0xFFFFFFFF) - 0x80000000)
+        )
+        if len(transit_delta) > 0:
+            decay = 15 / 16
+            weights = decay ** np.arange(len(transit_delta) - 1, -1, -1)
+            self.jitter = self.jitter * decay ** len(transit_delta) + float(weights @ transit_delta) / 16
+        stats.jitter_ms = self.jitter / self.clock_rate * 1000
+
+        self.highest_seq = highest
+        self.last_seq = int(ext_seq[-1])
+        self.last_arrival = float(timestamps[-1])
+        self.last_rtp_timestamp = int(rtp_ts[-1])
+
+        return memoryview(payload), stats
+
+# ============================================================================
+# MEDIA DELIVERY INDEX (RFC 4445)
+# ============================================================================
+
+def mdi_intervals(timestamps: np.ndarray, sizes: np.ndarray, loss_per_packet: np.ndarray = None,
+                  ts_per_datagram: int = 7, interval_sec: float = 1.0) -> List['MDIInterval']:
+    """Per-interval Delay Factor and Media Loss Rate from a virtual buffer
+
+    The virtual buffer fills with each datagram on arrival and drains at
+    the media rate measured over the window. DF for an interval is the
+    buffer's excursion (max after arrival - min before arrival) divided
+    by the drain rate; MLR is the number of TS packets lost in it.
+    """
+    if len(timestamps) < 2:
+        return []
+
+    elapsed = timestamps - timestamps[0]
+    span = float(elapsed[-1])
+    sizes = sizes.astype(np.float64)
+    drain_rate = float(sizes[:-1].sum()) / span if span > 0 else 0.0  # bytes/sec
+    if drain_rate <= 0:
+        return []
+
+    # Buffer level just before and just after each arrival
+    vb_before = np.cumsum(sizes) - sizes - drain_rate * elapsed
+    vb_after = vb_before + sizes
+
+    buckets = np.floor(elapsed / interval_sec).astype(np.int64)
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    excursion = np.maximum.reduceat(vb_after, starts) - np.minimum.reduceat(vb_before, starts)
+    packets = np.diff(np.append(starts, len(timestamps)))
+    received_bytes = np.add.reduceat(sizes, starts)
+    if loss_per_packet is not None:
+        lost = np.maximum(np.add.reduceat(loss_per_packet, starts), 0) * ts_per_datagram
+    else:
+        lost = np.zeros(len(starts), dtype=np.int64)
+
+    return [
+        MDIInterval(
+            offset_sec=float(buckets[start] * interval_sec),
+            df=float(excursion[i] / drain_rate * 1000),
+            mlr=float(lost[i] / interval_sec),
+            vb_bytes=int(excursion[i]),
+            packets=int(packets[i]),
+            bytes=int(received_bytes[i]),
+            media_rate_mbps=drain_rate * 8 / 1_000_000
+        )
+        for i, start in enumerate(starts)
+    ]
+
+# ============================================================================
+# UDP CAPTURE RING
+# ============================================================================
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_IOVec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+# recvmmsg(2) is Linux-only; elsewhere the ring falls back to recv_into
+try:
+    _recvmmsg = ctypes.CDLL(None, use_errno=True).recvmmsg
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+except (AttributeError, OSError):
+    _recvmmsg = None
+
+_MSG_DONTWAIT = 0x40
+_MSG_TRUNC = getattr(socket, 'MSG_TRUNC', 0x20)
+
+# Receive slot per datagram: a full Ethernet frame's payload, so 7 TS packets
+# behind an RTP header (1328+ bytes) fit. Anything larger is truncated by the
+# kernel, flagged MSG_TRUNC, and discarded rather than analyzed.
+DATAGRAM_SLOT_SIZE = 1500
+
+# Kernel receive timestamps (Linux SO_TIMESTAMPNS / SCM_TIMESTAMPNS, struct timespec)
+_SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35 if sys.platform.startswith('linux') else None)
+_CMSG_HEADER = struct.Struct('@Nii')  # cmsg_len, cmsg_level, cmsg_type
+_CMSG_ALIGN = ctypes.sizeof(ctypes.c_size_t)
+_CMSG_DATA_OFFSET = (_CMSG_HEADER.size + _CMSG_ALIGN - 1) & ~(_CMSG_ALIGN - 1)
+_TIMESPEC = struct.Struct('@ll')
+_CONTROL_SIZE = 64  # Room for one CMSG_SPACE(sizeof(struct timespec))
+
+
+class _CaptureBank:
+    """Preallocated storage for one capture window"""
+
+    def __init__(self, capacity: int, max_datagrams: int):
+        self.data = bytearray(capacity)
+        self.view = memoryview(self.data)
+        self.address = ctypes.addressof(ctypes.c_char.from_buffer(self.data))
+        self.timestamps = np.empty(max_datagrams, dtype=np.float64)  # Arrival time per datagram
+        self.sizes = np.empty(max_datagrams, dtype=np.int32)  # Payload bytes per datagram
+        self.write_pos = 0
+        self.count = 0
+
+
+class CaptureRing:
+    """Per-input receive buffer: two preallocated banks used in rotation
+
+    Datagrams are received straight into the active bank (recvmmsg in
+    batches where available, recv_into otherwise) and their arrival times
+    and sizes go into NumPy arrays. swap() hands the filled bank to the
+    analyzers as memoryview/array slices - no copies - and receiving
+    continues into the other bank. The caller must finish with a swapped
+    bank before swapping again.
+
+    Arrival times come from the kernel (SO_TIMESTAMPNS, wall clock) when
+    attach() enabled it, otherwise from time.monotonic_ns() right after
+    the read; clock_source records which.
+
+    Datagrams larger than a slot come back truncated; they are counted in
+    `truncated` and left out of the window.
+    """
+
+    def __init__(self, capacity: int, datagram_size: int = DATAGRAM_SLOT_SIZE, batch_size: int = 64):
+        self.capacity = capacity
+        self.datagram_size = datagram_size
+        self.batch_size = batch_size
+        self.max_datagrams = capacity // datagram_size
+        self._banks = [None, None]
+        self._active = 0
+        self.dropped = 0  # Datagrams discarded because the active bank was full
+        self.truncated = 0  # Datagrams discarded because they did not fit a slot
+        self.window_start = time.time()
+        self.clock_source = 'monotonic'
+
+        if _recvmmsg is not None:
+            self._iovecs = (_IOVec * batch_size)()
+            self._msgs = (_MMsgHdr * batch_size)()
+            self._control = ctypes.create_string_buffer(_CONTROL_SIZE * batch_size)
+            control_address = ctypes.addressof(self._control)
+            for i in range(batch_size):
+                self._iovecs[i].iov_len = datagram_size
+                self._msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+                self._msgs[i].msg_hdr.msg_iovlen = 1
+                self._msgs[i].msg_hdr.msg_control = control_address + i * _CONTROL_SIZE
+        self._scratch = bytearray(65535)  # Any UDP datagram, for draining a full bank
+
+    def attach(self, sock: socket.socket, kernel_timestamps: bool = False):
+        """Prepare for a new socket, enabling kernel timestamps if asked and supported"""
+        self.clock_source = 'monotonic'
+        if kernel_timestamps and _SO_TIMESTAMPNS is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, _SO_TIMESTAMPNS, 1)
+                self.clock_source = 'kernel'
+            except OSError as e:
+                logger.warning(f"SO_TIMESTAMPNS unavailable, using monotonic clock: {e}")
+
+    def _bank(self, index: int) -> _CaptureBank:
+        if self._banks[index] is None:
+            self._banks[index] = _CaptureBank(self.capacity, self.max_datagrams)
+        return self._banks[index]
+
+    def reset(self):
+        """Empty the active bank and start a new window"""
+        bank = self._bank(self._active)
+        bank.write_pos = 0
+        bank.count = 0
+        self.dropped = 0
+        self.truncated = 0
+        self.window_start = time.time()
+
+    def swap(self) -> tuple:
+        """Finish the window: return (ts_data, timestamps, sizes, dropped, truncated) of the filled bank"""
+        bank = self._bank(self._active)
+        window = (
+            bank.view[:bank.write_pos],
+            bank.timestamps[:bank.count],
+            bank.sizes[:bank.count],
+            self.dropped,
+            self.truncated,
+        )
+        self._active ^= 1
+        self.reset()
+        return window
+
+    @property
+    def packets_received(self) -> int:
+        return self._bank(self._active).count
+
+    def receive(self, sock: socket.socket) -> int:
+        """Read every datagram queued on a non-blocking socket; returns how many were stored"""
+        bank = self._bank(self._active)
+        stored_before = bank.count
+
+        while True:
+            slots = min(
+                (self.capacity - bank.write_pos) // self.datagram_size,
+                self.max_datagrams - bank.count,
+                self.batch_size if _recvmmsg is not None else 1,
+            )
+            if slots <= 0:
+                self._discard(sock)
+                break
+
+            if _recvmmsg is not None:
+                count = self._receive_batch(sock, bank, slots)
+            else:
+                count = self._receive_one(sock, bank)
+            if count < slots:
+                break  # Socket queue drained
+
+        return bank.count - stored_before
+
+    def _receive_one(self, sock: socket.socket, bank: _CaptureBank) -> int:
+        """Read one datagram; returns 1 when one was read (stored or not), 0 when none was queued"""
+        target = bank.view[bank.write_pos:bank.write_pos + self.datagram_size]
+        try:
+            if hasattr(sock, 'recvmsg_into'):
+                control_size = _CONTROL_SIZE if self.clock_source == 'kernel' else 0
+                length, ancdata, flags, _ = sock.recvmsg_into([target], control_size)
+            else:
+                length = sock.recv_into(target)
+                ancdata, flags = [], 0  # No way to tell truncation here
+        except (BlockingIOError, socket.timeout):
+            return 0
+
+        if flags & _MSG_TRUNC:
+            self.truncated += 1
+            return 1
+
+        if self.clock_source == 'kernel':
+            arrival_ns = next(
+                (self._timespec_ns(data) for level, kind, data in ancdata
+                 if level == socket.SOL_SOCKET and kind == _SO_TIMESTAMPNS),
+                None
+            ) or time.time_ns()
+        else:
+            arrival_ns = time.monotonic_ns()
+        bank.timestamps[bank.count] = arrival_ns / 1e9
+        bank.sizes[bank.count] = length
+        bank.write_pos += length
+        bank.count += 1
+        return 1
+
+    def _receive_batch(self, sock: socket.socket, bank: _CaptureBank, slots: int) -> int:
+        """Read up to `slots` datagrams; returns how many were read, truncated ones included"""
+        kernel_timestamps = self.clock_source == 'kernel'
+        for i in range(slots):
+            self._iovecs[i].iov_base = bank.address + bank.write_pos + i * self.datagram_size
+            self._msgs[i].msg_hdr.msg_controllen = _CONTROL_SIZE if kernel_timestamps else 0
+        count = _recvmmsg(sock.fileno(), self._msgs, slots, _MSG_DONTWAIT, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return 0
+            raise OSError(err, os.strerror(err))
+
+        if kernel_timestamps:
+            fallback_ns = time.time_ns()
+            arrivals = [(self._control_timestamp_ns(i) or fallback_ns) / 1e9 for i in range(count)]
+        else:
+            # Datagrams of one batch share the time the batch was read
+            arrivals = [time.monotonic_ns() / 1e9] * count
+
+        # Datagrams landed in fixed-size slots; close the gaps left by short and truncated ones
+        cursor = bank.write_pos
+        stored = bank.count
+        for i in range(count):
+            if self._msgs[i].msg_hdr.msg_flags & _MSG_TRUNC:
+                self.truncated += 1
+                continue
+            length = self._msgs[i].msg_len
+            slot = bank.write_pos + i * self.datagram_size
+            if slot != cursor:
+                ctypes.memmove(bank.address + cursor, bank.address + slot, length)
+            bank.sizes[stored] = length
+            bank.timestamps[stored] = arrivals[i]
+            stored += 1
+            cursor += length
+        bank.write_pos = cursor
+        bank.count = stored
+        return count
+
+    def _control_timestamp_ns(self, index: int) -> Optional[int]:
+        """SCM_TIMESTAMPNS from the control buffer of one recvmmsg message"""
+        controllen = self._msgs[index].msg_hdr.msg_controllen
+        base = index * _CONTROL_SIZE
+        offset = 0
+        while offset + _CMSG_HEADER.size <= controllen:
+            cmsg_len, level, kind = _CMSG_HEADER.unpack_from(self._control, base + offset)
+            if cmsg_len < _CMSG_HEADER.size:
+                break
+            if level == socket.SOL_SOCKET and kind == _SO_TIMESTAMPNS:
+                if cmsg_len < _CMSG_DATA_OFFSET + _TIMESPEC.size:
+                    break
+                return self._timespec_ns(self._control, base + offset + _CMSG_DATA_OFFSET)
+            offset += (cmsg_len + _CMSG_ALIGN - 1) & ~(_CMSG_ALIGN - 1)
+        return None
+
+    @staticmethod
+    def _timespec_ns(data, offset: int = 0) -> Optional[int]:
+        if len(data) < offset + _TIMESPEC.size:
+            return None
+        seconds, nanoseconds = _TIMESPEC.unpack_from(data, offset)
+        return seconds * 1_000_000_000 + nanoseconds
+
+    def _discard(self, sock: socket.socket):
+        """Bank full: drain the socket so the kernel buffer does not back up"""
+        while True:
+            try:
+                sock.recv_into(self._scratch)
+            except (BlockingIOError, socket.timeout):
+                return
+            self.dropped += 1
+
+# ============================================================================
+# MULTICAST LISTENERS
+# ============================================================================
+
+def parse_udp_url(input_url: str) -> tuple:
+    """Split udp://group:port into (group, port)"""
+    url_parts = input_url.replace('udp://', '').split(':')
+    if len(url_parts) != 2:
+        raise ValueError(f"Invalid UDP URL format: {input_url}")
+    return url_parts[0], int(url_parts[1])
+
+
+class MulticastListener:
+    """Long-lived socket on one multicast group, joined once per process
+
+    Datagrams accumulate in the input's capture ring until the next
+    drain(); the socket stays joined in between, so nothing is missed
+    between windows and the switches see a single IGMP join instead of
+    one per cycle. Receiving and draining both run on the loop thread.
+    """
+
+    def __init__(self, input_source: InputSource, multicast_group: str, port: int, config: MonitorConfig):
+        self.input_source = input_source
+        self.multicast_group = multicast_group
+        self.port = port
+        self.config = config
+        self.sock = None
+        self.busy = False  # Last drained capture is still being analyzed
+        self.contiguous = False  # Next capture continues the previous one
+        self.ring = CaptureRing(config.capture_buffer_mb * 1024 * 1024)
+
+    def open(self):
+        """Create the socket and join the multicast group"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.config.listener_socket_buffer)
+
+            # Bind to the group address so listeners sharing a port only get their own group
+            sock.bind((self.multicast_group, self.port))
+
+            mreq = struct.pack("4sl", socket.inet_aton(self.multicast_group), socket.INADDR_ANY)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            sock.setblocking(False)
+        except Exception:
+            sock.close()
+            raise
+
+        self.sock = sock
+        self.ring.attach(sock, self.config.udp_kernel_timestamps)
+        self.ring.reset()
+        self.contiguous = False
+
+    def close(self):
+        """Leave the group and close the socket"""
+        if self.sock:
+            try:
+                self.sock.close()
+            except:
+                pass
+            self.sock = None
+
+    def on_readable(self):
+        """Read every datagram currently queued on the socket"""
+        try:
+            self.ring.receive(self.sock)
+        except OSError as e:
+            logger.error(f"Error receiving on listener {self.input_source.input_name}: {e}")
+
+    def drain(self) -> UDPCapture:
+        """Hand over everything received since the last drain"""
+        duration = time.time() - self.ring.window_start
+        ts_data, timestamps, sizes, dropped, truncated = self.ring.swap()
+        errors = []
+        if dropped:
+            errors.append(f"Capture buffer full: {dropped} datagrams dropped")
+        if truncated:
+            errors.append(f"{truncated} datagrams larger than {self.ring.datagram_size} bytes discarded")
+
+        capture = UDPCapture(
+            ts_data=ts_data,
+            packet_timestamps=timestamps,
+            packet_sizes=sizes,
+            packets_received=len(sizes),
+            bytes_received=len(ts_data),
+            duration_sec=duration,
+            contiguous=self.contiguous,
+            errors=errors,
+            clock_source=self.ring.clock_source
+        )
+        # Dropped datagrams leave a hole before the next window
+        self.contiguous = not dropped
+        return capture
+
+
+class MulticastListenerManager:
+    """Event loop (epoll via selectors) owning every multicast listener
+
+    sync() adds and removes listeners to match the enabled UDP inputs.
+    Every report_interval seconds each listener's capture is drained and
+    handed to report_callback(listener, capture), which is expected to
+    analyze it off the loop thread and clear listener.busy when done.
+    """
+
+    def __init__(self, config: MonitorConfig, report_callback):
+        self.config = config
+        self.report_callback = report_callback
+        self.selector = selectors.DefaultSelector()
+        self.listeners = {}  # input_id -> MulticastListener
+        self._pending = []  # (action, listener) applied on the loop thread
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+        # Self-pipe so sync()/stop() can interrupt a blocking select()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="multicast-listeners", daemon=True)
+        self._thread.start()
+        logger.info(f"Multicast listener loop started (report interval {self.config.listener_report_interval}s)")
+
+    def stop(self):
+        self._running = False
+        self._wakeup()
+        if self._thread:
+            self._thread.join(timeout=5)
+        with self._lock:
+            for listener in self.listeners.values():
+                listener.close()
+            self.listeners.clear()
+            self._pending.clear()
+
+    def sync(self, inputs: List[InputSource]):
+        """Open listeners for new inputs, close those no longer enabled"""
+        wanted = {input_source.input_id: input_source for input_source in inputs}
+
+        with self._lock:
+            for input_id, listener in list(self.listeners.items()):
+                input_source = wanted.get(input_id)
+                if input_source is None or input_source.input_url != listener.input_source.input_url:
+                    del self.listeners[input_id]
+                    self._pending.append(('remove', listener))
+                    logger.info(f"Removing multicast listener for {listener.input_source.input_name}")
+                else:
+                    listener.input_source = input_source
+
+            for input_id, input_source in wanted.items():
+                if input_id in self.listeners:
+                    continue
+                try:
+                    multicast_group, port = parse_udp_url(input_source.input_url)
+                except Exception as e:
+                    logger.error(f"Error parsing UDP URL for {input_source.input_name}: {e}")
+                    continue
+                listener = MulticastListener(input_source, multicast_group, port, self.config)
+                self.listeners[input_id] = listener
+                self._pending.append(('add', listener))
+                logger.info(f"Adding multicast listener for {input_source.input_name} at {multicast_group}:{port}")
+
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_send.send(b'\0')
+        except OSError:
+            pass
+
+    def _apply_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        for action, listener in pending:
+            if action == 'add':
+                try:
+                    listener.open()
+                    self.selector.register(listener.sock, selectors.EVENT_READ, listener)
+                except Exception as e:
+                    logger.error(f"Failed to open listener for {listener.input_source.input_name}: {e}")
+                    with self._lock:
+                        if self.listeners.get(listener.input_source.input_id) is listener:
+                            del self.listeners[listener.input_source.input_id]
+            elif listener.sock:
+                self.selector.unregister(listener.sock)
+                listener.close()
+
+    def _run(self):
+        next_report = time.monotonic() + self.config.listener_report_interval
+
+        while self._running:
+            try:
+                self._apply_pending()
+
+                timeout = max(0.0, next_report - time.monotonic())
+                for key, _ in self.selector.select(timeout):
+                    if key.data is None:
+                        try:
+                            self._wakeup_recv.recv(4096)
+                        except BlockingIOError:
+                            pass
+                    else:
+                        key.data.on_readable()
+
+                if time.monotonic() >= next_report:
+                    next_report += self.config.listener_report_interval
+                    self._report()
+            except Exception as e:
+                logger.error(f"Error in multicast listener loop: {e}", exc_info=True)
+                time.sleep(1)
+
+    def _report(self):
+        with self._lock:
+            listeners = list(self.listeners.values())
+
+        for listener in listeners:
+            if listener.sock is None or listener.busy:
+                continue  # Not open yet, or previous window still being analyzed
+            listener.busy = True
+            self.report_callback(listener, listener.drain())
+
+# ============================================================================
+# MEDIA TOOLS
+# ============================================================================
+
+def run_piped(commands: Dict[str, tuple], data, binary: tuple = ()) -> Dict[str, tuple]:
+    """Run external tools concurrently, each reading `data` on stdin
+
+    commands maps a name to (argv, timeout_sec). Returns name ->
+    (returncode, stdout, stderr) with decoded output (stdout stays bytes
+    for the names in `binary`); a tool that cannot start or exceeds its
+    timeout is killed and reported with returncode None. Tools that stop
+    reading early (ffprobe) are not an error.
+    """
+    results = {}
+
+    def communicate(name: str, process: subprocess.Popen, timeout: float):
+        try:
+            stdout, stderr = process.communicate(input=data, timeout=timeout)
+            returncode = process.returncode
+        except subprocess.TimeoutExpired:
+            logger.warning(f"{name} timed out after {timeout}s")
+            process.kill()
+            stdout, stderr = process.communicate()
+            returncode = None
+        results[name] = (
+            returncode,
+            stdout if name in binary else stdout.decode('utf-8', errors='replace'),
+            stderr.decode('utf-8', errors='replace')
+        )
+
+    threads = []
+    for name, (argv, timeout) in commands.items():
+        try:
+            process = subprocess.Popen(
+                argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except OSError as e:
+            logger.error(f"Failed to start {name}: {e}")
+            results[name] = (None, b'' if name in binary else '', str(e))
+            continue
+        thread = threading.Thread(target=communicate, args=(name, process, timeout), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+
+    return results
+
+# ============================================================================
+# LOUDNESS (ITU-R BS.1770-4 / EBU R128)
+# ============================================================================
+
+# BS.1770 channel weights in FFmpeg's default channel order. 5.1 is
+# FL FR FC LFE BL BR and 7.1 adds SL SR. The LFE channel is excluded and
+# surround channels get +1.5 dB.
+LOUDNESS_CHANNEL_WEIGHTS = {
+    6: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41),
+    8: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41, 1.41, 1.41),
+}
+
+
+def k_weighting_filter(sample_rate: int) -> tuple:
+    """K-weighting (high shelf + RLB high-pass) as one 4th-order (b, a) pair for any sample rate"""
+    # Stage 1: head-related high shelf
+    k = np.tan(np.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = np.array([vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k]) / a0
+    shelf_a = np.array([a0, 2 * (k * k - 1), 1 - k / q + k * k]) / a0
+
+    # Stage 2: revised low-frequency B-weighting (high-pass)
+    k = np.tan(np.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass_b = np.array([1.0, -2.0, 1.0])
+    highpass_a = np.array([a0, 2 * (k * k - 1), 1 - k / q + k * k]) / a0
+
+    return np.convolve(shelf_b, highpass_b), np.convolve(shelf_a, highpass_a)
+
+
+class LoudnessMeter:
+    """Stateful BS.1770-4 loudness meter with EBU R128 gating
+
+    PCM is filtered in 100 ms hops. The IIR K-weighting filter is written in
+    block state-space form: each hop's output is the FFT convolution of its
+    input with the impulse response plus the response to the state carried
+    in from the previous hop. That is exact and needs no per-sample Python
+    loop. Mean squares per hop give momentary (400 ms) and short-term (3 s)
+    loudness. Gating blocks (400 ms, 75 % overlap) and short-term values are
+    kept in 0.1 LU histograms, so integrated loudness and loudness range
+    build up over the whole programme in constant memory.
+    """
+
+    hop_sec = 0.1
+    histogram_floor = -70.0  # Absolute gate (LUFS)
+    histogram_ceiling = 10.0
+    histogram_step = 0.1
+
+    def __init__(self, sample_rate: int = 48000, channels: int = 2):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.weights = np.array(LOUDNESS_CHANNEL_WEIGHTS.get(channels, (1.0,) * channels))
+
+        hop = self.hop = int(round(sample_rate * self.hop_sec))
+        b, a = k_weighting_filter(sample_rate)
+        b, a = b / a[0], a / a[0]
+        order = len(a) - 1
+        # Controllable canonical form: s[n+1] = A s[n] + B x[n], y[n] = C s[n] + D x[n]
+        A = np.zeros((order, order))
+        A[0] = -a[1:]
+        A[1:, :-1] = np.eye(order - 1)
+        B = np.zeros(order)
+        B[0] = 1.0
+        C = b[1:] - b[0] * a[1:]
+
+        powers = np.empty((hop + 1, order, order))  # A^0 .. A^hop
+        powers[0] = np.eye(order)
+        for n in range(hop):
+            powers[n + 1] = powers[n] @ A
+        self._state_gain = powers[hop]                            # A^hop
+        self._input_to_state = (powers[hop - 1::-1] @ B).T        # (order, hop): A^(hop-1-k) B
+        self._state_to_output = np.einsum('j,njk->nk', C, powers[:hop])  # (hop, order): C A^n
+        impulse = np.empty(hop)
+        impulse[0] = b[0]
+        impulse[1:] = self._state_to_output[:hop - 1] @ B
+        self._fft_size = 1 << (2 * hop - 1).bit_length()
+        self._impulse_fft = np.fft.rfft(impulse, self._fft_size)
+
+        bins = int(round((self.histogram_ceiling - self.histogram_floor) / self.histogram_step))
+        self._bin_loudness = self.histogram_floor + (np.arange(bins) + 0.5) * self.histogram_step
+        self.reset()
+
+    def reset(self):
+        """Forget the programme (integrated loudness and LRA start over)"""
+        bins = len(self._bin_loudness)
+        self._block_counts = np.zeros(bins, dtype=np.int64)
+        self._block_energy = np.zeros(bins)
+        self._short_term_counts = np.zeros(bins, dtype=np.int64)
+        self._short_term_energy = np.zeros(bins)
+        self.momentary = None
+        self.short_term = None
+        self._restart()
+
+    def _restart(self):
+        """Drop filter state and partial hops (audio discontinuity)"""
+        self._state = np.zeros((self.channels, self._state_gain.shape[0]))
+        self._pending = np.zeros((0, self.channels), dtype=np.float64)
+        self._hops = np.zeros(0)  # Weighted mean square of the most recent hops (up to 3 s)
+
+    def feed(self, pcm: np.ndarray, contiguous: bool = True):
+        """Measure interleaved float PCM shaped (frames, channels)"""
+        if not contiguous:
+            self._restart()
+        pcm = np.concatenate((self._pending, np.asarray(pcm, dtype=np.float64).reshape(-1, self.channels)))
+        count = len(pcm) // self.hop
+        self._pending = pcm[count * self.hop:]
+        if count == 0:
+            return
+
+        # (channels, hops, hop) -> K-weighted output of each hop
+        x = pcm[:count * self.hop].T.reshape(self.channels, count, self.hop)
+        zero_state = np.fft.irfft(np.fft.rfft(x, self._fft_size) * self._impulse_fft, self._fft_size)[..., :self.hop]
+        state_input = x @ self._input_to_state.T
+        states = np.empty((self.channels, count, self._state.shape[1]))
+        state = self._state
+        for j in range(count):
+            states[:, j] = state
+            state = state @ self._state_gain.T + state_input[:, j]
+        self._state = state
+        y = zero_state + states @ self._state_to_output.T
+
+        hop_energy = self.weights @ np.mean(y * y, axis=-1)  # (hops,)
+        short_term_hops = int(round(3.0 / self.hop_sec))
+        history = np.concatenate((self._hops, hop_energy))
+        self._hops = history[-short_term_hops:]
+
+        window = np.concatenate(([0.0], np.cumsum(history)))
+        first_new = len(history) - count
+        ends = np.arange(first_new + 1, len(history) + 1)
+        blocks = ends[ends >= 4]
+        block_energy = (window[blocks] - window[blocks - 4]) / 4
+        self._accumulate(block_energy, self._block_counts, self._block_energy)
+        ends_3s = ends[ends >= short_term_hops]
+        short_term_energy = (window[ends_3s] - window[ends_3s - short_term_hops]) / short_term_hops
+        self._accumulate(short_term_energy, self._short_term_counts, self._short_term_energy)
+
+        if len(block_energy):
+            self.momentary = float(self._lufs(block_energy[-1]))
+        if len(short_term_energy):
+            self.short_term = float(self._lufs(short_term_energy[-1]))
+
+    @staticmethod
+    def _lufs(energy) -> float:
+        return -0.691 + 10 * np.log10(np.maximum(energy, 1e-20))
+
+    def _accumulate(self, energy: np.ndarray, counts: np.ndarray, sums: np.ndarray):
+        loudness = self._lufs(energy)
+        gated = loudness > self.histogram_floor
+        index = ((np.minimum(loudness[gated], self.histogram_ceiling - 1e-9) - self.histogram_floor)
+                 / self.histogram_step).astype(np.int64)
+        counts += np.bincount(index, minlength=len(counts))
+        sums += np.bincount(index, weights=energy[gated], minlength=len(sums))
+
+    def _relative_gate(self, counts: np.ndarray, sums: np.ndarray, offset: float) -> np.ndarray:
+        """Bins above the relative gate (mean of the absolute-gated energy + offset LU)"""
+        total = counts.sum()
+        if total == 0:
+            return None
+        return self._bin_loudness > self._lufs(sums.sum() / total) + offset
+
+    @property
+    def integrated(self) -> Optional[float]:
+        """Integrated loudness (LUFS) over everything fed since reset()"""
+        above = self._relative_gate(self._block_counts, self._block_energy, -10.0)
+        if above is None or not self._block_counts[above].any():
+            return None
+        return float(self._lufs(self._block_energy[above].sum() / self._block_counts[above].sum()))
+
+    @property
+    def lra(self) -> Optional[float]:
+        """Loudness range (LU, EBU Tech 3342): 10th to 95th percentile of gated short-term loudness"""
+        above = self._relative_gate(self._short_term_counts, self._short_term_energy, -20.0)
+        if above is None:
+            return None
+        counts = np.where(above, self._short_term_counts, 0)
+        total = counts.sum()
+        if total == 0:
+            return None
+        cumulative = np.cumsum(counts)
+        last = len(cumulative) - 1
+        low = self._bin_loudness[min(np.searchsorted(cumulative, 0.10 * total, side='right'), last)]
+        high = self._bin_loudness[min(np.searchsorted(cumulative, 0.95 * total), last)]
+        return float(high - low)
+
+    def values(self) -> dict:
+        """momentary, short_term, integrated (LUFS) and lra (LU); None until measured"""
+        return {
+            'momentary': self.momentary,
+            'short_term': self.short_term,
+            'integrated': self.integrated,
+            'lra': self.lra,
+        }
+
+# ============================================================================
+# BLACK / FREEZE DETECTION
+# ============================================================================
+
+LUMA_WIDTH = 64
+LUMA_HEIGHT = 36
+LUMA_FPS = 5
+# ffmpeg filter producing the detector's input as raw 8-bit luma (-f rawvideo)
+LUMA_FILTER = f'fps={LUMA_FPS},scale={LUMA_WIDTH}:{LUMA_HEIGHT}:flags=area,format=gray'
+
+
+class BlackFreezeDetector:
+    """Black and frozen picture runs from periodic downscaled luma frames
+
+    Frames are 8-bit luma planes scaled down (by ffmpeg) to LUMA_WIDTH x
+    LUMA_HEIGHT. They come from a DecodeWorker, whose fps filter emits
+    exactly LUMA_FPS frames per second of stream time (repeating the last
+    picture over gaps), so frames fed without timestamps are evenly
+    spaced. Probe windows are not analyzed: they are too short to hold a
+    decodable run of pictures. A frame is black when nearly all pixels are near
+    limited-range black (as in ffmpeg blackdetect). It is frozen when its
+    mean absolute difference to the previous frame is below the noise
+    floor. Black frames are not also counted as frozen. Runs are timed in
+    milliseconds across feeds and compared with the input's template
+    thresholds. Frames seen while a run is at or over its threshold are
+    counted until take() collects them.
+    """
+
+    black_luma = 38              # 16 + 10 % of the 16-235 range
+    black_pixel_ratio = 0.98
+    freeze_max_difference = 0.5  # Mean absolute luma difference per pixel
+
+    def __init__(self, black_threshold_ms: int = 500, freeze_threshold_ms: int = 1000):
+        self.black_threshold_ms = black_threshold_ms
+        self.freeze_threshold_ms = freeze_threshold_ms
+        self.black_frames = 0    # Frames in over-threshold runs since take()
+        self.freeze_frames = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the previous frame and open runs (video discontinuity)"""
+        self._previous = None
+        self._frames_fed = 0      # Clock for frames fed without timestamps
+        self._black_since = None  # Timestamp (s) of the first frame of the open run
+        self._freeze_since = None
+        self.black_run_ms = 0.0   # Length of the open run (0 when none)
+        self.freeze_run_ms = 0.0
+
+    def feed(self, frames: np.ndarray, timestamps: np.ndarray = None):
+        """Analyze luma frames shaped (n, height, width)
+
+        timestamps are in seconds; without them the frames are taken to be
+        LUMA_FPS apart, continuing the previous feed.
+        """
+        if len(frames) == 0:
+            return
+        if timestamps is None:
+            timestamps = (self._frames_fed + np.arange(len(frames))) / LUMA_FPS
+        self._frames_fed += len(frames)
+        frames = frames.astype(np.int16)
+        black = (frames <= self.black_luma).mean(axis=(1, 2)) >= self.black_pixel_ratio
+
+        previous = frames[:1] if self._previous is None else self._previous[None]
+        difference = np.abs(np.diff(np.concatenate((previous, frames)), axis=0)).mean(axis=(1, 2))
+        frozen = (difference < self.freeze_max_difference) & ~black
+        if self._previous is None:
+            frozen[0] = False  # Nothing to compare the first frame with
+        self._previous = frames[-1]
+
+        for index, timestamp in enumerate(timestamps):
+            self._black_since, self.black_run_ms = self._run(black[index], timestamp, self._black_since)
+            self.black_frames += int(self.black_run_ms >= self.black_threshold_ms)
+            self._freeze_since, self.freeze_run_ms = self._run(frozen[index], timestamp, self._freeze_since)
+            self.freeze_frames += int(self.freeze_run_ms >= self.freeze_threshold_ms)
+
+    @staticmethod
+    def _run(active: bool, timestamp: float, since: Optional[float]) -> tuple:
+        """Advance a run by one frame: (start timestamp or None, run length in ms)"""
+        if not active:
+            return None, 0.0
+        if since is None:
+            since = timestamp
+        return since, (timestamp - since) * 1000
+
+    def take(self) -> tuple:
+        """(black_frames, freeze_frames) counted since the previous call"""
+        counts = (self.black_frames, self.freeze_frames)
+        self.black_frames = self.freeze_frames = 0
+        return counts
+
+# ============================================================================
+# DECODE WORKERS
+# ============================================================================
+
+_STREAM_LINE = re.compile(r'Stream #\d+:\d+\S*: (Video|Audio): (.*)')
+_FRAME_CHANGED = 'frame changed from'
+
+
+class DecodeWorker:
+    """Supervised long-running ffmpeg decoder for one input
+
+    TS windows from the multicast listener are queued to ffmpeg's stdin by
+    a writer thread; when the decoder falls behind the oldest window is
+    dropped, so analysis never blocks on it. ffmpeg decodes the first audio
+    stream to float PCM on an extra pipe, measured by a LoudnessMeter, and
+    emits a JPEG every `frame_interval` seconds plus LUMA_FPS downscaled
+    luma frames per second (for the BlackFreezeDetector) from the first
+    video stream; reader threads consume the PCM, luma, stderr (stream
+    info) and stdout (frames) incrementally.
+
+    supervise() (called on every feed) restarts a dead process with
+    exponential backoff and measures its CPU use; a worker over its CPU
+    budget is restarted audio-only, as video decoding is the expensive part.
+    Once the audio-only decoder has stayed under half the budget for
+    `video_resume_delay` seconds, video decoding is tried again; the wait
+    doubles each time the budget is exceeded, so an input that is simply
+    too expensive does not flap.
+
+    Each process gets its own reader threads; they are joined before the
+    next process starts, so the meter and detector never have two writers.
+    """
+
+    queue_size = 8              # TS windows buffered for the decoder
+    max_restart_delay = 60.0    # seconds
+    video_resume_delay = 300.0  # seconds under half the CPU budget before video decoding is retried
+    max_video_resume_delay = 3600.0
+    reader_join_timeout = 5.0   # seconds to wait for the previous process's readers to drain
+
+    def __init__(self, input_source: InputSource, frame_interval: int, cpu_budget_percent: int):
+        self.input_id = input_source.input_id
+        self.input_name = input_source.input_name
+        self.frame_interval = frame_interval
+        self.cpu_budget_percent = cpu_budget_percent
+
+        self.process = None
+        self.queue = None
+        self.has_audio = False
+        self.has_video = False
+        self.audio_channels = 2
+        self.audio_only = False   # Degraded after exceeding the CPU budget
+        self.budget_exceeded = 0  # Times video decoding was dropped for CPU
+        self._under_budget_since = None
+
+        self.started_at = 0.0
+        self.restart_delay = 1.0
+        self.next_start = 0.0
+        self.restarts = 0
+        self.dropped_windows = 0
+        self.cpu_percent = 0.0
+        self._cpu_sample = None   # (monotonic time, CPU seconds)
+        self._readers = []        # PCM/luma reader threads of the current process
+
+        # Parsed output
+        self.meter = None         # LoudnessMeter, kept across restarts of the same audio layout
+        self.detector = BlackFreezeDetector(input_source.black_threshold_ms, input_source.freeze_threshold_ms)
+        self.streams = []         # Stream description lines of the current run
+        self.stream_info_changes = 0
+        self.latest_frame = None  # JPEG bytes
+        self.frame_time = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def loudness(self) -> dict:
+        """momentary, short_term, integrated (LUFS) and lra (LU) of the audio decoded so far"""
+        return self.meter.values() if self.meter is not None else {}
+
+    def _argv(self, pipes: Dict[str, tuple]) -> List[str]:
+        argv = [
+            'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'info',
+            '-threads', '1', '-filter_threads', '1',
+            '-f', 'mpegts', '-i', 'pipe:0'
+        ]
+        if 'pcm' in pipes:
+            argv += [
+                '-map', '0:a:0', '-ac', str(self.audio_channels), '-ar', '48000',
+                '-f', 'f32le', f"pipe:{pipes['pcm'][1]}"
+            ]
+        if 'luma' in pipes:
+            argv += [
+                '-map', '0:v:0',
+                '-vf', f'fps=1/{self.frame_interval},scale=-2:360',
+                '-c:v', 'mjpeg', '-q:v', '5',
+                '-f', 'image2pipe', 'pipe:1',
+                '-map', '0:v:0', '-vf', LUMA_FILTER, '-f', 'rawvideo', f"pipe:{pipes['luma'][1]}"
+            ]
+        return argv
+
+    def start(self):
+        decode_video = self.has_video and not self.audio_only
+        if not self.has_audio and not decode_video:
+            return
+        self._join_readers()
+        # Extra output pipes (read end, write end): float PCM and downscaled luma
+        pipes = {}
+        if self.has_audio:
+            pipes['pcm'] = os.pipe()
+        if decode_video:
+            pipes['luma'] = os.pipe()
+        try:
+            # nice(1) rather than preexec_fn: forking a threaded process into Python code can deadlock
+            self.process = subprocess.Popen(
+                ['nice', '-n', '10'] + self._argv(pipes),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                pass_fds=[write for _, write in pipes.values()]
+            )
+        except OSError as e:
+            logger.error(f"Failed to start decode worker for {self.input_name}: {e}")
+            self.process = None
+            for read, _ in pipes.values():
+                os.close(read)
+            return
+        finally:
+            for _, write in pipes.values():
+                os.close(write)  # The child holds the write ends
+
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.started_at = time.monotonic()
+        self._cpu_sample = None
+        self._under_budget_since = None
+        previous_streams, self.streams = self.streams, []
+        threads = [(self._write_stdin, (self.process, self.queue)),
+                   (self._read_stderr, (self.process, previous_streams)),
+                   (self._read_frames, (self.process,))]
+        readers = []
+        if 'pcm' in pipes:
+            if self.meter is None:
+                self.meter = LoudnessMeter(48000, self.audio_channels)
+            readers.append((self._read_pcm, (pipes['pcm'][0], self.meter)))
+        if 'luma' in pipes:
+            self.detector.reset()
+            readers.append((self._read_luma, (pipes['luma'][0], self.detector)))
+        for target, args in threads:
+            threading.Thread(target=target, args=args, daemon=True).start()
+        self._readers = [threading.Thread(target=target, args=args, daemon=True) for target, args in readers]
+        for reader in self._readers:
+            reader.start()
+        logger.info(f"Started decode worker for {self.input_name} "
+                    f"(audio={self.has_audio}, video={decode_video})")
+
+    def _join_readers(self):
+        """Wait for the previous process's PCM/luma readers to drain its pipes
+
+        The process has exited, so they reach end of file. If one is still
+        running after the timeout, the meter and detector are replaced
+        rather than shared with it.
+        """
+        readers, self._readers = self._readers, []
+        for reader in readers:
+            reader.join(self.reader_join_timeout)
+        if any(reader.is_alive() for reader in readers):
+            logger.warning(f"Decode worker readers for {self.input_name} did not finish, "
+                           f"starting with a new loudness meter and black/freeze detector")
+            self.meter = None
+            self.detector = BlackFreezeDetector(self.detector.black_threshold_ms, self.detector.freeze_threshold_ms)
+
+    def stop(self):
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def feed(self, ts_data, has_audio: bool, has_video: bool, audio_channels: int = 2):
+        """Queue one TS window for the decoder, (re)starting it when needed"""
+        if (has_audio, has_video, audio_channels) != (self.has_audio, self.has_video, self.audio_channels):
+            # Elementary streams changed: the output mapping has to follow
+            if audio_channels != self.audio_channels or not has_audio:
+                self.meter = None  # A different programme as far as loudness is concerned
+            self.has_audio, self.has_video, self.audio_channels = has_audio, has_video, audio_channels
+            self.stop()
+            self.next_start = 0.0
+
+        self.supervise()
+        if not self.running:
+            return
+
+        window = bytes(ts_data)  # The capture bank is reused after this window
+        try:
+            self.queue.put_nowait(window)
+        except queue.Full:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped_windows += 1
+            self.queue.put_nowait(window)
+
+    def supervise(self):
+        """Restart after a crash (with backoff) and enforce the CPU budget"""
+        now = time.monotonic()
+        if self.process is not None and self.process.poll() is not None:
+            logger.warning(f"Decode worker for {self.input_name} exited with code {self.process.returncode}")
+            self.process = None
+            if now - self.started_at > self.max_restart_delay:
+                self.restart_delay = 1.0
+            self.next_start = now + self.restart_delay
+            self.restart_delay = min(self.restart_delay * 2, self.max_restart_delay)
+            self.restarts += 1
+
+        if self.process is None:
+            if now >= self.next_start:
+                self.start()
+            return
+
+        cpu_seconds = self._cpu_seconds()
+        if cpu_seconds is None:
+            return
+        if self._cpu_sample is not None and now > self._cpu_sample[0]:
+            self.cpu_percent = (cpu_seconds - self._cpu_sample[1]) / (now - self._cpu_sample[0]) * 100
+            if self.cpu_percent > self.cpu_budget_percent and self.has_video and not self.audio_only:
+                self.budget_exceeded += 1
+                logger.warning(f"Decode worker for {self.input_name} uses {self.cpu_percent:.0f}% CPU "
+                               f"(budget {self.cpu_budget_percent}%), dropping video decoding for at least "
+                               f"{self._resume_delay():.0f}s")
+                self.audio_only = True
+                self.stop()
+                self.start()
+                return
+            if self.audio_only and self.has_video:
+                if self.cpu_percent >= self.cpu_budget_percent / 2:
+                    self._under_budget_since = None
+                elif self._under_budget_since is None:
+                    self._under_budget_since = now
+                elif now - self._under_budget_since >= self._resume_delay():
+                    logger.info(f"Decode worker for {self.input_name} under half its CPU budget for "
+                                f"{now - self._under_budget_since:.0f}s, resuming video decoding")
+                    self.audio_only = False
+                    self.stop()
+                    self.start()
+                    return
+        self._cpu_sample = (now, cpu_seconds)
+
+    def _resume_delay(self) -> float:
+        """Seconds under half the budget before video decoding is retried, doubled per budget overrun"""
+        return min(self.video_resume_delay * 2 ** max(self.budget_exceeded - 1, 0), self.max_video_resume_delay)
+
+    def _cpu_seconds(self) -> Optional[float]:
+        """User + system CPU time of the ffmpeg process (Linux /proc)"""
+        try:
+            with open(f'/proc/{self.process.pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_stdin(process: subprocess.Popen, windows: queue.Queue):
+        while True:
+            window = windows.get()
+            if window is None:
+                break
+            try:
+                process.stdin.write(window)
+                process.stdin.flush()
+            except (BrokenPipeError, OSError, ValueError):
+                break
+        try:
+            process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+    @staticmethod
+    def _read_pcm(fd: int, meter: LoudnessMeter):
+        """Feed the decoded float PCM to the loudness meter, whole frames at a time"""
+        frame_bytes = 4 * meter.channels
+        contiguous = False  # A (re)started decoder does not continue the previous audio
+        pending = b''
+        with os.fdopen(fd, 'rb') as pcm:
+            while True:
+                chunk = pcm.read1(65536)
+                if not chunk:
+                    break
+                pending += chunk
+                usable = len(pending) - len(pending) % frame_bytes
+                if usable:
+                    meter.feed(np.frombuffer(pending[:usable], dtype='<f4').reshape(-1, meter.channels),
+                               contiguous)
+                    contiguous = True
+                    pending = pending[usable:]
+
+    @staticmethod
+    def _read_luma(fd: int, detector: BlackFreezeDetector):
+        """Feed the downscaled luma frames to the black/freeze detector"""
+        frame_bytes = LUMA_WIDTH * LUMA_HEIGHT
+        pending = b''
+        with os.fdopen(fd, 'rb') as luma:
+            while True:
+                chunk = luma.read1(65536)
+                if not chunk:
+                    break
+                pending += chunk
+                count = len(pending) // frame_bytes
+                if count:
+                    frames = np.frombuffer(pending[:count * frame_bytes], dtype=np.uint8)
+                    detector.feed(frames.reshape(count, LUMA_HEIGHT, LUMA_WIDTH))
+                    pending = pending[count * frame_bytes:]
+
+    def _read_stderr(self, process: subprocess.Popen, previous_streams: List[str]):
+        for raw in process.stderr:
+            line = raw.decode('utf-8', errors='replace')
+
+            match = _STREAM_LINE.search(line)
+            if match:
+                self.streams.append(f"{match.group(1)}: {match.group(2).strip()}")
+                if previous_streams and len(self.streams) == len(previous_streams) and \
+                        self.streams != previous_streams:
+                    self._on_stream_info_change()
+            elif _FRAME_CHANGED in line:
+                self._on_stream_info_change(line.strip())
+
+    def _on_stream_info_change(self, detail: str = None):
+        self.stream_info_changes += 1
+        logger.info(f"Stream info changed for {self.input_name}: {detail or '; '.join(self.streams)}")
+
+    def _read_frames(self, process: subprocess.Popen):
+        """Split the image2pipe MJPEG stream into JPEG frames (SOI ... EOI)"""
+        buffer = bytearray()
+        while True:
+            chunk = process.stdout.read1(65536)
+            if not chunk:
+                break
+            buffer += chunk
+            while True:
+                start = buffer.find(b'\xff\xd8')
+                if start < 0:
+                    buffer.clear()
+                    break
+                end = buffer.find(b'\xff\xd9', start + 2)
+                if end < 0:
+                    del buffer[:start]
+                    break
+                self.latest_frame = bytes(buffer[start:end + 2])
+                self.frame_time = time.time()
+                del buffer[:end + 2]
+
+# ============================================================================
+# HTTP CLIENT
+# ============================================================================
+
+_http_timing = threading.local()  # Connection setup time of the calling thread's current request
+
+
+class _TimedHTTPConnection(urllib3.connection.HTTPConnection):
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _http_timing.connect_ms = getattr(_http_timing, 'connect_ms', 0.0) + (time.perf_counter() - started) * 1000
+
+
+class _TimedHTTPSConnection(urllib3.connection.HTTPSConnection):
+    def connect(self):  # TCP connect and TLS handshake
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _http_timing.connect_ms = getattr(_http_timing, 'connect_ms', 0.0) + (time.perf_counter() - started) * 1000
+
+
+class _TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter whose pools time new connections (DNS + TCP + TLS)"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+class HTTPClient:
+    """Shared keep-alive HTTP client for playlist and segment fetches
+
+    One requests.Session serves all monitoring threads. It keeps a
+    pool of at most `pool_size` connections per host, so a cycle reuses
+    the connections of the previous one instead of opening a TCP (and TLS)
+    connection per request. Connection errors, timeouts and 429/5xx
+    responses are retried up to `retries` times, with full-jitter
+    exponential backoff starting at `backoff` seconds. Every response
+    carries the timing of its final attempt:
+    `connect_ms` for connection setup (0.0 on a reused connection),
+    `transfer_ms` from then until the body was read, and `attempts`.
+    """
+
+    RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+
+    def __init__(self, pool_size: int = 10, retries: int = 2, backoff: float = 0.5, timeout: float = 10.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        # pool_block caps connections per host: extra threads wait rather than open more
+        adapter = _TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url: str, timeout: float = None, headers: dict = None) -> requests.Response:
+        """GET with retries; raises the last error when every attempt failed"""
+        attempt = 0
+        while True:
+            attempt += 1
+            _http_timing.connect_ms = 0.0
+            started = time.perf_counter()
+            try:
+                resp = self.session.get(url, timeout=timeout or self.timeout, headers=headers)
+                if resp.status_code not in self.RETRY_STATUS or attempt > self.retries:
+                    resp.connect_ms = _http_timing.connect_ms
+                    resp.transfer_ms = (time.perf_counter() - started) * 1000 - resp.connect_ms
+                    resp.attempts = attempt
+                    return resp
+                reason = f"HTTP {resp.status_code}"
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt > self.retries:
+                    raise
+                reason = str(e)
+
+            delay = random.uniform(0, self.backoff * 2 ** (attempt - 1))
+            logger.debug(f"Retrying {url} in {delay:.2f}s (attempt {attempt}: {reason})")
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+class CrawlSession:
+    """Concurrency limits for one asyncio crawl over HTTPClient
+
+    Requests run on `executor` threads, because the pooled, retrying,
+    timed HTTPClient is blocking. At most `max_concurrency` requests are in
+    flight in total and `per_host` per host. The semaphores belong to the
+    event loop that creates the session, so each crawl creates its own.
+    """
+
+    def __init__(self, http: HTTPClient, executor: ThreadPoolExecutor, max_concurrency: int, per_host: int):
+        self.http = http
+        self.executor = executor
+        self.per_host = per_host
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._hosts = {}  # netloc -> Semaphore
+
+    async def get(self, url: str, headers: dict = None) -> requests.Response:
+        host = urlsplit(url).netloc
+        limit = self._hosts.get(host)
+        if limit is None:
+            limit = self._hosts[host] = asyncio.Semaphore(self.per_host)
+        async with self._global, limit:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.http.get, url, None, headers)
+
+    async def run(self, func, *args):
+        """Run CPU work (hashing a segment) off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+# ============================================================================
+# LINE PROTOCOL
+# ============================================================================
+
+_LP_ESCAPE_MEASUREMENT = str.maketrans({',': r'\,', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+_LP_ESCAPE_KEY = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+_LP_ESCAPE_STRING = str.maketrans({'"': r'\"', '\\': r'\\'})
+_LP_EPOCH = datetime(1970, 1, 1)
+
+
+def lp_tag(key: str, value) -> str:
+    """',key=value' with line-protocol escaping, or '' for an empty value (as Point drops it)"""
+    if value is None:
+        return ''
+    value = str(value).translate(_LP_ESCAPE_KEY)
+    if not value:
+        return ''
+    if value.endswith('\\'):
+        value += ' '
+    return f",{key.translate(_LP_ESCAPE_KEY)}={value}"
+
+
+def lp_value(value) -> Optional[str]:
+    """A field value in line protocol, None when Point would skip it"""
+    kind = type(value)
+    if kind is bool:
+        return 'true' if value else 'false'
+    if kind is int or isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return f"{value}i"
+    if kind is float or isinstance(value, (float, np.floating)):
+        if not math.isfinite(value):
+            return None
+        text = str(value)
+        return text[:-2] if text.endswith('.0') else text
+    if kind is str:
+        return f'"{value.translate(_LP_ESCAPE_STRING)}"'
+    if value is None:
+        return None
+    raise ValueError(f"Unsupported field type {kind.__name__}")
+
+
+def lp_timestamp(timestamp: datetime) -> str:
+    """' <epoch ns>' for a datetime (naive = UTC), '' without one"""
+    if timestamp is None:
+        return ''
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = timestamp - _LP_EPOCH
+    return f" {(delta.days * 86400 + delta.seconds) * 1000000000 + delta.microseconds * 1000}"
+
+
+def _lp_fields(*names, **computed) -> tuple:
+    """Field spec: ('key=', getter) pairs sorted by key, the order Point writes them in"""
+    getters = {name: attrgetter(name) for name in names}
+    getters.update(computed)
+    return tuple((f"{name.translate(_LP_ESCAPE_KEY)}=", getters[name]) for name in sorted(getters))
+
+
+def _lp_merge(first: tuple, second: tuple) -> tuple:
+    """Field spec over a (first, second) pair of metrics, still sorted by key"""
+    merged = [(key, lambda pair, get=getter: get(pair[0])) for key, getter in first]
+    merged += [(key, lambda pair, get=getter: get(pair[1])) for key, getter in second]
+    return tuple(sorted(merged, key=lambda field: field[0]))
+
+
+def _p1_total(m) -> int:
+    return m.ts_sync_loss + m.sync_byte_error + m.pat_error + m.continuity_count_error + m.pmt_error + m.pid_error
+
+
+def _p2_total(m) -> int:
+    return m.transport_error + m.crc_error + m.pcr_error + m.pcr_accuracy_error + m.pts_error + m.cat_error
+
+
+def _p3_total(m) -> int:
+    return m.nit_error + m.si_repetition_error + m.unreferenced_pid
+
+
+class LineProtocolSerializer:
+    """Metric dataclasses straight to InfluxDB line protocol, without Point objects
+
+    Produces the same lines as the Point chains it replaces: tags and
+    fields sorted by key, None and non-finite values skipped, nanosecond
+    timestamps. The escaped ",input_id=..,input_name=.." tag prefix of each
+    input is built once, when the input is registered (or first seen), and
+    each line is assembled in a reused per-thread buffer.
+    """
+
+    SEGMENT = _lp_fields('segment_number', 'size_bytes', 'download_time_ms', 'http_status', 'connect_ms',
+                         'attempts', duration_sec=attrgetter('duration'))
+    UDP_PROBE = _lp_fields('packets_received', 'bytes_received', 'duration_sec', 'bitrate_mbps',
+                           is_valid=lambda m: int(m.is_valid), error_count=lambda m: len(m.errors))
+    TR101290_P1 = _lp_fields('ts_sync_loss', 'sync_byte_error', 'pat_error', 'continuity_count_error',
+                             'pmt_error', 'pid_error', total_p1_errors=_p1_total)
+    TR101290_P2 = _lp_fields('transport_error', 'crc_error', 'pcr_error', 'pcr_accuracy_error',
+                             'pts_error', 'cat_error', total_p2_errors=_p2_total)
+    TR101290_P3 = _lp_fields('nit_error', 'si_repetition_error', 'unreferenced_pid', total_p3_errors=_p3_total)
+    TR101290_META = _lp_fields('total_packets', 'pcr_interval_ms',
+                               pat_received=lambda m: int(m.pat_received),
+                               pmt_received=lambda m: int(m.pmt_received))
+    TR101290_META_CUMULATIVE = _lp_merge(TR101290_META, _lp_fields(
+        cumulative_packets=attrgetter('total_packets'), cumulative_p1_errors=_p1_total,
+        cumulative_p2_errors=_p2_total, cumulative_p3_errors=_p3_total))
+    MDI = _lp_fields('df', 'mlr', 'jitter_ms', 'max_jitter_ms', 'inter_arrival_time_ms', 'buffer_depth',
+                     'buffer_max', 'buffer_utilization', 'packets_received', 'packets_lost',
+                     'packets_out_of_order', 'packets_duplicated', 'rtp_jitter_ms', 'input_rate_mbps',
+                     'output_rate_mbps', 'traffic_overhead', 'clock_source',
+                     rtp_detected=lambda m: int(m.rtp_detected))
+    MDI_INTERVAL = _lp_fields('df', 'mlr', 'vb_bytes', 'packets', 'bytes', 'media_rate_mbps')
+    QOE = _lp_fields('black_frames_detected', 'freeze_frames_detected', 'black_run_ms', 'freeze_run_ms',
+                     'video_bitrate_mbps', 'audio_silence_detected', 'audio_loudness_lufs',
+                     'audio_loudness_i', 'audio_loudness_lra', 'audio_bitrate_kbps', 'video_quality_score',
+                     'audio_quality_score', 'overall_mos',
+                     video_pid_active=lambda m: int(m.video_pid_active),
+                     audio_pid_active=lambda m: int(m.audio_pid_active))
+    CODEC_INFO = _lp_fields('video_profile', 'video_level', 'video_resolution', 'video_fps', 'video_bitrate_kbps',
+                            'audio_channels', 'audio_sample_rate', 'audio_bitrate_kbps', 'audio_atmos')
+    CODEC_INFO_WIDE = _lp_fields('video_codec', 'audio_codec', 'video_profile', 'video_level', 'video_resolution',
+                                 'video_fps', 'video_bitrate_kbps', 'audio_channels', 'audio_sample_rate',
+                                 'audio_bitrate_kbps', 'audio_atmos')  # Codec names are tags only in codec_info
+
+    # Field key prefix in input_health for each measurement folded into it (the CMS splits on the '.')
+    INPUT_HEALTH_PREFIXES = {
+        'udp_probe_metric': 'probe.',
+        'tr101290_p1': 'p1.',
+        'tr101290_p2': 'p2.',
+        'tr101290_p3': 'p3.',
+        'tr101290_metadata': 'tr.',
+        'mdi_metrics': 'mdi.',
+        'qoe_metrics': 'qoe.',
+        'codec_info': 'codec.',
+    }
+
+    def __init__(self):
+        self._input_tags = {}  # (input_id, input_name) -> escaped tag prefix
+        self._channel_tags = {}  # (channel, rung) -> escaped tag prefix
+        self._local = threading.local()
+
+    def register_input(self, input_id: int, input_name: str) -> str:
+        """Escaped ',input_id=..,input_name=..' tag prefix of an input (cached)"""
+        key = (input_id, input_name)
+        tags = self._input_tags.get(key)
+        if tags is None:
+            tags = self._input_tags[key] = lp_tag('input_id', input_id) + lp_tag('input_name', input_name)
+        return tags
+
+    def _line(self, measurement: str, tags: str, spec: tuple, metric, timestamp: datetime) -> str:
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = []
+        buffer.clear()
+        for key, getter in spec:
+            value = lp_value(getter(metric))
+            if value is not None:
+                buffer.append(key + value)
+        if not buffer:
+            return ''  # A point without fields writes nothing
+        return f"{measurement}{tags} {','.join(buffer)}{lp_timestamp(timestamp)}"
+
+    def segment(self, metric: SegmentMetric) -> str:
+        key = (metric.channel_id, metric.rung_id)
+        tags = self._channel_tags.get(key)
+        if tags is None:
+            tags = self._channel_tags[key] = lp_tag('channel', metric.channel_id) + lp_tag('rung', metric.rung_id)
+        return self._line('segment_metric', tags, self.SEGMENT, metric, metric.timestamp)
+
+    def udp_probe(self, metric: UDPProbeMetric) -> str:
+        tags = self.register_input(metric.input_id, metric.input_name)
+        return self._line('udp_probe_metric', tags, self.UDP_PROBE, metric, metric.timestamp)
+
+    def tr101290(self, metrics: TR101290Metrics, cumulative: TR101290Metrics = None) -> List[str]:
+        tags = self.register_input(metrics.input_id, metrics.input_name)
+        return [
+            self._line('tr101290_p1', tags, self.TR101290_P1, metrics, metrics.timestamp),
+            self._line('tr101290_p2', tags, self.TR101290_P2, metrics, metrics.timestamp),
+            self._line('tr101290_p3', tags, self.TR101290_P3, metrics, metrics.timestamp),
+            self._line('tr101290_metadata', tags, self.TR101290_META, metrics, metrics.timestamp)
+            if cumulative is None else
+            self._line('tr101290_metadata', tags, self.TR101290_META_CUMULATIVE, (metrics, cumulative),
+                       metrics.timestamp),
+        ]
+
+    def mdi(self, metrics: MDIMetrics) -> List[str]:
+        """The mdi_metrics line followed by one mdi_interval line per interval"""
+        tags = self.register_input(metrics.input_id, metrics.input_name)
+        lines = [self._line('mdi_metrics', tags, self.MDI, metrics, metrics.timestamp)]
+        for interval in metrics.intervals or []:
+            lines.append(self._line('mdi_interval', tags, self.MDI_INTERVAL, interval, interval.timestamp))
+        return lines
+
+    def qoe(self, metrics: QoEMetrics) -> str:
+        tags = self.register_input(metrics.input_id, metrics.input_name)
+        return self._line('qoe_metrics', tags, self.QOE, metrics, metrics.timestamp)
+
+    def codec_info(self, info: CodecInfo) -> str:
+        # Tags in key order: audio_codec < input_id < input_name < video_codec
+        tags = (lp_tag('audio_codec', info.audio_codec) + self.register_input(info.input_id, info.input_name) +
+                lp_tag('video_codec', info.video_codec))
+        return self._line('codec_info', tags, self.CODEC_INFO, info, info.timestamp)
+
+    def input_health_fields(self, measurement: str, spec: tuple, metric) -> List[str]:
+        """A metric's fields as they appear in input_health ('mdi.df=4.2', ...)"""
+        prefix = self.INPUT_HEALTH_PREFIXES[measurement]
+        fields = []
+        for key, getter in spec:
+            value = lp_value(getter(metric))
+            if value is not None:
+                fields.append(prefix + key + value)
+        return fields
+
+    def input_health(self, input_id: int, input_name: str, fields: List[str], timestamp: datetime) -> str:
+        if not fields:
+            return ''
+        return f"input_health{self.register_input(input_id, input_name)} {','.join(fields)}{lp_timestamp(timestamp)}"
+
+
+def benchmark_line_protocol(iterations: int = 20000):
+    """Time one input's TR 101 290, MDI, QoE, UDP probe and codec lines: serializer vs Point chains"""
+    now = datetime.utcnow()
+    tr = TR101290Metrics(input_id=42, input_name="VTV1 HD, main", continuity_count_error=3,
+                         total_packets=45000, pat_received=True, pmt_received=True, pcr_interval_ms=38.5,
+                         timestamp=now)
+    mdi = MDIMetrics(input_id=42, input_name="VTV1 HD, main", df=4.2, mlr=0.0, packets_received=6400,
+                     input_rate_mbps=8.1, output_rate_mbps=8.1, timestamp=now,
+                     intervals=[MDIInterval(offset_sec=float(i), df=4.2, packets=640, bytes=846720,
+                                            media_rate_mbps=8.1, timestamp=now) for i in range(5)])
+    qoe = QoEMetrics(input_id=42, input_name="VTV1 HD, main", video_pid_active=True, audio_pid_active=True,
+                     audio_loudness_lufs=-23.1, timestamp=now)
+    probe = UDPProbeMetric(input_id=42, input_name="VTV1 HD, main", packets_received=6400,
+                           bytes_received=8467200, duration_sec=5.0, bitrate_mbps=13.5, is_valid=True,
+                           errors=[], timestamp=now)
+    codec = CodecInfo(input_id=42, input_name="VTV1 HD, main", video_codec="h264", audio_codec="aac",
+                      video_resolution="1920x1080", timestamp=now)
+    serializer = LineProtocolSerializer()
+
+    def with_serializer():
+        return (serializer.tr101290(tr, tr) + serializer.mdi(mdi) +
+                [serializer.qoe(qoe), serializer.udp_probe(probe), serializer.codec_info(codec)])
+
+    def point(measurement, tags, spec, metric, timestamp):
+        p = Point(measurement)
+        for key, value in tags:
+            p = p.tag(key, value)
+        for key, getter in spec:
+            p = p.field(key[:-1], getter(metric))
+        return p.time(timestamp).to_line_protocol()
+
+    def with_points():
+        tags = (('input_id', str(tr.input_id)), ('input_name', tr.input_name))
+        s = LineProtocolSerializer
+        return [
+            point('tr101290_p1', tags, s.TR101290_P1, tr, now),
+            point('tr101290_p2', tags, s.TR101290_P2, tr, now),
+            point('tr101290_p3', tags, s.TR101290_P3, tr, now),
+            point('tr101290_metadata', tags, s.TR101290_META_CUMULATIVE, (tr, tr), now),
+            point('mdi_metrics', tags, s.MDI, mdi, now),
+        ] + [point('mdi_interval', tags, s.MDI_INTERVAL, i, i.timestamp) for i in mdi.intervals] + [
+            point('qoe_metrics', tags, s.QOE, qoe, now),
+            point('udp_probe_metric', tags, s.UDP_PROBE, probe, now),
+            point('codec_info', tags + (('video_codec', 'h264'), ('audio_codec', 'aac')), s.CODEC_INFO, codec, now),
+        ]
+
+    if with_serializer() != with_points():
+        raise AssertionError("Serializer output differs from Point output")
+
+    results = {}
+    for name, build in (('point', with_points), ('serializer', with_serializer)):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            build()
+        results[name] = (time.perf_counter() - started) / iterations * 1e6
+    print(f"Point chains: {results['point']:.1f} us per input cycle")
+    print(f"Serializer:   {results['serializer']:.1f} us per input cycle "
+          f"({results['point'] / results['serializer']:.1f}x faster)")
+
+def benchmark_tr101290(seconds: int = 10, bitrate_mbps: float = 15.0, repeat: int = 3):
+    """Time TSDemux.feed with each TR 101 290 engine on a synthetic, error-free HD service
+
+    Packet mix of a typical single-program feed: PAT and PMT every 100 ms,
+    a PCR on the video PID every 30 ms, one 128 kbps audio track, about 9%
+    null packets. Fed in 1 s windows, as a listener report window would be.
+    """
+    packets_per_second = int(bitrate_mbps * 1e6 / (188 * 8))
+    pmt_pid, video_pid, audio_pid = 0x1000, 0x100, 0x101
+
+    def section(table_id: int, extension: int, body: bytes) -> bytes:
+        length = 5 + len(body) + 4
+        data = bytes([table_id, 0xB0 | (length >> 8), length & 0xFF, extension >> 8, extension & 0xFF, 0xC1, 0, 0])
+        data += body
+        return data + mpeg_crc32(data).to_bytes(4, 'big')
+
+    pat = section(0x00, 1, struct.pack('>HH', 1, 0xE000 | pmt_pid))
+    pmt = section(0x02, 1, struct.pack('>HH', 0xE000 | video_pid, 0xF000) +
+                  bytes([0x1B]) + struct.pack('>HH', 0xE000 | video_pid, 0xF000) +
+                  bytes([0x0F]) + struct.pack('>HH', 0xE000 | audio_pid, 0xF000))
+    audio_share = 128e3 / (bitrate_mbps * 1e6)
+
+    rnd = random.Random(0)
+    cc = {}
+    out = bytearray()
+    next_psi = next_pcr = 0.0
+    for i in range(seconds * packets_per_second):
+        t = i / packets_per_second
+        if t >= next_psi:
+            next_psi += 0.1
+            packets = [(0x0000, 0x40, 1, b'\x00' + pat), (pmt_pid, 0x40, 1, b'\x00' + pmt)]
+        elif t >= next_pcr:
+            next_pcr += 0.03
+            pcr_base = int(t * 90000)
+            adaptation = bytes([7, 0x10]) + (pcr_base >> 1).to_bytes(4, 'big') + bytes([((pcr_base & 1) << 7) | 0x7E, 0])
+            packets = [(video_pid, 0x00, 3, adaptation)]
+        else:
+            draw = rnd.random()
+            pid = audio_pid if draw < audio_share else 0x1FFF if draw > 0.91 else video_pid
+            packets = [(pid, 0x00, 1, b'')]
+        for pid, flags, adaptation_control, head in packets:
+            out += bytes([0x47, flags | (pid >> 8), pid & 0xFF, (adaptation_control << 4) | cc.get(pid, 0)])
+            out += head + b'\xff' * (184 - len(head))
+            cc[pid] = (cc.get(pid, 0) + 1) & 15
+    capture = bytes(out)
+    window = packets_per_second * 188
+
+    source = InputSource(input_id=0, input_name='benchmark', input_url='udp://239.0.0.1:5000',
+                         input_type='MPEGTS_UDP', input_protocol='udp', input_port=5000, channel_id=0,
+                         channel_name='benchmark', probe_id=0, is_primary=True, enabled=True)
+    results = {}
+    for engine in ('python', 'numpy'):
+        best = float('inf')
+        for _ in range(repeat):
+            demux = TSDemux('benchmark')
+            analyzer = demux.register('tr101290', TR101290Analyzer(source, engine=engine))
+            started = time.perf_counter()
+            for offset in range(0, len(capture), window):
+                demux.feed(capture[offset:offset + window])
+            best = min(best, time.perf_counter() - started)
+        errors = {name: getattr(analyzer.cumulative, name) for name in TR101290_COUNTERS
+                  if name != 'total_packets' and getattr(analyzer.cumulative, name)}
+        if errors:
+            raise AssertionError(f"{engine} engine found errors in an error-free capture: {errors}")
+        results[engine] = best
+
+    print(f"TSDemux.feed, {seconds} s of {bitrate_mbps:g} Mbps ({len(capture) // 188} packets) "
+          f"in 1 s windows, best of {repeat}:")
+    for engine, elapsed in results.items():
+        print(f"  {engine:6s} {elapsed / seconds * 1000:7.2f} ms per second of stream")
+    print(f"  numpy is {results['python'] / results['numpy']:.1f}x faster")
+
+# ============================================================================
+# METRICS WRITER
+# ============================================================================
+
+class MetricsSpool:
+    """Append-only on-disk spool of line-protocol batches (write-ahead log)
+
+    Records are appended to numbered segment files of at most
+    `segment_bytes`. Each record is a length + CRC-32 header followed by
+    "bucket\\norg\\nline\\nline...". A torn or corrupt record ends its
+    segment. A cursor file holds the replay position, replaced by atomic
+    rename after every committed read. Segments are deleted once
+    replayed. When the spool exceeds `max_bytes`, the oldest segments are
+    evicted first. Replay is at-least-once, which is harmless here because
+    InfluxDB overwrites a point with the same series and timestamp.
+    Segment sizes are stat'ed once on open and tracked in memory after
+    that, so appends and emptiness checks cost no filesystem calls.
+
+    Not thread-safe: MetricsWriter only uses it from its flush thread.
+    """
+
+    _RECORD = struct.Struct('<II')  # payload length, CRC-32 of the payload
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024,
+                 max_bytes: int = 1024 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.evicted_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments = sorted(
+            int(name[:-4]) for name in os.listdir(directory) if name.endswith('.wal') and name[:-4].isdigit()
+        )
+        self._sizes = {segment: os.path.getsize(self._path(segment)) for segment in self._segments}
+        self._size_bytes = sum(self._sizes.values())
+        self._cursor = self._load_cursor()
+        self._writer = None
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:012d}.wal")
+
+    def _load_cursor(self) -> tuple:
+        try:
+            with open(os.path.join(self.directory, 'cursor')) as f:
+                segment, offset = (int(value) for value in f.read().split())
+        except (OSError, ValueError):
+            segment, offset = 0, 0
+        if self._segments and segment < self._segments[0]:
+            segment, offset = self._segments[0], 0
+        return segment, offset
+
+    def _save_cursor(self):
+        temp = os.path.join(self.directory, 'cursor.tmp')
+        with open(temp, 'w') as f:
+            f.write(f"{self._cursor[0]} {self._cursor[1]}")
+        os.replace(temp, os.path.join(self.directory, 'cursor'))
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    @property
+    def empty(self) -> bool:
+        if not self._segments:
+            return True
+        last = self._segments[-1]
+        return self._cursor[0] >= last and self._cursor[1] >= self._sizes[last]
+
+    def append(self, bucket: str, org: str, lines: List[str]):
+        payload = '\n'.join([bucket, org] + lines).encode('utf-8')
+        if self._writer is None or self._sizes[self._segments[-1]] >= self.segment_bytes:
+            self._roll()
+        record = self._RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+        self._writer.write(record)
+        self._writer.flush()
+        self._sizes[self._segments[-1]] += len(record)
+        self._size_bytes += len(record)
+        self._enforce_quota()
+
+    def _roll(self):
+        if self._writer is not None:
+            self._writer.close()
+        segment = (self._segments[-1] if self._segments else self._cursor[0]) + 1
+        self._segments.append(segment)
+        self._writer = open(self._path(segment), 'ab')
+        self._sizes[segment] = self._writer.tell()
+        self._size_bytes += self._sizes[segment]
+        if self._cursor[0] < self._segments[0]:
+            self._cursor = (self._segments[0], 0)
+
+    def _unlink(self, segment: int) -> int:
+        """Delete a segment already removed from _segments; returns its size"""
+        size = self._sizes.pop(segment)
+        self._size_bytes -= size
+        os.unlink(self._path(segment))
+        return size
+
+    def _enforce_quota(self):
+        while len(self._segments) > 1 and self._size_bytes > self.max_bytes:
+            oldest = self._segments.pop(0)
+            size = self._unlink(oldest)
+            self.evicted_bytes += size
+            logger.warning(f"Metrics spool over quota, evicted {size} bytes of the oldest points")
+            if self._cursor[0] <= oldest:
+                self._cursor = (self._segments[0], 0)
+                self._save_cursor()
+
+    def read(self, max_lines: int) -> tuple:
+        """Up to about max_lines spooled lines from the cursor: ([(bucket, org, lines, end)], position)
+
+        `end` is the position just past that record, for committing part of a read.
+        """
+        batches = []
+        count = 0
+        segment, offset = self._cursor
+        for current in [s for s in self._segments if s >= segment]:
+            if current != segment:
+                segment, offset = current, 0
+            with open(self._path(current), 'rb') as f:
+                f.seek(offset)
+                while count < max_lines:
+                    header = f.read(self._RECORD.size)
+                    if len(header) < self._RECORD.size:
+                        break
+                    length, crc = self._RECORD.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        logger.warning(f"Corrupt record in metrics spool segment {current}, skipping the rest")
+                        offset = self._sizes[current]
+                        break
+                    bucket, org, *lines = payload.decode('utf-8').split('\n')
+                    offset = f.tell()
+                    batches.append((bucket, org, lines, (current, offset)))
+                    count += len(lines)
+            if count >= max_lines:
+                break
+        return batches, (segment, offset)
+
+    def commit(self, position: tuple):
+        """Advance the cursor past replayed records and delete finished segments"""
+        self._cursor = position
+        current = self._segments[-1] if self._writer is not None and self._segments else None
+        while self._segments and self._segments[0] < position[0]:
+            self._unlink(self._segments.pop(0))
+        if self.empty and self._segments and self._segments[-1] != current:
+            self._unlink(self._segments.pop())
+        self._save_cursor()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def write_error_retryable(error: Exception) -> bool:
+    """True for failures worth spooling and retrying: connection errors, timeouts, 5xx, 408 and 429
+
+    Any other HTTP status (400 field type conflict, malformed line, 401, 404 ...)
+    will fail the same way again, and so will an unexpected local error.
+    """
+    status = getattr(error, 'status', None)
+    if status is None and isinstance(getattr(error, 'response', None), urllib3.response.HTTPResponse):
+        status = error.response.status  # influxdb_client InfluxDBError
+    if isinstance(status, int) and status > 0:
+        return status >= 500 or status in (408, 429)
+    return isinstance(error, (urllib3.exceptions.HTTPError, OSError))
+
+
+class MetricsWriter:
+    """Asynchronous, batched InfluxDB writer shared by all monitoring threads
+
+    write() has the signature of the client's write_api.write(). Points are
+    serialized to line protocol on the caller's thread and queued. A
+    background thread flushes them by batch size or flush interval, one
+    request per (bucket, org), gzip-compressed by the client. The queue is
+    bounded in bytes. A full queue blocks writers for up to `block_timeout`
+    (backpressure), then drops the oldest lines. close() flushes what is
+    left. Queue depth and flush latency are written as a "metrics_writer"
+    point every `stats_interval` seconds.
+
+    With a `spool`, a batch that fails to write is appended to it instead
+    of being lost. Everything after it goes to the spool too, so points
+    stay in order. The flush thread replays the spool oldest-first at up
+    to `replay_rate` points/s, and retries every `retry_interval` seconds
+    while the sink is down. Only transient failures are spooled and
+    retried (see write_error_retryable). A batch InfluxDB rejects outright
+    is dropped and counted in dropped_points, live or replayed, so it
+    cannot hold up the spool.
+    """
+
+    def __init__(self, write_api, bucket: str, org: str, batch_size: int = 5000,
+                 flush_interval: float = 1.0, max_queue_bytes: int = 32 * 1024 * 1024,
+                 block_timeout: float = 1.0, stats_interval: float = 10.0,
+                 spool: MetricsSpool = None, replay_rate: float = 20000, retry_interval: float = 5.0):
+        self.write_api = write_api  # Synchronous client write API, used by the flush thread only
+        self.bucket = bucket
+        self.org = org
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_bytes = max_queue_bytes
+        self.block_timeout = block_timeout
+        self.stats_interval = stats_interval
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.retry_interval = retry_interval
+
+        self._queue = deque()  # (bucket, org, line)
+        self._queued_bytes = 0
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self.flushed_points = 0
+        self.dropped_points = 0
+        self.failed_batches = 0
+        self.flush_latency_ms = 0.0  # Last flush
+        self.spooled_points = 0
+        self.replayed_points = 0
+        self._next_replay = 0.0
+        self._next_stats = time.monotonic() + stats_interval
+
+        self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def write(self, bucket: str, org: str, record):
+        """Queue a Point, line-protocol string or list of them"""
+        lines = self._lines(record)
+        size = sum(len(line) for line in lines)
+        with self._condition:
+            deadline = time.monotonic() + self.block_timeout
+            while self._queued_bytes + size > self.max_queue_bytes and self._queue and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    while self._queue and self._queued_bytes + size > self.max_queue_bytes:
+                        self._queued_bytes -= len(self._queue.popleft()[2])
+                        self.dropped_points += 1
+                    logger.warning(f"Metrics queue full, dropped oldest lines ({self.dropped_points} so far)")
+                    break
+                self._condition.notify_all()  # Make the flush thread drain now
+                self._condition.wait(remaining)
+
+            for line in lines:
+                self._queue.append((bucket, org, line))
+            self._queued_bytes += size
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify_all()
+
+    @staticmethod
+    def _lines(record) -> List[str]:
+        if isinstance(record, (list, tuple)):
+            return [line for item in record for line in MetricsWriter._lines(item)]
+        line = record if isinstance(record, str) else record.to_line_protocol()
+        return [line] if line else []  # A point without fields serializes to ''
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_interval
+                if self.spool is not None and not self.spool.empty:
+                    deadline = min(deadline, max(self._next_replay, time.monotonic()))
+                while len(self._queue) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._queued_bytes -= sum(len(line) for _, _, line in batch)
+                self._condition.notify_all()  # Room for blocked writers
+                if self._closed and not batch:
+                    if self.spool is not None:
+                        self.spool.close()
+                    return
+
+            if batch:
+                self._flush(batch)
+            if self.spool is not None and not self._closed:
+                self._replay()
+            if time.monotonic() >= self._next_stats and not self._closed:
+                self._next_stats = time.monotonic() + self.stats_interval
+                line = self._stats_point().to_line_protocol()
+                with self._condition:  # Not subject to backpressure: this is the draining thread
+                    self._queue.append((self.bucket, self.org, line))
+                    self._queued_bytes += len(line)
+
+    def _flush(self, batch: List[tuple]):
+        groups = {}
+        for bucket, org, line in batch:
+            groups.setdefault((bucket, org), []).append(line)
+
+        started = time.monotonic()
+        for (bucket, org), lines in groups.items():
+            if self.spool is not None and not self.spool.empty:
+                self._spool(bucket, org, lines)  # Behind a backlog: keep the order
+                continue
+            try:
+                self.write_api.write(bucket=bucket, org=org, record=lines)
+                self.flushed_points += len(lines)
+            except Exception as e:
+                self.failed_batches += 1
+                if not write_error_retryable(e):
+                    self._reject(lines, e)
+                    continue
+                if self.spool is None:
+                    logger.error(f"Error writing {len(lines)} points to InfluxDB: {e}")
+                    continue
+                logger.error(f"Error writing {len(lines)} points to InfluxDB, spooling to disk: {e}")
+                self._spool(bucket, org, lines)
+                self._next_replay = time.monotonic() + self.retry_interval
+        self.flush_latency_ms = (time.monotonic() - started) * 1000
+
+    def _reject(self, lines: List[str], error: Exception):
+        """Drop a batch InfluxDB refused; retrying it would only fail again"""
+        self.dropped_points += len(lines)
+        logger.error(f"InfluxDB rejected {len(lines)} points, dropping them: {error} "
+                     f"(first line: {lines[0][:200] if lines else ''})")
+
+    def _spool(self, bucket: str, org: str, lines: List[str]):
+        try:
+            self.spool.append(bucket, org, lines)
+            self.spooled_points += len(lines)
+        except Exception as e:
+            self.dropped_points += len(lines)
+            logger.error(f"Error spooling {len(lines)} points to disk: {e}")
+
+    def _replay(self):
+        """Send the next spooled batch once the previous one's rate budget has passed"""
+        if time.monotonic() < self._next_replay or self.spool.empty:
+            return
+        try:
+            records, position = self.spool.read(self.batch_size)
+        except Exception as e:
+            logger.error(f"Error reading metrics spool: {e}")
+            self._next_replay = time.monotonic() + self.retry_interval
+            return
+
+        count = 0
+        done = None  # Position past the last record handled
+        for bucket, org, lines, end in records:
+            try:
+                self.write_api.write(bucket=bucket, org=org, record=lines)
+                count += len(lines)
+            except Exception as e:
+                if not write_error_retryable(e):
+                    self._reject(lines, e)  # And commit past it, or it would block the spool
+                else:
+                    logger.warning(f"Metrics spool replay failed, retrying in {self.retry_interval:g}s: {e}")
+                    if done is not None:
+                        self.spool.commit(done)
+                    self.replayed_points += count
+                    self._next_replay = time.monotonic() + self.retry_interval
+                    return
+            done = end
+        self.spool.commit(position)
+        self.replayed_points += count
+        self._next_replay = time.monotonic() + max(count, 1) / self.replay_rate
+        if self.spool.empty:
+            logger.info(f"Metrics spool drained ({self.replayed_points} points replayed so far)")
+
+    def _stats_point(self) -> Point:
+        return Point("metrics_writer") \
+            .field("queue_points", len(self._queue)) \
+            .field("queue_bytes", self._queued_bytes) \
+            .field("flush_latency_ms", self.flush_latency_ms) \
+            .field("flushed_points", self.flushed_points) \
+            .field("dropped_points", self.dropped_points) \
+            .field("failed_batches", self.failed_batches) \
+            .field("spooled_points", self.spooled_points) \
+            .field("replayed_points", self.replayed_points) \
+            .field("spool_bytes", self.spool.size_bytes if self.spool is not None else 0) \
+            .field("spool_evicted_bytes", self.spool.evicted_bytes if self.spool is not None else 0) \
+            .time(datetime.utcnow())
+
+    def close(self, timeout: float = 10.0):
+        """Flush the queued points and stop the flush thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if self._queue:
+            logger.warning(f"{len(self._queue)} metric points not flushed at shutdown")
 
 # ============================================================================
 # PACKAGER MONITOR SERVICE
@@ -295,20 +4234,66 @@ class PackagerMonitor:
         self.influx_client = InfluxDBClient(
             url=config.influxdb_url,
             token=config.influxdb_token,
-            org=config.influxdb_org
+            org=config.influxdb_org,
+            enable_gzip=True
+        )
+        spool = None
+        if config.metrics_spool_dir:
+            try:
+                spool = MetricsSpool(config.metrics_spool_dir, max_bytes=config.metrics_spool_mb * 1024 * 1024)
+            except Exception as e:
+                logger.error(f"Metrics spool disabled, cannot use {config.metrics_spool_dir}: {e}")
+        # Batched writer with the client write API's write() signature
+        self.write_api = MetricsWriter(
+            self.influx_client.write_api(write_options=SYNCHRONOUS),
+            bucket=config.influxdb_bucket,
+            org=config.influxdb_org,
+            batch_size=config.influxdb_batch_size,
+            flush_interval=config.influxdb_flush_interval,
+            max_queue_bytes=config.influxdb_queue_mb * 1024 * 1024,
+            spool=spool,
+            replay_rate=config.metrics_spool_replay_rate
         )
-        self.write_api = self.influx_client.write_api(write_options=SYNCHRONOUS)
         self.executor = ThreadPoolExecutor(max_workers=config.max_workers)
+        self.http = HTTPClient(
+            pool_size=max(config.max_workers, config.hls_host_concurrency),
+            retries=config.http_retries,
+            backoff=config.http_retry_backoff,
+            timeout=config.http_timeout
+        )
+        # Threads for the HLS crawler's blocking requests (see CrawlSession)
+        self.fetch_executor = ThreadPoolExecutor(max_workers=config.hls_concurrency, thread_name_prefix='hls-fetch')
+        self.line_protocol = LineProtocolSerializer()  # Metric dataclasses -> line protocol
+        self.input_health = {}  # input_id -> {measurement: fields} of the input_health point assembled this cycle
         self.metric_cache = {}  # Store last metrics for comparison
         self.last_snapshot_times = {}  # Track when we last took snapshots
+        self.demuxers = {}  # input_id -> TSDemux with its consumers (state kept across cycles)
+        self.capture_rings = {}  # input_id -> CaptureRing used by the one-shot UDP probe
+        self.rtp_trackers = {}  # input_id -> RTPTracker (sequence/jitter state)
+        self.decode_workers = {}  # input_id -> DecodeWorker (listener mode, selected tiers)
+        self.codec_cache = {}  # input_id -> CodecCacheEntry
+        self.rendition_states = {}  # (channel_id, rung_id) -> RenditionState of the live HLS playlists
+        self.loudness_meters = {}  # input_id -> LoudnessMeter (windows analyzed without a decode worker)
+        self.listener_manager = None
+        if config.udp_mode == 'listener':
+            self.listener_manager = MulticastListenerManager(config, self._on_listener_capture)
         self.db_conn = None
         self._connect_db()
         self._setup_snapshot_dir()
     
     def _setup_snapshot_dir(self):
         """Create snapshot directory if it doesn't exist"""
+        self.snapshot_store = SnapshotStore(
+            self.config.snapshot_dir,
+            history_count=self.config.snapshot_history_count,
+            history_max_bytes=self.config.snapshot_history_mb * 1024 * 1024,
+            history_max_age_sec=self.config.snapshot_history_hours * 3600
+        )
         try:
             os.makedirs(self.config.snapshot_dir, exist_ok=True)
+            removed = self.snapshot_store.remove_legacy_files()
+            if removed:
+                logger.info(f"Removed {removed} snapshots of the old per-capture layout")
             logger.info(f"Snapshot directory ready: {self.config.snapshot_dir}")
         except Exception as e:
             logger.error(f"Failed to create snapshot directory: {e}")
@@ -322,11 +4307,11 @@ class PackagerMonitor:
             logger.error(f"Failed to connect to database: {e}")
             self.db_conn = None
 
-    def _fetch_inputs_from_db(self) -> List[InputSource]:
-        """Fetch enabled inputs from database"""
+    def _fetch_inputs_from_db(self) -> Optional[List[InputSource]]:
+        """Fetch enabled inputs from database (None if the database is unavailable)"""
         if not self.db_conn:
             logger.warning("No database connection, using legacy channel list")
-            return []
+            return None
 
         try:
             with self.db_conn.cursor(cursor_factory=RealDictCursor) as cursor:
@@ -342,9 +4327,13 @@ class PackagerMonitor:
                         c.channel_name,
                         i.probe_id,
                         i.is_primary,
-                        i.enabled
+                        i.enabled,
+                        c.tier,
+                        t.black_threshold_ms,
+                        t.freeze_threshold_ms
                     FROM inputs i
                     LEFT JOIN channels c ON i.channel_id = c.channel_id
+                    LEFT JOIN templates t ON c.template_id = t.template_id
                     WHERE i.enabled = true
                     ORDER BY i.input_id
                 """)
@@ -363,8 +4352,12 @@ class PackagerMonitor:
                         channel_name=row['channel_name'],
                         probe_id=row['probe_id'],
                         is_primary=row['is_primary'],
-                        enabled=row['enabled']
+                        enabled=row['enabled'],
+                        tier=row['tier'],
+                        black_threshold_ms=row['black_threshold_ms'] or 500,
+                        freeze_threshold_ms=row['freeze_threshold_ms'] or 1000
                     ))
+                    self.line_protocol.register_input(row['input_id'], row['input_name'])
 
                 logger.info(f"Fetched {len(inputs)} inputs from database")
                 return inputs
@@ -377,11 +4370,18 @@ class PackagerMonitor:
             except:
                 pass
             self._connect_db()
-            return []
+            return None
 
     def run(self):
         """Main monitoring loop"""
         logger.info("Starting Packager Monitor Service")
+        if self.listener_manager:
+            self.listener_manager.start()
+        if self.config.udp_mode != 'listener':
+            logger.info("Probe mode: loudness needs UDP_MODE=listener, "
+                        "black/freeze detection UDP_MODE=listener and DECODE_WORKER_TIERS")
+        elif not self.config.decode_worker_tiers:
+            logger.info("Black/freeze detection is off: it needs DECODE_WORKER_TIERS")
 
         try:
             while True:
@@ -393,7 +4393,14 @@ class PackagerMonitor:
                     time.sleep(self.config.poll_interval)
         except KeyboardInterrupt:
             logger.info("Shutting down...")
+            if self.listener_manager:
+                self.listener_manager.stop()
+            for worker in self.decode_workers.values():
+                worker.stop()
             self.executor.shutdown(wait=True)
+            self.fetch_executor.shutdown(wait=True)
+            self.http.close()
+            self.write_api.close()
             if self.db_conn:
                 self.db_conn.close()
     
@@ -401,27 +4408,40 @@ class PackagerMonitor:
         """Single monitoring cycle"""
         # Fetch inputs from database
         inputs = self._fetch_inputs_from_db()
+        if inputs is not None:
+            self._prune_input_state(inputs)
+
+        # Listener mode: long-lived sockets follow the enabled UDP inputs and
+        # report on their own interval, so the cycle only probes the rest
+        if self.listener_manager and inputs is not None:
+            udp_inputs = [i for i in inputs if i.input_type == 'MPEGTS_UDP']
+            self.listener_manager.sync(udp_inputs)
+            self._sync_decode_workers(udp_inputs)
+            inputs = [i for i in inputs if i.input_type != 'MPEGTS_UDP']
+            if not inputs:
+                return
 
         if not inputs:
             logger.warning("No inputs found in database, falling back to legacy channel monitoring")
             logger.debug(f"Starting monitor cycle for {len(self.config.channels)} channels")
 
-            futures = {}
-            for channel_id in self.config.channels:
-                future = self.executor.submit(self.monitor_channel, channel_id)
-                futures[future] = channel_id
-
-            for future in futures:
-                try:
-                    future.result(timeout=60)
-                except Exception as e:
-                    logger.error(f"Error monitoring {futures[future]}: {e}")
+            try:
+                self.monitor_channels(self.config.channels)
+            except Exception as e:
+                logger.error(f"Error monitoring channels: {e}", exc_info=True)
             return
 
         logger.debug(f"Starting monitor cycle for {len(inputs)} inputs")
 
         futures = {}
+        # HLS/HTTP inputs: one concurrent crawl for all their channels
+        hls_channels = [self._hls_channel_id(i) for i in inputs if i.input_type in ('HTTP', 'HLS')]
+        if hls_channels:
+            future = self.executor.submit(self.monitor_channels, list(dict.fromkeys(hls_channels)))
+            futures[future] = f"{len(hls_channels)} HLS inputs"
         for input_source in inputs:
+            if input_source.input_type in ('HTTP', 'HLS'):
+                continue
             future = self.executor.submit(self.monitor_input, input_source)
             futures[future] = input_source.input_name
 
@@ -431,94 +4451,125 @@ class PackagerMonitor:
             except Exception as e:
                 logger.error(f"Error monitoring {futures[future]}: {e}")
 
-    def _analyze_tr101290(self, ts_data: bytes, input_source: InputSource) -> TR101290Metrics:
-        """Analyze TS stream for TR 101 290 errors"""
-        metrics = TR101290Metrics(
-            input_id=input_source.input_id,
-            input_name=input_source.input_name,
-            timestamp=datetime.utcnow()
-        )
-
-        # Track continuity counters per PID
-        cc_tracker = {}
-        pat_pids = set()
-        pmt_pids = set()
-        pcr_timestamps = []
-
-        # Parse all TS packets
-        for offset in range(0, len(ts_data), 188):
-            if offset + 188 > len(ts_data):
-                break
-
-            packet = ts_data[offset:offset+188]
-            metrics.total_packets += 1
-
-            # P1: Check sync byte (0x47)
-            if packet[0] != 0x47:
-                metrics.sync_byte_error += 1
-                metrics.ts_sync_loss += 1
-                continue
-
-            # Parse TS header
-            transport_error = (packet[1] & 0x80) >> 7
-            payload_start = (packet[1] & 0x40) >> 7
-            pid = ((packet[1] & 0x1F) << 8) | packet[2]
-            adaptation_field = (packet[3] & 0x30) >> 4
-            cc = packet[3] & 0x0F
-
-            # P2: Transport error indicator
-            if transport_error:
-                metrics.transport_error += 1
-
-            # P1: Check continuity counter
-            if pid in cc_tracker:
-                expected_cc = (cc_tracker[pid] + 1) % 16
-                if cc != expected_cc and adaptation_field in (1, 3):  # Has payload
-                    metrics.continuity_count_error += 1
-            cc_tracker[pid] = cc
-
-            # Check for PAT (PID 0x0000)
-            if pid == 0x0000:
-                metrics.pat_received = True
-                pat_pids.add(pid)
-
-            # Check for PMT (typically PID 0x0100 but can vary)
-            if pid in range(0x0010, 0x1FFF) and payload_start:
-                # Simple PMT detection
-                if len(packet) > 5 and packet[4] == 0x02:  # table_id for PMT
-                    metrics.pmt_received = True
-                    pmt_pids.add(pid)
-
-            # Check for PCR
-            if adaptation_field in (2, 3) and len(packet) > 5:
-                adaptation_length = packet[4]
-                if adaptation_length > 0 and len(packet) > 5 + adaptation_length:
-                    pcr_flag = (packet[5] & 0x10) >> 4
-                    if pcr_flag and adaptation_length >= 7:
-                        # Extract PCR (33 bits + 6 bits reserved + 9 bits extension)
-                        pcr_base = (packet[6] << 25) | (packet[7] << 17) | (packet[8] << 9) | (packet[9] << 1) | ((packet[10] & 0x80) >> 7)
-                        pcr_ms = pcr_base / 90.0  # Convert to milliseconds
-                        pcr_timestamps.append(pcr_ms)
-
-        # P1: PAT/PMT errors
-        if not metrics.pat_received:
-            metrics.pat_error = 1
-        if not metrics.pmt_received:
-            metrics.pmt_error = 1
-
-        # Calculate PCR interval
-        if len(pcr_timestamps) >= 2:
-            intervals = [pcr_timestamps[i+1] - pcr_timestamps[i] for i in range(len(pcr_timestamps)-1)]
-            metrics.pcr_interval_ms = sum(intervals) / len(intervals) if intervals else 0
-
-            # P2: PCR accuracy error (should be < 40ms between PCRs)
-            for interval in intervals:
-                if interval > 40:
-                    metrics.pcr_accuracy_error += 1
-
-        return metrics
+    def _prune_input_state(self, inputs: List[InputSource]):
+        """Drop analyzer state and capture buffers of inputs that were disabled or deleted"""
+        active = {i.input_id for i in inputs}
+        for state in (self.demuxers, self.capture_rings, self.rtp_trackers, self.loudness_meters,
+                      self.codec_cache, self.last_snapshot_times, self.input_health):
+            for input_id in list(state):
+                if input_id not in active:
+                    state.pop(input_id, None)
+
+        # Without inputs the cycle falls back to the legacy channel list
+        if inputs:
+            channels = {self._hls_channel_id(i) for i in inputs if i.input_type in ('HTTP', 'HLS')}
+        else:
+            channels = set(self.config.channels)
+        for key in list(self.rendition_states):
+            if key[0] not in channels:
+                self.rendition_states.pop(key, None)
+
+    def _decode_worker_enabled(self, input_source: InputSource) -> bool:
+        """Whether the input's channel tier is selected for a persistent decode worker"""
+        tiers = self.config.decode_worker_tiers
+        if not tiers:
+            return False
+        if tiers == 'all':
+            return True
+        return str(input_source.tier) in {tier.strip() for tier in tiers.split(',')}
+
+    def _sync_decode_workers(self, udp_inputs: List[InputSource]):
+        """Create workers for newly eligible inputs and stop the others"""
+        wanted = {i.input_id: i for i in udp_inputs if self._decode_worker_enabled(i)}
+        for input_id in list(self.decode_workers):
+            if input_id not in wanted:
+                self.decode_workers.pop(input_id).stop()
+        for input_id, input_source in wanted.items():
+            if input_id not in self.decode_workers:
+                self.decode_workers[input_id] = DecodeWorker(
+                    input_source,
+                    frame_interval=self.config.decode_worker_frame_interval,
+                    cpu_budget_percent=self.config.decode_worker_cpu_percent
+                )
 
-    def _analyze_stream_with_ffprobe(self, input_source: InputSource, ts_data: bytes) -> tuple:
+    def _native_codec_fields(self, input_source: InputSource, bitrate_mbps: float) -> tuple:
+        """CodecInfo fields decoded in-process from the elementary stream headers
+
+        Returns (fields, complete); complete is True when the streams are fully
+        described without ffprobe.
+        """
+        demux = self._get_demux(input_source)
+        psi = demux.consumers['tr101290'].psi
+        es_config = demux.consumers['es_config']
+        pid_counter = demux.consumers['pids']
+        if not psi.pmt_complete:
+            return {}, False
+
+        fields = {}
+        video_pids = psi.pids_of_kind('video')
+        video = next((es_config.video[pid] for pid in video_pids if pid in es_config.video), None)
+        if video is not None:
+            fields.update(
+                video_codec=video.codec,
+                video_profile=video.profile,
+                video_level=video.level,
+                video_resolution=f"{video.width}x{video.height}",
+                video_bitrate_kbps=bitrate_mbps * pid_counter.share(video_pids) * 1000
+            )
+            if video.fps:
+                fields['video_fps'] = f"{video.fps:.2f}"
+
+        audio_pids = psi.pids_of_kind('audio')
+        audio = next((es_config.audio[pid] for pid in audio_pids if pid in es_config.audio), None)
+        if audio is not None:
+            fields.update(
+                audio_codec=audio.codec,
+                audio_channels=audio.layout,
+                audio_sample_rate=f"{audio.sample_rate} Hz",
+                audio_atmos=audio.atmos
+            )
+            if audio.samples:
+                fields['audio_bitrate_kbps'] = audio.bitrate_kbps
+
+        video_complete = not video_pids or (video is not None and video.fps is not None)
+        audio_complete = not audio_pids or audio is not None
+        return fields, video_complete and audio_complete
+
+    def _stream_signature(self, input_source: InputSource) -> Optional[tuple]:
+        """PMT versions, PID/stream_type set and codec header hash (None until the PMT is known)"""
+        demux = self._get_demux(input_source)
+        psi = demux.consumers['tr101290'].psi
+        if not psi.pmt_complete:
+            return None
+        return psi.signature + (demux.consumers['es_config'].signature(),)
+
+    def _get_demux(self, input_source: InputSource) -> TSDemux:
+        """Get (or create) the persistent TS demux and its consumers for an input"""
+        demux = self.demuxers.get(input_source.input_id)
+        if demux is None:
+            demux = TSDemux(input_source.input_name)
+            demux.register('tr101290', TR101290Analyzer(input_source, engine=self.config.tr101290_engine))
+            demux.register('pids', PIDCounter())
+            demux.register('es_config', ESConfigTracker(demux.consumers['tr101290'].psi))
+            demux.register('keyframe', KeyframeBuffer(demux.consumers['tr101290'].psi))
+            self.demuxers[input_source.input_id] = demux
+        return demux
+
+    def _get_tr101290_analyzer(self, input_source: InputSource) -> TR101290Analyzer:
+        """Get the persistent TR 101 290 analyzer for an input"""
+        return self._get_demux(input_source).consumers['tr101290']
+
+    def _audio_channels(self, input_source: InputSource) -> int:
+        """Channel count of the first audio stream (from its frame headers), stereo if unknown"""
+        demux = self._get_demux(input_source)
+        es_config = demux.consumers['es_config']
+        for pid in demux.consumers['tr101290'].psi.pids_of_kind('audio'):
+            if pid in es_config.audio:
+                return es_config.audio[pid].channels
+        return 2
+
+    def _analyze_stream_with_ffprobe(self, input_source: InputSource, ts_data: bytes,
+                                     bitrate_mbps: float = 0.0, contiguous: bool = False) -> tuple:
         """Analyze stream using ffprobe to get codec info and audio loudness"""
         codec_info = CodecInfo(
             input_id=input_source.input_id,
@@ -533,139 +4584,169 @@ class PackagerMonitor:
         )
 
         try:
-            # Save TS data to temporary file for ffprobe analysis
-            with tempfile.NamedTemporaryFile(suffix='.ts', delete=False) as temp_file:
-                temp_file.write(ts_data)
-                temp_path = temp_file.name
+            # Codec info decoded in-process; ffprobe only fills what is missing, and only
+            # when the stream signature changes or the TTL expires
+            native_fields, native_complete = self._native_codec_fields(input_source, bitrate_mbps)
+            signature = self._stream_signature(input_source)
+            cached = self.codec_cache.get(input_source.input_id)
+            probe_codecs = not native_complete and (
+                signature is None or cached is None or cached.signature != signature or
+                time.monotonic() - cached.probed_at > self.config.codec_cache_ttl
+            )
 
-            try:
-                # Run ffprobe to get stream information
-                ffprobe_cmd = [
+            # Stream the capture over stdin to ffprobe (stream info) and, concurrently,
+            # to ffmpeg decoding the audio to PCM for the loudness meter - nothing is written to disk
+            commands = {}
+            if probe_codecs:
+                commands['ffprobe'] = ([
                     'ffprobe',
                     '-v', 'quiet',
                     '-print_format', 'json',
                     '-show_streams',
                     '-show_format',
-                    temp_path
-                ]
-
-                result = subprocess.run(
-                    ffprobe_cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-
-                if result.returncode == 0:
-                    data = json.loads(result.stdout)
-                    streams = data.get('streams', [])
-
-                    # Parse video stream
-                    video_stream = next((s for s in streams if s.get('codec_type') == 'video'), None)
-                    if video_stream:
-                        codec_info.video_codec = video_stream.get('codec_name', 'Unknown')
-                        codec_info.video_profile = video_stream.get('profile', 'Unknown')
-                        codec_info.video_level = str(video_stream.get('level', 'Unknown'))
-
-                        width = video_stream.get('width', 0)
-                        height = video_stream.get('height', 0)
-                        codec_info.video_resolution = f"{width}x{height}" if width and height else "Unknown"
-
-                        # Parse FPS
-                        fps_str = video_stream.get('r_frame_rate', '0/1')
-                        if '/' in fps_str:
-                            num, den = fps_str.split('/')
-                            if int(den) > 0:
-                                codec_info.video_fps = f"{int(num) / int(den):.2f}"
-
-                        # Bitrate
-                        bitrate = video_stream.get('bit_rate')
-                        if bitrate:
-                            codec_info.video_bitrate_kbps = int(bitrate) / 1000
-                            qoe_metrics.video_bitrate_mbps = int(bitrate) / 1_000_000
-
-                        qoe_metrics.video_pid_active = True
-
-                    # Parse audio stream
-                    audio_stream = next((s for s in streams if s.get('codec_type') == 'audio'), None)
-                    if audio_stream:
-                        codec_info.audio_codec = audio_stream.get('codec_name', 'Unknown')
-
-                        # Channels
-                        channels = audio_stream.get('channels', 0)
-                        channel_layout = audio_stream.get('channel_layout', '')
-                        if channel_layout:
-                            codec_info.audio_channels = channel_layout
-                        elif channels == 2:
-                            codec_info.audio_channels = "stereo"
-                        elif channels == 1:
-                            codec_info.audio_channels = "mono"
-                        elif channels == 6:
-                            codec_info.audio_channels = "5.1"
-                        else:
-                            codec_info.audio_channels = f"{channels} ch"
-
-                        # Sample rate
-                        sample_rate = audio_stream.get('sample_rate')
-                        if sample_rate:
-                            codec_info.audio_sample_rate = f"{int(sample_rate)} Hz"
-
-                        # Bitrate
-                        bitrate = audio_stream.get('bit_rate')
-                        if bitrate:
-                            codec_info.audio_bitrate_kbps = int(bitrate) / 1000
-                            qoe_metrics.audio_bitrate_kbps = int(bitrate) / 1000
-
-                        qoe_metrics.audio_pid_active = True
-
-                # Run ffmpeg with ebur128 filter for LUFS analysis
-                if qoe_metrics.audio_pid_active:
-                    ffmpeg_cmd = [
-                        'ffmpeg',
-                        '-i', temp_path,
-                        '-t', '5',  # Analyze first 5 seconds
-                        '-af', 'ebur128=framelog=verbose',
-                        '-f', 'null',
-                        '-'
-                    ]
-
-                    result = subprocess.run(
-                        ffmpeg_cmd,
-                        capture_output=True,
-                        text=True,
-                        timeout=15
+                    '-f', 'mpegts',
+                    '-i', 'pipe:0'
+                ], 10)
+
+            # Loudness only when the PMT announces audio (or is not parsed yet) and
+            # no persistent decode worker is already measuring it. Only listener report
+            # windows are decoded: a one-shot probe window (~70 ms, never contiguous)
+            # cannot fill a single 400 ms gating block.
+            psi = self._get_tr101290_analyzer(input_source).psi
+            worker = self.decode_workers.get(input_source.input_id)
+            if worker is None and self.config.udp_mode == 'listener' and \
+                    (psi.pids_of_kind('audio') or not psi.pmt_complete):
+                channels = self._audio_channels(input_source)
+                commands['pcm'] = ([
+                    'ffmpeg',
+                    '-hide_banner',
+                    '-loglevel', 'error',
+                    '-f', 'mpegts',
+                    '-i', 'pipe:0',
+                    '-map', '0:a:0',
+                    '-ac', str(channels),
+                    '-ar', '48000',
+                    '-f', 'f32le',
+                    'pipe:1'
+                ], 15)
+
+            # Black/freeze detection only runs in a persistent decode worker: a probe or
+            # report window is too short to decode on its own and restarts at a keyframe
+            detector = worker.detector if worker is not None and worker.has_video and not worker.audio_only \
+                else None
+
+            results = run_piped(commands, ts_data, binary=('pcm',))
+
+            returncode, stdout, _ = results.get('ffprobe', (None, '', ''))
+            if returncode == 0:
+                data = json.loads(stdout)
+                streams = data.get('streams', [])
+
+                # Parse video stream
+                video_stream = next((s for s in streams if s.get('codec_type') == 'video'), None)
+                if video_stream:
+                    codec_info.video_codec = video_stream.get('codec_name', 'Unknown')
+                    codec_info.video_profile = video_stream.get('profile', 'Unknown')
+                    codec_info.video_level = str(video_stream.get('level', 'Unknown'))
+
+                    width = video_stream.get('width', 0)
+                    height = video_stream.get('height', 0)
+                    codec_info.video_resolution = f"{width}x{height}" if width and height else "Unknown"
+
+                    # Parse FPS
+                    fps_str = video_stream.get('r_frame_rate', '0/1')
+                    if '/' in fps_str:
+                        num, den = fps_str.split('/')
+                        if int(den) > 0:
+                            codec_info.video_fps = f"{int(num) / int(den):.2f}"
+
+                    # Bitrate
+                    bitrate = video_stream.get('bit_rate')
+                    if bitrate:
+                        codec_info.video_bitrate_kbps = int(bitrate) / 1000
+                        qoe_metrics.video_bitrate_mbps = int(bitrate) / 1_000_000
+
+                    qoe_metrics.video_pid_active = True
+
+                # Parse audio stream
+                audio_stream = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+                if audio_stream:
+                    codec_info.audio_codec = audio_stream.get('codec_name', 'Unknown')
+
+                    # Channels
+                    probe_channels = audio_stream.get('channels', 0)
+                    channel_layout = audio_stream.get('channel_layout', '')
+                    if channel_layout:
+                        codec_info.audio_channels = channel_layout
+                    elif probe_channels == 2:
+                        codec_info.audio_channels = "stereo"
+                    elif probe_channels == 1:
+                        codec_info.audio_channels = "mono"
+                    elif probe_channels == 6:
+                        codec_info.audio_channels = "5.1"
+                    else:
+                        codec_info.audio_channels = f"{probe_channels} ch"
+
+                    # Sample rate
+                    sample_rate = audio_stream.get('sample_rate')
+                    if sample_rate:
+                        codec_info.audio_sample_rate = f"{int(sample_rate)} Hz"
+
+                    # Bitrate
+                    bitrate = audio_stream.get('bit_rate')
+                    if bitrate:
+                        codec_info.audio_bitrate_kbps = int(bitrate) / 1000
+                        qoe_metrics.audio_bitrate_kbps = int(bitrate) / 1000
+
+                    qoe_metrics.audio_pid_active = True
+
+                if signature is not None:
+                    self.codec_cache[input_source.input_id] = CodecCacheEntry(
+                        signature=signature,
+                        codec_info=codec_info,
+                        probed_at=time.monotonic(),
+                        pushed=cached.pushed if cached else None
                     )
 
-                    # Parse LUFS from ffmpeg output
-                    output = result.stderr
-                    for line in output.split('\n'):
-                        if 'I:' in line and 'LUFS' in line:
-                            # Extract integrated loudness
-                            parts = line.split('I:')
-                            if len(parts) > 1:
-                                lufs_str = parts[1].split('LUFS')[0].strip()
-                                try:
-                                    qoe_metrics.audio_loudness_lufs = float(lufs_str)
-                                    qoe_metrics.audio_loudness_i = float(lufs_str)
-                                except ValueError:
-                                    pass
-
-                        if 'LRA:' in line and 'LU' in line:
-                            # Extract loudness range
-                            parts = line.split('LRA:')
-                            if len(parts) > 1:
-                                lra_str = parts[1].split('LU')[0].strip()
-                                try:
-                                    qoe_metrics.audio_loudness_lra = float(lra_str)
-                                except ValueError:
-                                    pass
-
-            finally:
-                # Clean up temp file
-                try:
-                    os.unlink(temp_path)
-                except:
-                    pass
+            elif not probe_codecs:
+                # Unchanged stream: reuse the cached codec info, activity from PID accounting
+                if cached is not None:
+                    codec_info = replace(cached.codec_info, timestamp=codec_info.timestamp)
+                pid_counter = self._get_demux(input_source).consumers['pids']
+                qoe_metrics.video_pid_active = pid_counter.share(psi.pids_of_kind('video')) > 0
+                qoe_metrics.audio_pid_active = pid_counter.share(psi.pids_of_kind('audio')) > 0
+
+            # Fields decoded from the elementary streams take precedence over ffprobe's
+            for name, value in native_fields.items():
+                setattr(codec_info, name, value)
+            if not probe_codecs:
+                qoe_metrics.video_bitrate_mbps = codec_info.video_bitrate_kbps / 1000
+                qoe_metrics.audio_bitrate_kbps = codec_info.audio_bitrate_kbps
+
+            # Loudness: the persistent decoder's meter, or this window's PCM fed to a
+            # per-input meter so integrated loudness and LRA build up across windows
+            meter = worker.meter if worker is not None else None
+            returncode, pcm, _ = results.get('pcm', (None, b'', ''))
+            if meter is None and returncode == 0 and len(pcm) >= 4 * channels:
+                meter = self.loudness_meters.get(input_source.input_id)
+                if meter is None or meter.channels != channels:
+                    meter = self.loudness_meters[input_source.input_id] = LoudnessMeter(48000, channels)
+                usable = len(pcm) - len(pcm) % (4 * channels)
+                meter.feed(np.frombuffer(pcm[:usable], dtype='<f4').reshape(-1, channels), contiguous)
+
+            if detector is not None:
+                qoe_metrics.black_frames_detected, qoe_metrics.freeze_frames_detected = detector.take()
+                qoe_metrics.black_run_ms = detector.black_run_ms
+                qoe_metrics.freeze_run_ms = detector.freeze_run_ms
+
+            if meter is not None:
+                loudness = meter.values()
+                if loudness['short_term'] is not None:
+                    qoe_metrics.audio_loudness_lufs = loudness['short_term']
+                if loudness['integrated'] is not None:
+                    qoe_metrics.audio_loudness_i = loudness['integrated']
+                if loudness['lra'] is not None:
+                    qoe_metrics.audio_loudness_lra = loudness['lra']
 
         except Exception as e:
             logger.error(f"Error analyzing stream with ffprobe for {input_source.input_name}: {e}")
@@ -677,30 +4758,29 @@ class PackagerMonitor:
         try:
             if input_source.input_type == 'MPEGTS_UDP':
                 self._probe_mpegts_udp(input_source)
+                self._push_input_health(input_source)
             elif input_source.input_type in ['HTTP', 'HLS']:
                 # Use existing HLS monitoring for HTTP/HLS inputs
-                self.monitor_channel(input_source.channel_name or f"input_{input_source.input_id}")
+                self.monitor_channel(self._hls_channel_id(input_source))
             else:
                 logger.warning(f"Unsupported input type: {input_source.input_type} for {input_source.input_name}")
 
         except Exception as e:
             logger.error(f"Error monitoring input {input_source.input_name}: {e}", exc_info=True)
 
+    @staticmethod
+    def _hls_channel_id(input_source: InputSource) -> str:
+        return input_source.channel_name or f"input_{input_source.input_id}"
+
     def _probe_mpegts_udp(self, input_source: InputSource):
         """Probe MPEGTS UDP input by joining multicast group and receiving packets"""
         errors = []
         packets_received = 0
         bytes_received = 0
-        is_valid = False
 
         # Parse UDP URL (e.g., udp://225.3.3.42:30130)
         try:
-            url_parts = input_source.input_url.replace('udp://', '').split(':')
-            if len(url_parts) != 2:
-                raise ValueError(f"Invalid UDP URL format: {input_source.input_url}")
-
-            multicast_group = url_parts[0]
-            port = int(url_parts[1])
+            multicast_group, port = parse_udp_url(input_source.input_url)
 
         except Exception as e:
             errors.append(f"Failed to parse UDP URL: {e}")
@@ -710,8 +4790,8 @@ class PackagerMonitor:
                 input_name=input_source.input_name,
                 packets_received=0,
                 bytes_received=0,
-                duration_sec=0,
-                bitrate_mbps=0,
+                duration_sec=0.0,
+                bitrate_mbps=0.0,
                 is_valid=False,
                 errors=errors,
                 timestamp=datetime.utcnow()
@@ -731,60 +4811,134 @@ class PackagerMonitor:
             mreq = struct.pack("4sl", socket.inet_aton(multicast_group), socket.INADDR_ANY)
             sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
 
-            # Set timeout
-            sock.settimeout(self.config.udp_timeout)
+            sock.setblocking(False)
 
             logger.debug(f"Probing UDP stream {input_source.input_name} at {multicast_group}:{port}")
 
-            start_time = time.time()
-            ts_packet_count = 0
-            ts_data_buffer = bytearray()  # Collect TS data for TR 101 290 analysis
+            # Preallocated per-input receive buffer, reused every cycle
+            ring = self.capture_rings.get(input_source.input_id)
+            if ring is None:
+                ring = CaptureRing(self.config.min_ts_packets * DATAGRAM_SLOT_SIZE)
+                self.capture_rings[input_source.input_id] = ring
+            ring.attach(sock, self.config.udp_kernel_timestamps)
+            ring.reset()
 
-            # MDI tracking
-            packet_timestamps = []  # Track packet arrival times for jitter calculation
-            packet_sizes = []  # Track packet sizes
-            last_seq = -1  # Track sequence for packet loss detection
-            packets_lost = 0
-            packets_out_of_order = 0
+            start_time = time.time()
 
-            # Receive packets for the duration of the timeout
-            while True:
+            # Receive packets until the minimum is reached or the stream goes quiet for udp_timeout
+            while ring.packets_received + ring.truncated < self.config.min_ts_packets:
                 try:
-                    packet_recv_time = time.time()
-                    data, addr = sock.recvfrom(self.config.udp_buffer_size)
-                    packets_received += 1
-                    bytes_received += len(data)
-
-                    # Track timing for MDI
-                    packet_timestamps.append(packet_recv_time)
-                    packet_sizes.append(len(data))
-
-                    # Collect TS data for analysis
-                    ts_data_buffer.extend(data)
-
-                    # Validate TS packets (each should be 188 bytes and start with 0x47)
-                    if len(data) % 188 == 0:
-                        for i in range(0, len(data), 188):
-                            if data[i] == 0x47:  # TS sync byte
-                                ts_packet_count += 1
-
-                    # Stop after receiving minimum packets or timeout
-                    if packets_received >= self.config.min_ts_packets:
+                    readable, _, _ = select.select([sock], [], [], self.config.udp_timeout)
+                    if not readable:
                         break
-
-                except socket.timeout:
-                    break
+                    ring.receive(sock)
                 except Exception as e:
                     errors.append(f"Error receiving packets: {e}")
                     break
 
             duration = time.time() - start_time
+            ts_data, packet_timestamps, packet_sizes, _, truncated = ring.swap()
+            if truncated:
+                errors.append(f"{truncated} datagrams larger than {ring.datagram_size} bytes discarded")
+            packets_received = len(packet_sizes)
+            bytes_received = len(ts_data)
+
+        except Exception as e:
+            errors.append(f"UDP probe error: {e}")
+            logger.error(f"Error probing UDP stream {input_source.input_name}: {e}", exc_info=True)
+            self._push_udp_probe_metric(UDPProbeMetric(
+                input_id=input_source.input_id,
+                input_name=input_source.input_name,
+                packets_received=packets_received,
+                bytes_received=bytes_received,
+                duration_sec=0.0,
+                bitrate_mbps=0.0,
+                is_valid=False,
+                errors=errors,
+                timestamp=datetime.utcnow()
+            ))
+            return
+
+        finally:
+            if sock:
+                try:
+                    sock.close()
+                except:
+                    pass
+
+        # A fresh socket per probe: the capture never continues the previous one
+        self._process_udp_capture(input_source, UDPCapture(
+            ts_data=ts_data,
+            packet_timestamps=packet_timestamps,
+            packet_sizes=packet_sizes,
+            packets_received=packets_received,
+            bytes_received=bytes_received,
+            duration_sec=duration,
+            contiguous=False,
+            errors=errors,
+            clock_source=ring.clock_source
+        ))
+
+    def _on_listener_capture(self, listener: MulticastListener, capture: UDPCapture):
+        """Listener loop callback: analyze the drained window on the executor"""
+        try:
+            self.executor.submit(self._process_listener_capture, listener, capture)
+        except Exception as e:
+            listener.busy = False
+            logger.error(f"Error scheduling listener capture for {listener.input_source.input_name}: {e}")
+
+    def _process_listener_capture(self, listener: MulticastListener, capture: UDPCapture):
+        """Analyze a capture drained from a long-lived listener (runs on the executor)"""
+        try:
+            self._process_udp_capture(listener.input_source, capture)
+        finally:
+            listener.busy = False
+
+    def _process_udp_capture(self, input_source: InputSource, capture: UDPCapture):
+        """Validate, analyze and push metrics for one UDP capture window"""
+        errors = list(capture.errors or [])
+        packets_received = capture.packets_received
+        bytes_received = capture.bytes_received
+        duration = capture.duration_sec
+        ts_data_buffer = capture.ts_data
+        packets_lost = 0
+        packets_out_of_order = 0
+        is_valid = False
+        rtp_stats = None
+
+        try:
+            # RTP-encapsulated TS: strip headers and analyze sequence numbers/timestamps
+            if detect_rtp(ts_data_buffer, capture.packet_sizes):
+                tracker = self.rtp_trackers.setdefault(input_source.input_id, RTPTracker())
+                ts_data_buffer, rtp_stats = tracker.process(
+                    ts_data_buffer, capture.packet_timestamps, capture.packet_sizes, capture.contiguous
+                )
+                packets_lost = rtp_stats.packets_lost
+                packets_out_of_order = rtp_stats.packets_out_of_order
+
+            # Demux once: every analyzer consumes the same parsed headers.
+            # `contiguous` is only set when this window directly follows the previous one.
+            batch = self._get_demux(input_source).feed(ts_data_buffer, contiguous=capture.contiguous)
+
+            # Validate TS packets (each should start with the 0x47 sync byte)
+            ts_packet_count = batch.synced_packets
+
+            # Persistent decoder: feed the window once the PMT tells which streams to map
+            worker = self.decode_workers.get(input_source.input_id)
+            if worker is not None:
+                psi = self._get_tr101290_analyzer(input_source).psi
+                if psi.pmt_complete:
+                    worker.feed(
+                        ts_data_buffer, bool(psi.pids_of_kind('audio')), bool(psi.pids_of_kind('video')),
+                        self._audio_channels(input_source)
+                    )
+                    self._push_decode_worker_metrics(input_source, worker)
 
             # Calculate bitrate
             if duration > 0:
                 bitrate_mbps = (bytes_received * 8) / (duration * 1_000_000)
             else:
-                bitrate_mbps = 0
+                bitrate_mbps = 0.0
 
             # Validate results
             if packets_received >= self.config.min_ts_packets and ts_packet_count > 0:
@@ -819,8 +4973,9 @@ class PackagerMonitor:
             # Analyze TR 101 290 errors if we have valid data
             if is_valid and len(ts_data_buffer) > 0:
                 try:
-                    tr_metrics = self._analyze_tr101290(bytes(ts_data_buffer), input_source)
-                    self._push_tr101290_metrics(tr_metrics)
+                    analyzer = self._get_tr101290_analyzer(input_source)
+                    tr_metrics = analyzer.metrics
+                    self._push_tr101290_metrics(tr_metrics, analyzer.cumulative)
                     logger.debug(f"TR 101 290 analysis for {input_source.input_name}: "
                                f"P1 errors: sync={tr_metrics.sync_byte_error}, "
                                f"cc={tr_metrics.continuity_count_error}, "
@@ -832,9 +4987,11 @@ class PackagerMonitor:
                 # Calculate MDI metrics
                 try:
                     mdi_metrics = self._calculate_mdi_metrics(
-                        input_source, packet_timestamps, packet_sizes,
+                        input_source, capture.packet_timestamps, capture.packet_sizes,
                         packets_received, packets_lost, packets_out_of_order,
-                        bytes_received, duration, bitrate_mbps
+                        bytes_received, duration, bitrate_mbps,
+                        clock_source=capture.clock_source, rtp_stats=rtp_stats,
+                        ts_packet_count=ts_packet_count
                     )
                     self._push_mdi_metrics(mdi_metrics)
                     logger.debug(f"MDI for {input_source.input_name}: "
@@ -847,7 +5004,7 @@ class PackagerMonitor:
                 # Analyze codecs and calculate QoE metrics with ffprobe
                 try:
                     codec_info, qoe_metrics = self._analyze_stream_with_ffprobe(
-                        input_source, bytes(ts_data_buffer)
+                        input_source, ts_data_buffer, bitrate_mbps, capture.contiguous
                     )
 
                     # Calculate MOS based on TR 101 290 errors, bitrate, and packet loss
@@ -855,7 +5012,7 @@ class PackagerMonitor:
                         tr_metrics, bitrate_mbps, packets_lost, packets_received
                     )
 
-                    self._push_codec_info(codec_info)
+                    self._push_codec_info_if_changed(codec_info)
                     self._push_qoe_metrics(qoe_metrics)
 
                     logger.info(f"Stream analysis for {input_source.input_name}: "
@@ -866,33 +5023,28 @@ class PackagerMonitor:
                     logger.error(f"Error analyzing stream for {input_source.input_name}: {e}")
 
         except Exception as e:
-            errors.append(f"UDP probe error: {e}")
-            logger.error(f"Error probing UDP stream {input_source.input_name}: {e}", exc_info=True)
+            errors.append(f"UDP capture processing error: {e}")
+            logger.error(f"Error processing UDP capture for {input_source.input_name}: {e}", exc_info=True)
             self._push_udp_probe_metric(UDPProbeMetric(
                 input_id=input_source.input_id,
                 input_name=input_source.input_name,
                 packets_received=packets_received,
                 bytes_received=bytes_received,
-                duration_sec=0,
-                bitrate_mbps=0,
+                duration_sec=0.0,
+                bitrate_mbps=0.0,
                 is_valid=False,
                 errors=errors,
                 timestamp=datetime.utcnow()
             ))
 
-        finally:
-            if sock:
-                try:
-                    sock.close()
-                except:
-                    pass
+        self._push_input_health(input_source)
 
         # Capture snapshot if enabled and sufficient time has passed
         if is_valid and self.config.enable_snapshots:
             self._capture_snapshot(input_source)
 
     def _capture_snapshot(self, input_source: InputSource):
-        """Capture snapshot/thumbnail from UDP stream using ffmpeg"""
+        """Save a snapshot/thumbnail decoded from the TS already buffered for the input"""
         # Check if we should take a snapshot (throttle by interval)
         current_time = time.time()
         last_snapshot = self.last_snapshot_times.get(input_source.input_id, 0)
@@ -902,51 +5054,80 @@ class PackagerMonitor:
             return
 
         try:
-            # Use ffmpeg to capture a frame from the UDP stream
-            output_file = os.path.join(
-                self.config.snapshot_dir,
-                f"input_{input_source.input_id}_{int(current_time)}.jpg"
-            )
-
-            # FFmpeg command to capture one frame from UDP stream
-            cmd = [
-                'ffmpeg',
-                '-hide_banner',
-                '-loglevel', 'error',
-                '-i', input_source.input_url,
-                '-frames:v', '1',
-                '-q:v', '2',
-                '-t', str(self.config.snapshot_duration),
-                '-y',
-                output_file
-            ]
-
-            logger.debug(f"Capturing snapshot for {input_source.input_name}: {' '.join(cmd)}")
-
-            # Run ffmpeg with timeout
-            result = subprocess.run(
-                cmd,
-                timeout=self.config.snapshot_duration + 5,
-                capture_output=True,
-                text=True
+            # A persistent decode worker already has a recent frame - no extra decode
+            worker = self.decode_workers.get(input_source.input_id)
+            if worker is not None and worker.latest_frame and \
+                    current_time - worker.frame_time < self.config.snapshot_interval:
+                image = worker.latest_frame
+                source = "decode worker frame"
+            else:
+                # Otherwise decode the last buffered keyframe: no second multicast join,
+                # no waiting for the next random-access point
+                keyframes = self._get_demux(input_source).consumers['keyframe']
+                if keyframes.keyframe is None or \
+                        current_time - keyframes.keyframe_time > self.config.snapshot_interval:
+                    logger.debug(f"No recent keyframe buffered for {input_source.input_name}, skipping snapshot")
+                    return
+
+                returncode, image, stderr = run_piped({'snapshot': ([
+                    'ffmpeg',
+                    '-hide_banner',
+                    '-loglevel', 'error',
+                    '-f', 'mpegts',
+                    '-i', 'pipe:0',
+                    '-map', '0:v:0',
+                    '-frames:v', '1',
+                    '-c:v', 'mjpeg',
+                    '-q:v', '2',
+                    '-f', 'image2pipe',
+                    'pipe:1'
+                ], 10)}, keyframes.keyframe, binary=('snapshot',))['snapshot']
+                if returncode != 0 or not image:
+                    logger.warning(f"Failed to capture snapshot for {input_source.input_name}: {stderr}")
+                    return
+                source = "snapshot"
+
+            output_file = self.snapshot_store.publish(
+                input_source.input_id, image,
+                thumbnail=self._encode_thumbnail(image),
+                thumbnail_format=self.config.snapshot_thumbnail_format,
+                taken_at=current_time
             )
 
-            if result.returncode == 0 and os.path.exists(output_file):
-                # Update database with snapshot URL
-                self._update_input_snapshot(input_source.input_id, output_file)
-                self.last_snapshot_times[input_source.input_id] = current_time
-                logger.info(f"Captured snapshot for {input_source.input_name}: {output_file}")
-            else:
-                logger.warning(
-                    f"Failed to capture snapshot for {input_source.input_name}: "
-                    f"{result.stderr}"
-                )
+            # Update database with snapshot URL
+            self._update_input_snapshot(input_source.input_id, output_file)
+            self.last_snapshot_times[input_source.input_id] = current_time
+            logger.info(f"Captured {source} for {input_source.input_name}: {output_file}")
 
-        except subprocess.TimeoutExpired:
-            logger.warning(f"Snapshot capture timeout for {input_source.input_name}")
         except Exception as e:
             logger.error(f"Error capturing snapshot for {input_source.input_name}: {e}")
 
+    def _encode_thumbnail(self, image: bytes) -> Optional[bytes]:
+        """Small WebP/JPEG variant of a JPEG snapshot, encoded once when it is published"""
+        encoders = {
+            'webp': ['-c:v', 'libwebp', '-quality', '75', '-f', 'webp'],
+            'jpg': ['-c:v', 'mjpeg', '-q:v', '5', '-f', 'image2pipe'],
+        }
+        if self.config.snapshot_thumbnail_format not in encoders:
+            return None
+
+        cmd = [
+            'ffmpeg',
+            '-hide_banner',
+            '-loglevel', 'error',
+            '-f', 'image2pipe',
+            '-c:v', 'mjpeg',
+            '-i', 'pipe:0',
+            '-vf', f'scale={self.config.snapshot_thumbnail_width}:-2',
+            '-frames:v', '1'
+        ] + encoders[self.config.snapshot_thumbnail_format] + ['pipe:1']
+
+        returncode, thumbnail, stderr = run_piped({'thumbnail': (cmd, 5)}, image, binary=('thumbnail',))['thumbnail']
+        if returncode != 0 or not thumbnail:
+            logger.debug(f"Thumbnail encoding failed: {stderr}")
+            return None
+        return thumbnail
+
     def _update_input_snapshot(self, input_id: int, snapshot_path: str):
         """Update input record with snapshot URL and timestamp"""
         if not self.db_conn:
@@ -966,12 +5147,35 @@ class PackagerMonitor:
             logger.error(f"Error updating snapshot in database: {e}")
             self.db_conn.rollback()
 
+    def monitor_channels(self, channel_ids: List[str]):
+        """Monitor HLS channels concurrently: every rendition and segment of every channel in one event loop"""
+        if channel_ids:
+            asyncio.run(self._crawl_channels(channel_ids))
+
     def monitor_channel(self, channel_id: str):
         """Monitor single channel"""
+        self.monitor_channels([channel_id])
+
+    async def _crawl_channels(self, channel_ids: List[str]):
+        session = CrawlSession(self.http, self.fetch_executor,
+                               self.config.hls_concurrency, self.config.hls_host_concurrency)
+        started = time.monotonic()
+        await asyncio.gather(*(self._crawl_channel(channel_id, session) for channel_id in channel_ids))
+        logger.debug(f"Crawled {len(channel_ids)} HLS channels in {time.monotonic() - started:.1f}s")
+
+    async def _crawl_channel(self, channel_id: str, session: CrawlSession):
+        """One channel under its deadline; a late channel is reported, the others are not held up"""
+        try:
+            await asyncio.wait_for(self._monitor_channel(channel_id, session), self.config.hls_channel_deadline)
+        except asyncio.TimeoutError:
+            logger.error(f"Monitoring {channel_id} exceeded its {self.config.hls_channel_deadline:g}s deadline")
+            self._push_channel_error(channel_id, f"Deadline exceeded ({self.config.hls_channel_deadline:g}s)")
+
+    async def _monitor_channel(self, channel_id: str, session: CrawlSession):
         try:
             # 1. Get master playlist
             master_url = f"{self.config.packager_url}/live/{channel_id}/master.m3u8"
-            resp = requests.get(master_url, timeout=10)
+            resp = await session.get(master_url)
             resp.raise_for_status()
             
             master = m3u8.loads(resp.text)
@@ -980,10 +5184,15 @@ class PackagerMonitor:
             abr_info = self._extract_abr_ladder(channel_id, master)
             self._push_abr_ladder_metrics(abr_info)
             
-            # 3. Validate each rendition
-            for variant in master.variants:
-                rung_id = self._extract_rung_id(variant.uri)
-                self._monitor_rendition(channel_id, rung_id, variant)
+            # 3. Validate all renditions concurrently
+            rungs = {self._extract_rung_id(variant.uri): variant for variant in master.playlists}
+            for key in list(self.rendition_states):
+                if key[0] == channel_id and key[1] not in rungs:
+                    self.rendition_states.pop(key, None)  # Rung left the ladder
+            await asyncio.gather(*(
+                self._monitor_rendition(channel_id, rung_id, variant, session)
+                for rung_id, variant in rungs.items()
+            ))
         
         except requests.exceptions.RequestException as e:
             logger.error(f"Network error monitoring {channel_id}: {e}")
@@ -992,20 +5201,47 @@ class PackagerMonitor:
             logger.error(f"Error monitoring {channel_id}: {e}", exc_info=True)
             self._push_channel_error(channel_id, f"Parsing error: {str(e)}")
     
-    def _monitor_rendition(self, channel_id: str, rung_id: str, variant):
-        """Monitor single rendition (quality rung)"""
+    async def _monitor_rendition(self, channel_id: str, rung_id: str, variant, session: CrawlSession):
+        """Monitor single rendition (quality rung)
+
+        The playlist is requested with the previous cycle's validators, so an
+        unchanged playlist costs a 304 and is not parsed or validated again.
+        Only segments that appeared since the previous cycle are sampled.
+        """
+        state = self.rendition_states.setdefault((channel_id, rung_id), RenditionState())
         try:
-            # Get variant playlist
+            # Get variant playlist (conditional GET)
             playlist_url = f"{self.config.packager_url}{variant.uri}"
-            resp = requests.get(playlist_url, timeout=10)
-            resp.raise_for_status()
+            resp = await session.get(playlist_url, headers=state.conditional_headers())
             
-            playlist = m3u8.loads(resp.text)
+            not_modified = state.playlist is not None and (
+                resp.status_code == 304 or (resp.ok and resp.text == state.body)
+            )
+            if not_modified:
+                validation = replace(state.validation, last_updated=datetime.utcnow())
+            else:
+                resp.raise_for_status()
+                playlist = m3u8.loads(resp.text)
+                
+                # Validate playlist structure
+                validation = self._validate_playlist(channel_id, rung_id, playlist)
+                state.etag = resp.headers.get('ETag')
+                state.last_modified = resp.headers.get('Last-Modified')
+                state.body = resp.text
+                state.playlist = playlist
+                state.validation = validation
+            playlist = state.playlist
             
-            # Validate playlist structure
-            validation = self._validate_playlist(channel_id, rung_id, playlist)
             self._push_playlist_validation(validation)
             
+            freshness = self._track_freshness(channel_id, rung_id, playlist, state, not_modified)
+            self._push_playlist_freshness(freshness)
+            if freshness.is_stalled:
+                logger.warning(
+                    f"Playlist {channel_id}/{rung_id} stalled: no new segment for "
+                    f"{freshness.seconds_since_update:.0f}s (media sequence {freshness.last_sequence})"
+                )
+            
             if not validation.is_valid:
                 logger.warning(
                     f"Playlist validation failed for {channel_id}/{rung_id}: "
@@ -1013,12 +5249,69 @@ class PackagerMonitor:
                 )
                 return
             
-            # Sample latest segments
-            self._sample_segments(channel_id, rung_id, playlist, variant)
+            # Sample the segments that are new since the previous cycle
+            await self._sample_segments(channel_id, rung_id, self._new_segments(playlist, state), variant, session, state)
         
         except Exception as e:
             logger.error(f"Error monitoring rendition {channel_id}/{rung_id}: {e}")
     
+    def _track_freshness(self, channel_id: str, rung_id: str, playlist, state: RenditionState,
+                         not_modified: bool) -> PlaylistFreshness:
+        """Advance the rendition's newest media sequence and judge whether it is stalled
+
+        A live playlist is stalled when its newest segment is older than
+        `playlist_stall_target_durations` target durations. A playlist with
+        EXT-X-ENDLIST has ended and is never stalled.
+        """
+        now = time.monotonic()
+        media_sequence = playlist.media_sequence or 0
+        last_sequence = media_sequence + len(playlist.segments) - 1
+        new_segments = 0
+        
+        if state.last_sequence < 0 or last_sequence < state.last_sequence:
+            if state.last_sequence >= 0:
+                logger.warning(
+                    f"Media sequence of {channel_id}/{rung_id} went back from "
+                    f"{state.last_sequence} to {last_sequence} (packager restart?)"
+                )
+            state.advanced_at = now
+        elif last_sequence > state.last_sequence:
+            new_segments = last_sequence - state.last_sequence
+            state.advanced_at = now
+        state.last_sequence = last_sequence
+        
+        target_duration = playlist.target_duration or self.config.segment_duration_target
+        threshold = self.config.playlist_stall_target_durations * target_duration
+        age = now - state.advanced_at
+        
+        return PlaylistFreshness(
+            channel_id=channel_id,
+            rung_id=rung_id,
+            media_sequence=media_sequence,
+            last_sequence=last_sequence,
+            new_segments=new_segments,
+            seconds_since_update=age,
+            stall_threshold_sec=threshold,
+            is_stalled=not playlist.is_endlist and age > threshold,
+            not_modified=not_modified,
+            timestamp=datetime.utcnow()
+        )
+    
+    def _new_segments(self, playlist, state: RenditionState) -> list:
+        """(media sequence, segment) pairs not sampled yet, the newest `hls_sample_segments` of them
+
+        On first sight or after a media sequence reset every segment counts as
+        new. Older new segments beyond the limit are skipped, not queued.
+        """
+        media_sequence = playlist.media_sequence or 0
+        last_sequence = media_sequence + len(playlist.segments) - 1
+        if state.sampled_through < 0 or state.sampled_through > last_sequence:
+            first_new = 0
+        else:
+            first_new = max(state.sampled_through + 1 - media_sequence, 0)
+        first_new = max(first_new, len(playlist.segments) - self.config.hls_sample_segments)
+        return [(media_sequence + i, playlist.segments[i]) for i in range(first_new, len(playlist.segments))]
+    
     def _validate_playlist(self, channel_id: str, rung_id: str, playlist) -> PlaylistValidation:
         """Validate playlist structure"""
         errors = []
@@ -1055,7 +5348,7 @@ class PackagerMonitor:
                 )
         
         # Check for discontinuity
-        if playlist.is_discontinuity:
+        if any(seg.discontinuity for seg in playlist.segments):
             logger.warning(f"DISCONTINUITY detected in {channel_id}/{rung_id}")
         
         is_valid = len(errors) == 0
@@ -1070,49 +5363,63 @@ class PackagerMonitor:
             last_updated=datetime.utcnow()
         )
     
-    def _sample_segments(self, channel_id: str, rung_id: str, playlist, variant):
-        """Download and validate latest segments"""
-        if not playlist.segments:
+    async def _sample_segments(self, channel_id: str, rung_id: str, segments: list, variant,
+                               session: CrawlSession, state: RenditionState):
+        """Download and validate (media sequence, segment) pairs concurrently
+
+        `state.sampled_through` only moves past segments that were fetched: it
+        stops just before the oldest failure, so that one is retried next cycle
+        while it is still among the newest new segments.
+        """
+        if not segments:
             return
         
-        # Sample latest 2 segments
-        for seg in playlist.segments[-2:]:
-            try:
-                seg_url = f"{self.config.packager_url}{variant.uri.rsplit('/', 1)[0]}/{seg.uri}"
-                
-                # Measure download time
-                start_time = time.time()
-                resp = requests.get(seg_url, timeout=10)
-                download_time = (time.time() - start_time) * 1000  # ms
-                
-                resp.raise_for_status()
-                
-                content = resp.content
-                content_hash = hashlib.md5(content).hexdigest()
-                
-                # Extract segment number
-                seg_number = int(seg.uri.split('-')[-1].split('.')[0])
-                
-                metric = SegmentMetric(
-                    channel_id=channel_id,
-                    rung_id=rung_id,
-                    segment_number=seg_number,
-                    duration=seg.duration or 0,
-                    size_bytes=len(content),
-                    download_time_ms=download_time,
-                    http_status=resp.status_code,
-                    content_hash=content_hash,
-                    timestamp=datetime.utcnow()
-                )
-                
-                # Validate segment
-                self._validate_segment(metric)
-                
-                # Push metric
-                self._push_segment_metric(metric)
+        fetched = await asyncio.gather(*(
+            self._sample_segment(channel_id, rung_id, seg, variant, session) for _, seg in segments
+        ))
+        failed = [sequence for (sequence, _), ok in zip(segments, fetched) if not ok]
+        state.sampled_through = failed[0] - 1 if failed else segments[-1][0]
+
+    async def _sample_segment(self, channel_id: str, rung_id: str, seg, variant, session: CrawlSession) -> bool:
+        """Download and validate one segment; False if it could not be fetched"""
+        fetched = False
+        try:
+            seg_url = f"{self.config.packager_url}{variant.uri.rsplit('/', 1)[0]}/{seg.uri}"
             
-            except Exception as e:
-                logger.error(f"Error sampling segment {seg.uri}: {e}")
+            # Download time excludes connection setup, which is reported separately
+            resp = await session.get(seg_url)
+            resp.raise_for_status()
+            fetched = True
+            
+            content = resp.content
+            content_hash = await session.run(lambda: hashlib.md5(content).hexdigest())
+            
+            # Extract segment number
+            seg_number = int(seg.uri.split('-')[-1].split('.')[0])
+            
+            metric = SegmentMetric(
+                channel_id=channel_id,
+                rung_id=rung_id,
+                segment_number=seg_number,
+                duration=seg.duration or 0,
+                size_bytes=len(content),
+                download_time_ms=resp.transfer_ms,
+                http_status=resp.status_code,
+                content_hash=content_hash,
+                timestamp=datetime.utcnow(),
+                connect_ms=resp.connect_ms,
+                attempts=resp.attempts
+            )
+            
+            # Validate segment
+            self._validate_segment(metric)
+            
+            # Push metric
+            self._push_segment_metric(metric)
+        
+        except Exception as e:
+            logger.error(f"Error sampling segment {seg.uri}: {e}")
+        return fetched
     
     def _validate_segment(self, metric: SegmentMetric):
         """Validate segment properties"""
@@ -1139,7 +5446,7 @@ class PackagerMonitor:
         rungs = []
         bitrates = []
         
-        for variant in master.variants:
+        for variant in master.playlists:
             rung_id = self._extract_rung_id(variant.uri)
             bitrate = variant.stream_info.bandwidth / 1000 if variant.stream_info.bandwidth else 0
             resolution = variant.stream_info.resolution or "unknown"
@@ -1174,15 +5481,7 @@ class PackagerMonitor:
     def _push_segment_metric(self, metric: SegmentMetric):
         """Push segment metric to InfluxDB"""
         try:
-            point = Point("segment_metric") \
-                .tag("channel", metric.channel_id) \
-                .tag("rung", metric.rung_id) \
-                .field("segment_number", metric.segment_number) \
-                .field("duration_sec", metric.duration) \
-                .field("size_bytes", metric.size_bytes) \
-                .field("download_time_ms", metric.download_time_ms) \
-                .field("http_status", metric.http_status) \
-                .time(metric.timestamp)
+            point = self.line_protocol.segment(metric)
             
             self.write_api.write(
                 bucket=self.config.influxdb_bucket,
@@ -1212,6 +5511,29 @@ class PackagerMonitor:
         except Exception as e:
             logger.error(f"Error pushing playlist validation: {e}")
     
+    def _push_playlist_freshness(self, freshness: PlaylistFreshness):
+        """Push live playlist freshness (media sequence progress and stall state)"""
+        try:
+            point = Point("playlist_freshness") \
+                .tag("channel", freshness.channel_id) \
+                .tag("rung", freshness.rung_id) \
+                .field("media_sequence", freshness.media_sequence) \
+                .field("last_sequence", freshness.last_sequence) \
+                .field("new_segments", freshness.new_segments) \
+                .field("seconds_since_update", float(freshness.seconds_since_update)) \
+                .field("stall_threshold_sec", float(freshness.stall_threshold_sec)) \
+                .field("is_stalled", int(freshness.is_stalled)) \
+                .field("not_modified", int(freshness.not_modified)) \
+                .time(freshness.timestamp)
+            
+            self.write_api.write(
+                bucket=self.config.influxdb_bucket,
+                org=self.config.influxdb_org,
+                record=point
+            )
+        except Exception as e:
+            logger.error(f"Error pushing playlist freshness: {e}")
+    
     def _push_abr_ladder_metrics(self, abr_info: ABRLadderInfo):
         """Push ABR ladder metrics"""
         try:
@@ -1249,88 +5571,40 @@ class PackagerMonitor:
     def _push_udp_probe_metric(self, metric: UDPProbeMetric):
         """Push UDP probe metric to InfluxDB"""
         try:
-            point = Point("udp_probe_metric") \
-                .tag("input_id", str(metric.input_id)) \
-                .tag("input_name", metric.input_name) \
-                .field("packets_received", metric.packets_received) \
-                .field("bytes_received", metric.bytes_received) \
-                .field("duration_sec", metric.duration_sec) \
-                .field("bitrate_mbps", metric.bitrate_mbps) \
-                .field("is_valid", int(metric.is_valid)) \
-                .field("error_count", len(metric.errors)) \
-                .time(metric.timestamp)
-
-            self.write_api.write(
-                bucket=self.config.influxdb_bucket,
-                org=self.config.influxdb_org,
-                record=point
-            )
+            if self.config.metrics_schema != 'narrow':
+                self._add_input_health(metric.input_id, 'udp_probe_metric', LineProtocolSerializer.UDP_PROBE, metric)
+            if self.config.metrics_schema != 'wide':
+                self.write_api.write(
+                    bucket=self.config.influxdb_bucket,
+                    org=self.config.influxdb_org,
+                    record=self.line_protocol.udp_probe(metric)
+                )
 
             logger.debug(f"Pushed UDP probe metric for {metric.input_name}: {metric.bitrate_mbps:.2f} Mbps")
 
         except Exception as e:
             logger.error(f"Error pushing UDP probe metric: {e}")
 
-    def _push_tr101290_metrics(self, metrics: TR101290Metrics):
-        """Push TR 101 290 metrics to InfluxDB"""
+    def _push_tr101290_metrics(self, metrics: TR101290Metrics, cumulative: TR101290Metrics = None):
+        """Push TR 101 290 metrics to InfluxDB (per-window deltas plus running totals)"""
         try:
-            # Push Priority 1 errors
-            p1_point = Point("tr101290_p1") \
-                .tag("input_id", str(metrics.input_id)) \
-                .tag("input_name", metrics.input_name) \
-                .field("ts_sync_loss", metrics.ts_sync_loss) \
-                .field("sync_byte_error", metrics.sync_byte_error) \
-                .field("pat_error", metrics.pat_error) \
-                .field("continuity_count_error", metrics.continuity_count_error) \
-                .field("pmt_error", metrics.pmt_error) \
-                .field("pid_error", metrics.pid_error) \
-                .field("total_p1_errors", metrics.ts_sync_loss + metrics.sync_byte_error +
-                       metrics.pat_error + metrics.continuity_count_error +
-                       metrics.pmt_error + metrics.pid_error) \
-                .time(metrics.timestamp)
-
-            # Push Priority 2 errors
-            p2_point = Point("tr101290_p2") \
-                .tag("input_id", str(metrics.input_id)) \
-                .tag("input_name", metrics.input_name) \
-                .field("transport_error", metrics.transport_error) \
-                .field("crc_error", metrics.crc_error) \
-                .field("pcr_error", metrics.pcr_error) \
-                .field("pcr_accuracy_error", metrics.pcr_accuracy_error) \
-                .field("pts_error", metrics.pts_error) \
-                .field("cat_error", metrics.cat_error) \
-                .field("total_p2_errors", metrics.transport_error + metrics.crc_error +
-                       metrics.pcr_error + metrics.pcr_accuracy_error +
-                       metrics.pts_error + metrics.cat_error) \
-                .time(metrics.timestamp)
-
-            # Push Priority 3 errors
-            p3_point = Point("tr101290_p3") \
-                .tag("input_id", str(metrics.input_id)) \
-                .tag("input_name", metrics.input_name) \
-                .field("nit_error", metrics.nit_error) \
-                .field("si_repetition_error", metrics.si_repetition_error) \
-                .field("unreferenced_pid", metrics.unreferenced_pid) \
-                .field("total_p3_errors", metrics.nit_error + metrics.si_repetition_error +
-                       metrics.unreferenced_pid) \
-                .time(metrics.timestamp)
-
-            # Push metadata
-            meta_point = Point("tr101290_metadata") \
-                .tag("input_id", str(metrics.input_id)) \
-                .tag("input_name", metrics.input_name) \
-                .field("total_packets", metrics.total_packets) \
-                .field("pat_received", int(metrics.pat_received)) \
-                .field("pmt_received", int(metrics.pmt_received)) \
-                .field("pcr_interval_ms", metrics.pcr_interval_ms) \
-                .time(metrics.timestamp)
-
-            # Write all points
-            for point in [p1_point, p2_point, p3_point, meta_point]:
+            if self.config.metrics_schema != 'narrow':
+                s = LineProtocolSerializer
+                self._add_input_health(metrics.input_id, 'tr101290_p1', s.TR101290_P1, metrics)
+                self._add_input_health(metrics.input_id, 'tr101290_p2', s.TR101290_P2, metrics)
+                self._add_input_health(metrics.input_id, 'tr101290_p3', s.TR101290_P3, metrics)
+                if cumulative is None:
+                    self._add_input_health(metrics.input_id, 'tr101290_metadata', s.TR101290_META, metrics)
+                else:
+                    self._add_input_health(metrics.input_id, 'tr101290_metadata', s.TR101290_META_CUMULATIVE,
+                                           (metrics, cumulative))
+
+            if self.config.metrics_schema != 'wide':
+                # Priority 1/2/3 errors and metadata, one line each
                 self.write_api.write(
                     bucket=self.config.influxdb_bucket,
                     org=self.config.influxdb_org,
-                    record=point
+                    record=self.line_protocol.tr101290(metrics, cumulative)
                 )
 
             logger.debug(f"Pushed TR 101 290 metrics for {metrics.input_name}")
@@ -1338,53 +5612,50 @@ class PackagerMonitor:
         except Exception as e:
             logger.error(f"Error pushing TR 101 290 metrics: {e}")
 
-    def _calculate_mdi_metrics(self, input_source: InputSource, packet_timestamps: List[float],
-                                packet_sizes: List[int], packets_received: int, packets_lost: int,
+    def _calculate_mdi_metrics(self, input_source: InputSource, packet_timestamps: np.ndarray,
+                                packet_sizes: np.ndarray, packets_received: int, packets_lost: int,
                                 packets_out_of_order: int, bytes_received: int, duration: float,
-                                bitrate_mbps: float) -> MDIMetrics:
+                                bitrate_mbps: float, clock_source: str = 'monotonic',
+                                rtp_stats: RTPStats = None, ts_packet_count: int = 0) -> MDIMetrics:
         """Calculate Media Delivery Index (MDI) metrics - RFC 4445"""
         mdi_metrics = MDIMetrics(
             input_id=input_source.input_id,
             input_name=input_source.input_name,
+            clock_source=clock_source,
             timestamp=datetime.utcnow()
         )
 
         if len(packet_timestamps) < 2:
             return mdi_metrics
 
-        # Calculate inter-arrival times
-        inter_arrival_times = []
-        for i in range(1, len(packet_timestamps)):
-            iat = (packet_timestamps[i] - packet_timestamps[i-1]) * 1000  # Convert to ms
-            inter_arrival_times.append(iat)
-
-        # Average inter-arrival time
-        if inter_arrival_times:
-            mdi_metrics.inter_arrival_time_ms = sum(inter_arrival_times) / len(inter_arrival_times)
-
-            # Calculate jitter (variation in packet arrival time)
-            mean_iat = mdi_metrics.inter_arrival_time_ms
-            variance = sum((x - mean_iat) ** 2 for x in inter_arrival_times) / len(inter_arrival_times)
-            mdi_metrics.jitter_ms = variance ** 0.5
-            mdi_metrics.max_jitter_ms = max(abs(x - mean_iat) for x in inter_arrival_times)
-
-        # Calculate Delay Factor (DF) - RFC 4445
-        # DF = max buffer depth / bitrate (in ms)
-        # Estimate buffer depth based on packet arrival variation
-        if bitrate_mbps > 0 and mdi_metrics.max_jitter_ms > 0:
-            # Estimated buffer needed to handle jitter
-            buffer_bytes_needed = (bitrate_mbps * 1_000_000 / 8) * (mdi_metrics.max_jitter_ms / 1000)
-            mdi_metrics.buffer_depth = int(buffer_bytes_needed)
-            mdi_metrics.buffer_max = int(buffer_bytes_needed * 1.5)  # 50% safety margin
-            mdi_metrics.buffer_utilization = (mdi_metrics.buffer_depth / mdi_metrics.buffer_max * 100) if mdi_metrics.buffer_max > 0 else 0
-
-            # DF in milliseconds
-            mdi_metrics.df = mdi_metrics.max_jitter_ms
-
-        # Calculate Media Loss Rate (MLR) - RFC 4445
-        # MLR = packets lost / duration
+        # Inter-arrival times (ms) and their variation
+        inter_arrival_times = np.diff(packet_timestamps) * 1000
+        mean_iat = float(inter_arrival_times.mean())
+        mdi_metrics.inter_arrival_time_ms = mean_iat
+        mdi_metrics.jitter_ms = float(inter_arrival_times.std())
+        mdi_metrics.max_jitter_ms = float(np.abs(inter_arrival_times - mean_iat).max())
+
+        # Delay Factor and Media Loss Rate per 1 s interval from the virtual buffer model
+        ts_per_datagram = max(1, round(ts_packet_count / packets_received)) if packets_received else 7
+        mdi_metrics.intervals = mdi_intervals(
+            packet_timestamps, packet_sizes,
+            rtp_stats.loss_per_packet if rtp_stats is not None else None,
+            ts_per_datagram
+        )
+        if mdi_metrics.intervals:
+            span = float(packet_timestamps[-1] - packet_timestamps[0])
+            for interval in mdi_metrics.intervals:
+                interval.timestamp = mdi_metrics.timestamp - timedelta(seconds=span - interval.offset_sec)
+            vb_sizes = [interval.vb_bytes for interval in mdi_metrics.intervals]
+            mdi_metrics.df = max(interval.df for interval in mdi_metrics.intervals)
+            mdi_metrics.buffer_depth = int(sum(vb_sizes) / len(vb_sizes))
+            mdi_metrics.buffer_max = max(vb_sizes)
+            if mdi_metrics.buffer_max > 0:
+                mdi_metrics.buffer_utilization = mdi_metrics.buffer_depth / mdi_metrics.buffer_max * 100
+
+        # Window MLR in TS packets/sec
         if duration > 0:
-            mdi_metrics.mlr = packets_lost / duration
+            mdi_metrics.mlr = packets_lost * ts_per_datagram / duration
 
         # Network statistics
         mdi_metrics.packets_received = packets_received
@@ -1396,35 +5667,31 @@ class PackagerMonitor:
         mdi_metrics.output_rate_mbps = bitrate_mbps  # Assuming constant bitrate
         mdi_metrics.traffic_overhead = 0.0  # Could be calculated if IP/UDP headers are analyzed
 
+        # RTP: media rate excludes the RTP headers
+        if rtp_stats is not None:
+            mdi_metrics.rtp_detected = True
+            mdi_metrics.rtp_jitter_ms = rtp_stats.jitter_ms
+            mdi_metrics.packets_duplicated = rtp_stats.packets_duplicated
+            if bytes_received > 0:
+                mdi_metrics.traffic_overhead = rtp_stats.header_bytes / bytes_received * 100
+                mdi_metrics.output_rate_mbps = bitrate_mbps * (1 - rtp_stats.header_bytes / bytes_received)
+
         return mdi_metrics
 
     def _push_mdi_metrics(self, metrics: MDIMetrics):
         """Push MDI metrics to InfluxDB"""
         try:
-            # Push MDI core metrics
-            mdi_point = Point("mdi_metrics") \
-                .tag("input_id", str(metrics.input_id)) \
-                .tag("input_name", metrics.input_name) \
-                .field("df", metrics.df) \
-                .field("mlr", metrics.mlr) \
-                .field("jitter_ms", metrics.jitter_ms) \
-                .field("max_jitter_ms", metrics.max_jitter_ms) \
-                .field("inter_arrival_time_ms", metrics.inter_arrival_time_ms) \
-                .field("buffer_depth", metrics.buffer_depth) \
-                .field("buffer_max", metrics.buffer_max) \
-                .field("buffer_utilization", metrics.buffer_utilization) \
-                .field("packets_received", metrics.packets_received) \
-                .field("packets_lost", metrics.packets_lost) \
-                .field("packets_out_of_order", metrics.packets_out_of_order) \
-                .field("input_rate_mbps", metrics.input_rate_mbps) \
-                .field("output_rate_mbps", metrics.output_rate_mbps) \
-                .field("traffic_overhead", metrics.traffic_overhead) \
-                .time(metrics.timestamp)
+            # MDI core metrics, then the DF/MLR time series, one line per interval
+            lines = self.line_protocol.mdi(metrics)
+            if self.config.metrics_schema != 'narrow':
+                self._add_input_health(metrics.input_id, 'mdi_metrics', LineProtocolSerializer.MDI, metrics)
+            if self.config.metrics_schema == 'wide':
+                lines = lines[1:]  # The intervals have timestamps of their own and stay in mdi_interval
 
             self.write_api.write(
                 bucket=self.config.influxdb_bucket,
                 org=self.config.influxdb_org,
-                record=mdi_point
+                record=lines
             )
 
             logger.debug(f"Pushed MDI metrics for {metrics.input_name}")
@@ -1432,8 +5699,8 @@ class PackagerMonitor:
         except Exception as e:
             logger.error(f"Error pushing MDI metrics: {e}")
 
-    def _calculate_qoe_metrics(self, input_source: InputSource, ts_data: bytes,
-                                bitrate_mbps: float, tr_metrics: TR101290Metrics) -> QoEMetrics:
+    def _calculate_qoe_metrics(self, input_source: InputSource, bitrate_mbps: float,
+                                tr_metrics: TR101290Metrics) -> QoEMetrics:
         """Calculate Quality of Experience (QoE) metrics"""
         qoe_metrics = QoEMetrics(
             input_id=input_source.input_id,
@@ -1441,38 +5708,21 @@ class PackagerMonitor:
             timestamp=datetime.utcnow()
         )
 
-        # Track active PIDs
-        video_pids = set()
-        audio_pids = set()
-        pmt_pid = None
-
-        # Parse TS packets to identify active PIDs
-        for offset in range(0, len(ts_data), 188):
-            if offset + 188 > len(ts_data):
-                break
-
-            packet = ts_data[offset:offset+188]
-            if packet[0] != 0x47:
-                continue
-
-            pid = ((packet[1] & 0x1F) << 8) | packet[2]
-
-            # Check for PMT (typically PID 0x1000 or derived from PAT)
-            # For now, assume common video/audio PIDs
-            if 0x100 <= pid <= 0x1FF:  # Common video PID range
-                video_pids.add(pid)
-            elif 0x200 <= pid <= 0x2FF:  # Common audio PID range
-                audio_pids.add(pid)
+        # Elementary PIDs come from the PMTs parsed by the input's TR 101 290 analyzer,
+        # packet counts from the demux's PID accounting of the latest batch
+        demux = self._get_demux(input_source)
+        psi = demux.consumers['tr101290'].psi
+        pid_counter = demux.consumers['pids']
+        video_pids = psi.pids_of_kind('video')
+        audio_pids = psi.pids_of_kind('audio')
 
         # Determine if video/audio are active
-        qoe_metrics.video_pid_active = len(video_pids) > 0
-        qoe_metrics.audio_pid_active = len(audio_pids) > 0
+        qoe_metrics.video_pid_active = int(pid_counter.counts[video_pids].sum()) > 0
+        qoe_metrics.audio_pid_active = int(pid_counter.counts[audio_pids].sum()) > 0
 
-        # Estimate video/audio bitrates (rough approximation)
-        if qoe_metrics.video_pid_active:
-            qoe_metrics.video_bitrate_mbps = bitrate_mbps * 0.85  # Assume 85% for video
-        if qoe_metrics.audio_pid_active:
-            qoe_metrics.audio_bitrate_kbps = (bitrate_mbps * 0.15) * 1000  # Assume 15% for audio
+        # Video/audio bitrates from their share of the TS packets
+        qoe_metrics.video_bitrate_mbps = bitrate_mbps * pid_counter.share(video_pids)
+        qoe_metrics.audio_bitrate_kbps = bitrate_mbps * pid_counter.share(audio_pids) * 1000
 
         # Calculate quality scores based on TR 101 290 errors
         # Video quality score (5.0 = excellent, 1.0 = poor)
@@ -1494,55 +5744,78 @@ class PackagerMonitor:
 
         return qoe_metrics
 
-    def _push_qoe_metrics(self, metrics: QoEMetrics):
-        """Push QoE metrics to InfluxDB"""
+    def _push_decode_worker_metrics(self, input_source: InputSource, worker: DecodeWorker):
+        """Push loudness and health of a persistent decode worker to InfluxDB"""
         try:
-            qoe_point = Point("qoe_metrics") \
-                .tag("input_id", str(metrics.input_id)) \
-                .tag("input_name", metrics.input_name) \
-                .field("black_frames_detected", metrics.black_frames_detected) \
-                .field("freeze_frames_detected", metrics.freeze_frames_detected) \
-                .field("video_pid_active", int(metrics.video_pid_active)) \
-                .field("video_bitrate_mbps", metrics.video_bitrate_mbps) \
-                .field("audio_silence_detected", metrics.audio_silence_detected) \
-                .field("audio_pid_active", int(metrics.audio_pid_active)) \
-                .field("audio_loudness_lufs", metrics.audio_loudness_lufs) \
-                .field("audio_loudness_i", metrics.audio_loudness_i) \
-                .field("audio_loudness_lra", metrics.audio_loudness_lra) \
-                .field("audio_bitrate_kbps", metrics.audio_bitrate_kbps) \
-                .field("video_quality_score", metrics.video_quality_score) \
-                .field("audio_quality_score", metrics.audio_quality_score) \
-                .field("overall_mos", metrics.overall_mos) \
-                .time(metrics.timestamp)
+            point = Point("decode_worker") \
+                .tag("input_id", str(input_source.input_id)) \
+                .tag("input_name", input_source.input_name) \
+                .field("running", int(worker.running)) \
+                .field("audio_only", int(worker.audio_only)) \
+                .field("budget_exceeded", worker.budget_exceeded) \
+                .field("restarts", worker.restarts) \
+                .field("dropped_windows", worker.dropped_windows) \
+                .field("cpu_percent", worker.cpu_percent) \
+                .field("stream_info_changes", worker.stream_info_changes) \
+                .time(datetime.utcnow())
+
+            # None until enough audio has been measured
+            for name, value in worker.loudness.items():
+                if value is not None:
+                    point = point.field(f"loudness_{name}", value)
 
             self.write_api.write(
                 bucket=self.config.influxdb_bucket,
                 org=self.config.influxdb_org,
-                record=qoe_point
+                record=point
             )
 
+        except Exception as e:
+            logger.error(f"Error pushing decode worker metrics: {e}")
+
+    def _push_qoe_metrics(self, metrics: QoEMetrics):
+        """Push QoE metrics to InfluxDB"""
+        try:
+            if self.config.metrics_schema != 'narrow':
+                self._add_input_health(metrics.input_id, 'qoe_metrics', LineProtocolSerializer.QOE, metrics)
+            if self.config.metrics_schema != 'wide':
+                self.write_api.write(
+                    bucket=self.config.influxdb_bucket,
+                    org=self.config.influxdb_org,
+                    record=self.line_protocol.qoe(metrics)
+                )
+
             logger.debug(f"Pushed QoE metrics for {metrics.input_name}")
 
         except Exception as e:
             logger.error(f"Error pushing QoE metrics: {e}")
 
+    def _push_codec_info_if_changed(self, codec_info: CodecInfo):
+        """Push codec info only when it differs from what was last written for the input
+
+        input_health carries the codec fields every cycle, so they are always in its latest point.
+        """
+        if self.config.metrics_schema != 'narrow':
+            self._add_input_health(codec_info.input_id, 'codec_info', LineProtocolSerializer.CODEC_INFO_WIDE,
+                                   codec_info)
+            if self.config.metrics_schema == 'wide':
+                return
+        fields = asdict(codec_info)
+        fields.pop('timestamp')
+        # Bitrates measured from the stream vary every window; the configuration does not
+        fields.pop('video_bitrate_kbps')
+        fields.pop('audio_bitrate_kbps')
+        entry = self.codec_cache.get(codec_info.input_id)
+        if entry is not None and entry.pushed == fields:
+            return
+        self._push_codec_info(codec_info)
+        if entry is not None:
+            entry.pushed = fields
+
     def _push_codec_info(self, codec_info: CodecInfo):
         """Push codec information to InfluxDB"""
         try:
-            codec_point = Point("codec_info") \
-                .tag("input_id", str(codec_info.input_id)) \
-                .tag("input_name", codec_info.input_name) \
-                .tag("video_codec", codec_info.video_codec) \
-                .tag("audio_codec", codec_info.audio_codec) \
-                .field("video_profile", codec_info.video_profile) \
-                .field("video_level", codec_info.video_level) \
-                .field("video_resolution", codec_info.video_resolution) \
-                .field("video_fps", codec_info.video_fps) \
-                .field("video_bitrate_kbps", codec_info.video_bitrate_kbps) \
-                .field("audio_channels", codec_info.audio_channels) \
-                .field("audio_sample_rate", codec_info.audio_sample_rate) \
-                .field("audio_bitrate_kbps", codec_info.audio_bitrate_kbps) \
-                .time(codec_info.timestamp)
+            codec_point = self.line_protocol.codec_info(codec_info)
 
             self.write_api.write(
                 bucket=self.config.influxdb_bucket,
@@ -1555,6 +5828,30 @@ class PackagerMonitor:
         except Exception as e:
             logger.error(f"Error pushing codec info: {e}")
 
+    def _add_input_health(self, input_id: int, measurement: str, spec: tuple, metric):
+        """Fold a metric group into the input's input_health point for this cycle (the last push of a group wins)"""
+        fields = self.line_protocol.input_health_fields(measurement, spec, metric)
+        self.input_health.setdefault(input_id, {})[measurement] = fields
+
+    def _push_input_health(self, input_source: InputSource):
+        """Push the input's consolidated input_health point (wide schema), one per cycle"""
+        groups = self.input_health.pop(input_source.input_id, None)
+        if not groups:
+            return
+        fields = [field for group in groups.values() for field in group]
+        try:
+            self.write_api.write(
+                bucket=self.config.influxdb_bucket,
+                org=self.config.influxdb_org,
+                record=self.line_protocol.input_health(
+                    input_source.input_id, input_source.input_name, fields, datetime.utcnow()
+                )
+            )
+            logger.debug(f"Pushed input health for {input_source.input_name} ({len(fields)} fields)")
+
+        except Exception as e:
+            logger.error(f"Error pushing input health: {e}")
+
     def _calculate_mos(self, tr_metrics: TR101290Metrics, bitrate_mbps: float,
                        packets_lost: int, packets_received: int) -> float:
         """Calculate MOS (Mean Opinion Score) based on multiple quality factors"""
@@ -1593,6 +5890,18 @@ class PackagerMonitor:
 # MAIN
 # ============================================================================
 
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['benchmark-line-protocol']:
+        benchmark_line_protocol()
+        sys.exit(0)
+    if sys.argv[1:2] == ['benchmark-tr101290']:
+        benchmark_tr101290()
+        sys.exit(0)
+    # docker stop sends SIGTERM: shut down (and flush queued metrics) as on Ctrl-C
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
     monitor = PackagerMonitor(config)
     monitor.run()
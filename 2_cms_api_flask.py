@@ -13,6 +13,7 @@ import logging
 import os
 import glob
 from influxdb_client import InfluxDBClient
+from snapshot_store import SnapshotStore, open_snapshot
 
 # ============================================================================
 # CONFIGURATION
@@ -40,6 +41,24 @@ INFLUXDB_TOKEN = os.getenv('INFLUXDB_TOKEN', 'your_token')
 INFLUXDB_ORG = os.getenv('INFLUXDB_ORG', 'fpt-play')
 INFLUXDB_BUCKET = os.getenv('INFLUXDB_BUCKET', 'packager_metrics')
 
+# Metrics schema the packager monitor writes: 'narrow', 'wide' (one input_health point per cycle) or 'both'
+METRICS_SCHEMA = os.getenv('METRICS_SCHEMA', 'narrow').lower()
+# input_health field prefix -> narrow measurement it stands for (as written by the monitor's serializer)
+INPUT_HEALTH_MEASUREMENTS = {
+    'probe': 'udp_probe_metric',
+    'p1': 'tr101290_p1',
+    'p2': 'tr101290_p2',
+    'p3': 'tr101290_p3',
+    'tr': 'tr101290_metadata',
+    'mdi': 'mdi_metrics',
+    'qoe': 'qoe_metrics',
+    'codec': 'codec_info',
+}
+
+# Snapshots written by the packager monitor (read-only here)
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '/tmp/inspector_snapshots')
+snapshot_store = SnapshotStore(SNAPSHOT_DIR)
+
 # Initialize InfluxDB client
 try:
     influx_client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
@@ -787,20 +806,55 @@ def delete_input(input_id):
 
 @app.route('/api/v1/inputs/<int:input_id>/snapshot', methods=['GET'])
 def get_input_snapshot(input_id):
-    """Get latest snapshot image for input"""
-    inp = Input.query.get(input_id)
-
-    if not inp:
+    """Get latest snapshot image for input (?size=thumb for the thumbnail variant)"""
+    if not Input.query.get(input_id):
         return jsonify({'status': 'error', 'message': 'Input not found'}), 404
 
-    if not inp.snapshot_url or not os.path.exists(inp.snapshot_url):
-        return jsonify({'status': 'error', 'message': 'No snapshot available'}), 404
+    if request.args.get('size') == 'thumb':
+        paths = [snapshot_store.latest_path(input_id, variant) for variant in ('webp', 'jpg')]
+    else:
+        paths = [snapshot_store.latest_path(input_id)]
+    return _send_snapshot(paths)
 
-    try:
-        return send_file(inp.snapshot_url, mimetype='image/jpeg')
-    except Exception as e:
-        logger.error(f"Error serving snapshot: {e}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/v1/inputs/<int:input_id>/snapshots', methods=['GET'])
+def get_input_snapshot_history(input_id):
+    """List the snapshot history of an input (oldest first)"""
+    history = [{
+        'taken_at': datetime.utcfromtimestamp(taken_at_ms / 1000).isoformat(),
+        'taken_at_ms': taken_at_ms,
+        'size_bytes': size,
+        'url': f'/api/v1/inputs/{input_id}/snapshots/{taken_at_ms}'
+    } for taken_at_ms, _, size in snapshot_store.history(input_id)]
+
+    return jsonify({
+        'status': 'ok',
+        'count': len(history),
+        'snapshots': history
+    })
+
+
+@app.route('/api/v1/inputs/<int:input_id>/snapshots/<int:taken_at_ms>', methods=['GET'])
+def get_input_snapshot_from_history(input_id, taken_at_ms):
+    """Get one snapshot of the history"""
+    return _send_snapshot([snapshot_store.history_path(input_id, taken_at_ms)])
+
+
+def _send_snapshot(paths):
+    """Serve the first existing snapshot file: one open, then sendfile"""
+    for path in paths:
+        opened = open_snapshot(path)
+        if opened is None:
+            continue
+        f, mimetype, mtime = opened
+        try:
+            return send_file(f, mimetype=mimetype, last_modified=mtime, max_age=0)
+        except Exception as e:
+            f.close()
+            logger.error(f"Error serving snapshot: {e}")
+            return jsonify({'status': 'error', 'message': str(e)}), 500
+
+    return jsonify({'status': 'error', 'message': 'No snapshot available'}), 404
 
 
 @app.route('/api/v1/inputs/<int:input_id>/metrics', methods=['GET'])
@@ -889,6 +943,40 @@ def debug_system():
 # METRICS ENDPOINTS
 # ============================================================================
 
+def _latest_input_health(input_id, minutes=5):
+    """Latest fields of an input's input_health points, split back per narrow measurement
+
+    Returns ({measurement: {field: value}}, time of the newest field), or None when
+    the monitor is not writing the wide schema or has written none for the input in
+    the range yet. Callers then query the narrow measurements.
+    """
+    if METRICS_SCHEMA == 'narrow':
+        return None
+
+    query = f'''
+    from(bucket: "{INFLUXDB_BUCKET}")
+    |> range(start: -{minutes}m)
+    |> filter(fn: (r) => r["_measurement"] == "input_health")
+    |> filter(fn: (r) => r["input_id"] == "{input_id}")
+    |> last()
+    '''
+
+    groups = {}
+    updated = None
+    for table in influx_query_api.query(query, org=INFLUXDB_ORG):
+        for record in table.records:
+            prefix, _, field = record.get_field().partition('.')
+            measurement = INPUT_HEALTH_MEASUREMENTS.get(prefix)
+            if measurement is None:
+                continue
+            groups.setdefault(measurement, {})[field] = record.get_value()
+            if updated is None or record.get_time() > updated:
+                updated = record.get_time()
+
+    if not groups:
+        return None
+    return groups, updated
+
 @app.route('/api/v1/metrics/stream/<int:input_id>', methods=['GET'])
 def get_stream_metrics(input_id):
     """Get real-time stream metrics for an input"""
@@ -899,26 +987,33 @@ def get_stream_metrics(input_id):
         # Get time range from query params (default: last 5 minutes)
         minutes = request.args.get('minutes', 5, type=int)
 
-        # Query for basic stream metrics
-        query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-        |> range(start: -{minutes}m)
-        |> filter(fn: (r) => r["_measurement"] == "udp_probe_metric")
-        |> filter(fn: (r) => r["input_id"] == "{input_id}")
-        |> filter(fn: (r) => r["_field"] == "bitrate_mbps" or r["_field"] == "packets_received" or r["_field"] == "bytes_received")
-        '''
-
-        tables = influx_query_api.query(query, org=INFLUXDB_ORG)
+        # Query for basic stream metrics: input_health first when the monitor writes it
+        sources = [('udp_probe_metric', '')]
+        if METRICS_SCHEMA != 'narrow':
+            sources.insert(0, ('input_health', 'probe.'))
 
         metrics = []
-        for table in tables:
-            for record in table.records:
-                metrics.append({
-                    'time': record.get_time().isoformat(),
-                    'field': record.get_field(),
-                    'value': record.get_value(),
-                    'input_name': record.values.get('input_name', '')
-                })
+        for measurement, prefix in sources:
+            query = f'''
+            from(bucket: "{INFLUXDB_BUCKET}")
+            |> range(start: -{minutes}m)
+            |> filter(fn: (r) => r["_measurement"] == "{measurement}")
+            |> filter(fn: (r) => r["input_id"] == "{input_id}")
+            |> filter(fn: (r) => r["_field"] == "{prefix}bitrate_mbps" or r["_field"] == "{prefix}packets_received" or r["_field"] == "{prefix}bytes_received")
+            '''
+
+            tables = influx_query_api.query(query, org=INFLUXDB_ORG)
+
+            for table in tables:
+                for record in table.records:
+                    metrics.append({
+                        'time': record.get_time().isoformat(),
+                        'field': record.get_field()[len(prefix):],
+                        'value': record.get_value(),
+                        'input_name': record.values.get('input_name', '')
+                    })
+            if metrics:
+                break
 
         return jsonify({
             'status': 'ok',
@@ -940,59 +1035,67 @@ def get_tr101290_metrics(input_id):
 
         minutes = request.args.get('minutes', 5, type=int)
 
-        # Query P1, P2, P3 errors
-        p1_query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-        |> range(start: -{minutes}m)
-        |> filter(fn: (r) => r["_measurement"] == "tr101290_p1")
-        |> filter(fn: (r) => r["input_id"] == "{input_id}")
-        |> last()
-        '''
-
-        p2_query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-        |> range(start: -{minutes}m)
-        |> filter(fn: (r) => r["_measurement"] == "tr101290_p2")
-        |> filter(fn: (r) => r["input_id"] == "{input_id}")
-        |> last()
-        '''
-
-        p3_query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-        |> range(start: -{minutes}m)
-        |> filter(fn: (r) => r["_measurement"] == "tr101290_p3")
-        |> filter(fn: (r) => r["input_id"] == "{input_id}")
-        |> last()
-        '''
-
-        meta_query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-        |> range(start: -{minutes}m)
-        |> filter(fn: (r) => r["_measurement"] == "tr101290_metadata")
-        |> filter(fn: (r) => r["input_id"] == "{input_id}")
-        |> last()
-        '''
-
         p1_data = {}
         p2_data = {}
         p3_data = {}
         metadata = {}
 
-        for table in influx_query_api.query(p1_query, org=INFLUXDB_ORG):
-            for record in table.records:
-                p1_data[record.get_field()] = record.get_value()
-
-        for table in influx_query_api.query(p2_query, org=INFLUXDB_ORG):
-            for record in table.records:
-                p2_data[record.get_field()] = record.get_value()
-
-        for table in influx_query_api.query(p3_query, org=INFLUXDB_ORG):
-            for record in table.records:
-                p3_data[record.get_field()] = record.get_value()
-
-        for table in influx_query_api.query(meta_query, org=INFLUXDB_ORG):
-            for record in table.records:
-                metadata[record.get_field()] = record.get_value()
+        health = _latest_input_health(input_id, minutes)
+        if health is not None:
+            groups, _ = health
+            p1_data = groups.get('tr101290_p1', {})
+            p2_data = groups.get('tr101290_p2', {})
+            p3_data = groups.get('tr101290_p3', {})
+            metadata = groups.get('tr101290_metadata', {})
+        else:
+            # Query P1, P2, P3 errors
+            p1_query = f'''
+            from(bucket: "{INFLUXDB_BUCKET}")
+            |> range(start: -{minutes}m)
+            |> filter(fn: (r) => r["_measurement"] == "tr101290_p1")
+            |> filter(fn: (r) => r["input_id"] == "{input_id}")
+            |> last()
+            '''
+
+            p2_query = f'''
+            from(bucket: "{INFLUXDB_BUCKET}")
+            |> range(start: -{minutes}m)
+            |> filter(fn: (r) => r["_measurement"] == "tr101290_p2")
+            |> filter(fn: (r) => r["input_id"] == "{input_id}")
+            |> last()
+            '''
+
+            p3_query = f'''
+            from(bucket: "{INFLUXDB_BUCKET}")
+            |> range(start: -{minutes}m)
+            |> filter(fn: (r) => r["_measurement"] == "tr101290_p3")
+            |> filter(fn: (r) => r["input_id"] == "{input_id}")
+            |> last()
+            '''
+
+            meta_query = f'''
+            from(bucket: "{INFLUXDB_BUCKET}")
+            |> range(start: -{minutes}m)
+            |> filter(fn: (r) => r["_measurement"] == "tr101290_metadata")
+            |> filter(fn: (r) => r["input_id"] == "{input_id}")
+            |> last()
+            '''
+
+            for table in influx_query_api.query(p1_query, org=INFLUXDB_ORG):
+                for record in table.records:
+                    p1_data[record.get_field()] = record.get_value()
+
+            for table in influx_query_api.query(p2_query, org=INFLUXDB_ORG):
+                for record in table.records:
+                    p2_data[record.get_field()] = record.get_value()
+
+            for table in influx_query_api.query(p3_query, org=INFLUXDB_ORG):
+                for record in table.records:
+                    p3_data[record.get_field()] = record.get_value()
+
+            for table in influx_query_api.query(meta_query, org=INFLUXDB_ORG):
+                for record in table.records:
+                    metadata[record.get_field()] = record.get_value()
 
         return jsonify({
             'status': 'ok',
@@ -1028,34 +1131,43 @@ def get_input_status(input_id):
         # Get latest metrics from InfluxDB if available
         if influx_query_api:
             try:
-                # Get latest bitrate
-                query = f'''
-                from(bucket: "{INFLUXDB_BUCKET}")
-                |> range(start: -5m)
-                |> filter(fn: (r) => r["_measurement"] == "udp_probe_metric")
-                |> filter(fn: (r) => r["input_id"] == "{input_id}")
-                |> filter(fn: (r) => r["_field"] == "bitrate_mbps")
-                |> last()
-                '''
-
-                for table in influx_query_api.query(query, org=INFLUXDB_ORG):
-                    for record in table.records:
-                        status['bitrate_mbps'] = record.get_value()
-                        status['last_update'] = record.get_time().isoformat()
-
-                # Get TR 101 290 status
-                tr_query = f'''
-                from(bucket: "{INFLUXDB_BUCKET}")
-                |> range(start: -5m)
-                |> filter(fn: (r) => r["_measurement"] == "tr101290_p1")
-                |> filter(fn: (r) => r["input_id"] == "{input_id}")
-                |> filter(fn: (r) => r["_field"] == "total_p1_errors")
-                |> last()
-                '''
-
-                for table in influx_query_api.query(tr_query, org=INFLUXDB_ORG):
-                    for record in table.records:
-                        status['tr101290_p1_errors'] = record.get_value()
+                health = _latest_input_health(input_id)
+                if health is not None:
+                    groups, updated = health
+                    if 'bitrate_mbps' in groups.get('udp_probe_metric', {}):
+                        status['bitrate_mbps'] = groups['udp_probe_metric']['bitrate_mbps']
+                        status['last_update'] = updated.isoformat()
+                    if 'total_p1_errors' in groups.get('tr101290_p1', {}):
+                        status['tr101290_p1_errors'] = groups['tr101290_p1']['total_p1_errors']
+                else:
+                    # Get latest bitrate
+                    query = f'''
+                    from(bucket: "{INFLUXDB_BUCKET}")
+                    |> range(start: -5m)
+                    |> filter(fn: (r) => r["_measurement"] == "udp_probe_metric")
+                    |> filter(fn: (r) => r["input_id"] == "{input_id}")
+                    |> filter(fn: (r) => r["_field"] == "bitrate_mbps")
+                    |> last()
+                    '''
+
+                    for table in influx_query_api.query(query, org=INFLUXDB_ORG):
+                        for record in table.records:
+                            status['bitrate_mbps'] = record.get_value()
+                            status['last_update'] = record.get_time().isoformat()
+
+                    # Get TR 101 290 status
+                    tr_query = f'''
+                    from(bucket: "{INFLUXDB_BUCKET}")
+                    |> range(start: -5m)
+                    |> filter(fn: (r) => r["_measurement"] == "tr101290_p1")
+                    |> filter(fn: (r) => r["input_id"] == "{input_id}")
+                    |> filter(fn: (r) => r["_field"] == "total_p1_errors")
+                    |> last()
+                    '''
+
+                    for table in influx_query_api.query(tr_query, org=INFLUXDB_ORG):
+                        for record in table.records:
+                            status['tr101290_p1_errors'] = record.get_value()
 
             except Exception as e:
                 logger.warning(f"Could not fetch InfluxDB metrics: {e}")
@@ -1101,15 +1213,23 @@ def get_mdi_metrics(input_id):
             'input_rate_mbps': None
         }
 
-        tables = influx_query_api.query(query, org=INFLUXDB_ORG)
-        for table in tables:
-            for record in table.records:
-                field = record.get_field()
-                value = record.get_value()
+        health = _latest_input_health(input_id, minutes)
+        if health is not None:
+            groups, updated = health
+            for field, value in groups.get('mdi_metrics', {}).items():
                 if field in mdi_data:
                     mdi_data[field] = value
-                if 'timestamp' not in mdi_data:
-                    mdi_data['timestamp'] = record.get_time().isoformat()
+            mdi_data['timestamp'] = updated.isoformat()
+        else:
+            tables = influx_query_api.query(query, org=INFLUXDB_ORG)
+            for table in tables:
+                for record in table.records:
+                    field = record.get_field()
+                    value = record.get_value()
+                    if field in mdi_data:
+                        mdi_data[field] = value
+                    if 'timestamp' not in mdi_data:
+                        mdi_data['timestamp'] = record.get_time().isoformat()
 
         return jsonify({
             'status': 'ok',
@@ -1155,15 +1275,23 @@ def get_qoe_metrics(input_id):
             'audio_loudness_lra': None
         }
 
-        tables = influx_query_api.query(query, org=INFLUXDB_ORG)
-        for table in tables:
-            for record in table.records:
-                field = record.get_field()
-                value = record.get_value()
+        health = _latest_input_health(input_id, minutes)
+        if health is not None:
+            groups, updated = health
+            for field, value in groups.get('qoe_metrics', {}).items():
                 if field in qoe_data:
                     qoe_data[field] = value
-                if 'timestamp' not in qoe_data:
-                    qoe_data['timestamp'] = record.get_time().isoformat()
+            qoe_data['timestamp'] = updated.isoformat()
+        else:
+            tables = influx_query_api.query(query, org=INFLUXDB_ORG)
+            for table in tables:
+                for record in table.records:
+                    field = record.get_field()
+                    value = record.get_value()
+                    if field in qoe_data:
+                        qoe_data[field] = value
+                    if 'timestamp' not in qoe_data:
+                        qoe_data['timestamp'] = record.get_time().isoformat()
 
         return jsonify({
             'status': 'ok',
@@ -1206,24 +1334,33 @@ def get_codec_info(input_id):
             'audio_bitrate_kbps': 0
         }
 
-        tables = influx_query_api.query(query, org=INFLUXDB_ORG)
-        for table in tables:
-            for record in table.records:
-                field = record.get_field()
-                value = record.get_value()
-
-                # Get field values
+        health = _latest_input_health(input_id, minutes)
+        if health is not None:
+            # Codec names are plain fields in input_health
+            groups, updated = health
+            for field, value in groups.get('codec_info', {}).items():
                 if field in codec_data:
                     codec_data[field] = value
-
-                # Get tag values
-                if not codec_data.get('timestamp'):
-                    codec_data['timestamp'] = record.get_time().isoformat()
-                    # Tags are in record values
-                    if 'video_codec' in record.values:
-                        codec_data['video_codec'] = record.values.get('video_codec', 'Unknown')
-                    if 'audio_codec' in record.values:
-                        codec_data['audio_codec'] = record.values.get('audio_codec', 'Unknown')
+            codec_data['timestamp'] = updated.isoformat()
+        else:
+            tables = influx_query_api.query(query, org=INFLUXDB_ORG)
+            for table in tables:
+                for record in table.records:
+                    field = record.get_field()
+                    value = record.get_value()
+
+                    # Get field values
+                    if field in codec_data:
+                        codec_data[field] = value
+
+                    # Get tag values
+                    if not codec_data.get('timestamp'):
+                        codec_data['timestamp'] = record.get_time().isoformat()
+                        # Tags are in record values
+                        if 'video_codec' in record.values:
+                            codec_data['video_codec'] = record.values.get('video_codec', 'Unknown')
+                        if 'audio_codec' in record.values:
+                            codec_data['audio_codec'] = record.values.get('audio_codec', 'Unknown')
 
         return jsonify({
             'status': 'ok',
@@ -1256,65 +1393,78 @@ def get_comprehensive_metrics(input_id):
             'stream': {}
         }
 
-        # Get TR 101 290
-        tr_query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-        |> range(start: -5m)
-        |> filter(fn: (r) => r["_measurement"] =~ /^tr101290_/)
-        |> filter(fn: (r) => r["input_id"] == "{input_id}")
-        |> last()
-        '''
-
-        for table in influx_query_api.query(tr_query, org=INFLUXDB_ORG):
-            for record in table.records:
-                measurement = record.values['_measurement']
-                field = record.get_field()
-                value = record.get_value()
-
-                if measurement not in comprehensive['tr101290']:
-                    comprehensive['tr101290'][measurement] = {}
-                comprehensive['tr101290'][measurement][field] = value
-
-        # Get MDI
-        mdi_query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-        |> range(start: -5m)
-        |> filter(fn: (r) => r["_measurement"] == "mdi_metrics")
-        |> filter(fn: (r) => r["input_id"] == "{input_id}")
-        |> last()
-        '''
-
-        for table in influx_query_api.query(mdi_query, org=INFLUXDB_ORG):
-            for record in table.records:
-                comprehensive['mdi'][record.get_field()] = record.get_value()
-
-        # Get QoE
-        qoe_query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-        |> range(start: -5m)
-        |> filter(fn: (r) => r["_measurement"] == "qoe_metrics")
-        |> filter(fn: (r) => r["input_id"] == "{input_id}")
-        |> last()
-        '''
-
-        for table in influx_query_api.query(qoe_query, org=INFLUXDB_ORG):
-            for record in table.records:
-                comprehensive['qoe'][record.get_field()] = record.get_value()
-
-        # Get stream metrics
-        stream_query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-        |> range(start: -5m)
-        |> filter(fn: (r) => r["_measurement"] == "udp_probe_metric")
-        |> filter(fn: (r) => r["input_id"] == "{input_id}")
-        |> filter(fn: (r) => r["_field"] == "bitrate_mbps")
-        |> last()
-        '''
-
-        for table in influx_query_api.query(stream_query, org=INFLUXDB_ORG):
-            for record in table.records:
-                comprehensive['stream']['bitrate_mbps'] = record.get_value()
-                comprehensive['stream']['last_update'] = record.get_time().isoformat()
+        health = _latest_input_health(input_id)
+        if health is not None:
+            # One query for everything the narrow schema needs four for
+            groups, updated = health
+            for measurement, fields in groups.items():
+                if measurement.startswith('tr101290_'):
+                    comprehensive['tr101290'][measurement] = fields
+            comprehensive['mdi'] = groups.get('mdi_metrics', {})
+            comprehensive['qoe'] = groups.get('qoe_metrics', {})
+            if 'bitrate_mbps' in groups.get('udp_probe_metric', {}):
+                comprehensive['stream']['bitrate_mbps'] = groups['udp_probe_metric']['bitrate_mbps']
+                comprehensive['stream']['last_update'] = updated.isoformat()
+        else:
+            # Get TR 101 290
+            tr_query = f'''
+            from(bucket: "{INFLUXDB_BUCKET}")
+            |> range(start: -5m)
+            |> filter(fn: (r) => r["_measurement"] =~ /^tr101290_/)
+            |> filter(fn: (r) => r["input_id"] == "{input_id}")
+            |> last()
+            '''
+
+            for table in influx_query_api.query(tr_query, org=INFLUXDB_ORG):
+                for record in table.records:
+                    measurement = record.values['_measurement']
+                    field = record.get_field()
+                    value = record.get_value()
+
+                    if measurement not in comprehensive['tr101290']:
+                        comprehensive['tr101290'][measurement] = {}
+                    comprehensive['tr101290'][measurement][field] = value
+
+            # Get MDI
+            mdi_query = f'''
+            from(bucket: "{INFLUXDB_BUCKET}")
+            |> range(start: -5m)
+            |> filter(fn: (r) => r["_measurement"] == "mdi_metrics")
+            |> filter(fn: (r) => r["input_id"] == "{input_id}")
+            |> last()
+            '''
+
+            for table in influx_query_api.query(mdi_query, org=INFLUXDB_ORG):
+                for record in table.records:
+                    comprehensive['mdi'][record.get_field()] = record.get_value()
+
+            # Get QoE
+            qoe_query = f'''
+            from(bucket: "{INFLUXDB_BUCKET}")
+            |> range(start: -5m)
+            |> filter(fn: (r) => r["_measurement"] == "qoe_metrics")
+            |> filter(fn: (r) => r["input_id"] == "{input_id}")
+            |> last()
+            '''
+
+            for table in influx_query_api.query(qoe_query, org=INFLUXDB_ORG):
+                for record in table.records:
+                    comprehensive['qoe'][record.get_field()] = record.get_value()
+
+            # Get stream metrics
+            stream_query = f'''
+            from(bucket: "{INFLUXDB_BUCKET}")
+            |> range(start: -5m)
+            |> filter(fn: (r) => r["_measurement"] == "udp_probe_metric")
+            |> filter(fn: (r) => r["input_id"] == "{input_id}")
+            |> filter(fn: (r) => r["_field"] == "bitrate_mbps")
+            |> last()
+            '''
+
+            for table in influx_query_api.query(stream_query, org=INFLUXDB_ORG):
+                for record in table.records:
+                    comprehensive['stream']['bitrate_mbps'] = record.get_value()
+                    comprehensive['stream']['last_update'] = record.get_time().isoformat()
 
         return jsonify({
             'status': 'ok',
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+FPT Play - Snapshot Store
+On-disk snapshot layout shared by the packager monitor (writer) and the CMS API (reader)
+
+    <root>/input_<id>/latest.jpg              newest snapshot, replaced by atomic rename
+    <root>/input_<id>/latest_thumb.<ext>      small variant of it, when one was supplied
+    <root>/input_<id>/history/<epoch_ms>.jpg  bounded ring of earlier snapshots
+"""
+
+import os
+import re
+import tempfile
+import time
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    'jpg': 'image/jpeg',
+    'webp': 'image/webp',
+}
+
+# Files written by the old layout: <root>/input_<id>_<epoch>.jpg
+_LEGACY_FILE = re.compile(r'input_\d+_\d+\.jpg$')
+_HISTORY_FILE = re.compile(r'(\d+)\.jpg$')
+
+
+class SnapshotStore:
+    """Per-input "latest" slot plus a size/age/count-bounded history ring
+
+    Every file is written to a temporary name in its final directory and
+    renamed into place, so readers only ever open complete images and can
+    serve them with a single open + sendfile. History entries are hard
+    links to the published image, so keeping history costs no extra copy.
+    Eviction runs on every publish, which keeps disk usage flat.
+    """
+
+    def __init__(self, root: str, history_count: int = 60, history_max_bytes: int = 50 * 1024 * 1024,
+                 history_max_age_sec: int = 24 * 3600):
+        self.root = root
+        self.history_count = history_count
+        self.history_max_bytes = history_max_bytes
+        self.history_max_age_sec = history_max_age_sec
+
+    def input_dir(self, input_id: int) -> str:
+        return os.path.join(self.root, f"input_{int(input_id)}")
+
+    def latest_path(self, input_id: int, variant: str = None) -> str:
+        """Path of the latest snapshot, or of its thumbnail variant ('jpg' or 'webp')"""
+        if variant:
+            return os.path.join(self.input_dir(input_id), f"latest_thumb.{variant}")
+        return os.path.join(self.input_dir(input_id), "latest.jpg")
+
+    def history_path(self, input_id: int, taken_at_ms: int) -> str:
+        return os.path.join(self.input_dir(input_id), "history", f"{int(taken_at_ms)}.jpg")
+
+    def publish(self, input_id: int, image: bytes, thumbnail: bytes = None,
+                thumbnail_format: str = 'webp', taken_at: float = None) -> str:
+        """Store a new JPEG snapshot as the input's latest and add it to the history
+
+        Returns the path of the latest slot.
+        """
+        taken_at_ms = int((taken_at or time.time()) * 1000)
+        history_dir = os.path.dirname(self.history_path(input_id, 0))
+        os.makedirs(history_dir, exist_ok=True)
+
+        latest = self.latest_path(input_id)
+        temp = self._write_temp(os.path.dirname(latest), image)
+        try:
+            if self.history_count > 0:
+                history = self.history_path(input_id, taken_at_ms)
+                try:
+                    os.link(temp, history)
+                except FileExistsError:
+                    pass  # Same millisecond: keep the first
+            os.replace(temp, latest)
+        except BaseException:
+            self._discard(temp)
+            raise
+
+        if thumbnail:
+            thumb_path = self.latest_path(input_id, thumbnail_format)
+            os.replace(self._write_temp(os.path.dirname(thumb_path), thumbnail), thumb_path)
+        # Any other thumbnail (other format, or none supplied this time) no longer matches latest.jpg
+        for variant in MIME_TYPES:
+            if not (thumbnail and variant == thumbnail_format):
+                self._discard(self.latest_path(input_id, variant))
+
+        self.evict(input_id)
+        return latest
+
+    def history(self, input_id: int) -> List[tuple]:
+        """(epoch_ms, path, size) of the input's history entries, oldest first"""
+        history_dir = os.path.dirname(self.history_path(input_id, 0))
+        entries = []
+        try:
+            with os.scandir(history_dir) as it:
+                for entry in it:
+                    match = _HISTORY_FILE.match(entry.name)
+                    if match:
+                        try:
+                            entries.append((int(match.group(1)), entry.path, entry.stat().st_size))
+                        except FileNotFoundError:
+                            continue  # Evicted concurrently
+        except FileNotFoundError:
+            return []
+        entries.sort()
+        return entries
+
+    def evict(self, input_id: int):
+        """Drop history entries beyond the count, byte and age limits (oldest first)"""
+        entries = self.history(input_id)
+        oldest_allowed = (time.time() - self.history_max_age_sec) * 1000
+        total = sum(size for _, _, size in entries)
+        count = len(entries)
+        for taken_at_ms, path, size in entries:
+            if count <= self.history_count and total <= self.history_max_bytes and taken_at_ms >= oldest_allowed:
+                break
+            self._discard(path)
+            count -= 1
+            total -= size
+
+    def remove_legacy_files(self) -> int:
+        """Delete snapshots written by the old one-file-per-capture layout"""
+        removed = 0
+        try:
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if entry.is_file() and _LEGACY_FILE.match(entry.name):
+                        self._discard(entry.path)
+                        removed += 1
+        except FileNotFoundError:
+            pass
+        return removed
+
+    @staticmethod
+    def _write_temp(directory: str, data: bytes) -> str:
+        fd, temp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(temp, 0o644)  # mkstemp creates 0600; the CMS may run as another user
+        except BaseException:
+            SnapshotStore._discard(temp)
+            raise
+        return temp
+
+    @staticmethod
+    def _discard(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove snapshot file {path}: {e}")
+
+
+def open_snapshot(path: str) -> Optional[tuple]:
+    """Open a stored image for serving: (file object, mime type, mtime) or None when absent"""
+    try:
+        f = open(path, 'rb')
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    extension = path.rsplit('.', 1)[-1]
+    return f, MIME_TYPES.get(extension, 'application/octet-stream'), os.fstat(f.fileno()).st_mtime
@@ -0,0 +1,15 @@
+"""Loads 1_packager_monitor_service.py, whose file name is not importable, once for all tests"""
+
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+monitor = sys.modules.get('packager_monitor')
+if monitor is None:
+    _spec = importlib.util.spec_from_file_location('packager_monitor', os.path.join(ROOT, '1_packager_monitor_service.py'))
+    monitor = importlib.util.module_from_spec(_spec)
+    sys.modules['packager_monitor'] = monitor
+    _spec.loader.exec_module(monitor)
@@ -0,0 +1,141 @@
+"""
+DecodeWorker supervision: video decoding is dropped over the CPU budget and
+resumed after a sustained quiet period; restarts never share the loudness
+meter or black/freeze detector with a previous process's reader threads.
+
+    python -m pytest -q tests/test_decode_worker.py
+"""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from monitor_module import monitor
+
+
+def _input():
+    return monitor.InputSource(
+        input_id=3, input_name='worker', input_url='udp://239.0.0.3:5000', input_type='MPEGTS_UDP',
+        input_protocol='udp', input_port=5000, channel_id=3, channel_name='worker', probe_id=1,
+        is_primary=True, enabled=True
+    )
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """A worker with a live fake process; its CPU use in percent is set in `worker.load`"""
+    now = [1000.0]
+    monkeypatch.setattr(monitor.time, 'monotonic', lambda: now[0])
+
+    w = monitor.DecodeWorker(_input(), frame_interval=10, cpu_budget_percent=50)
+    w.has_audio = w.has_video = True
+    w.starts = []
+    w.load = 10.0
+    cpu = [0.0]
+
+    def start():
+        w.starts.append('audio' if w.audio_only else 'video')
+        w.process = SimpleNamespace(poll=lambda: None, pid=0)
+        w._cpu_sample = None
+        w._under_budget_since = None
+
+    w.start = start
+    w.stop = lambda: setattr(w, 'process', None)
+    w._cpu_seconds = lambda: cpu[0]
+    w.start()
+
+    def tick(seconds: float = 1.0):
+        now[0] += seconds
+        cpu[0] += w.load / 100 * seconds
+        w.supervise()
+
+    w.tick = tick
+    return w
+
+
+def test_video_dropped_over_budget_and_resumed_after_quiet_period(worker):
+    worker.load = 90.0
+    worker.tick()
+    worker.tick()
+    assert worker.audio_only and worker.starts == ['video', 'audio']
+
+    worker.load = 10.0
+    worker.tick()  # First CPU sample of the audio-only process
+    worker.tick(10.0)
+    for _ in range(29):
+        worker.tick(10.0)
+    assert worker.audio_only  # 290 s under half the budget: not yet
+
+    worker.tick(10.0)
+    assert not worker.audio_only and worker.starts == ['video', 'audio', 'video']
+
+
+def test_quiet_period_restarts_when_cpu_rises(worker):
+    worker.load = 90.0
+    worker.tick()
+    worker.tick()
+
+    worker.load = 10.0
+    worker.tick()
+    worker.tick(10.0)
+    worker.tick(200.0)
+    worker.load = 30.0  # Under the budget but not under half of it
+    worker.tick(10.0)
+    worker.load = 10.0
+    worker.tick(10.0)
+    worker.tick(290.0)
+    assert worker.audio_only
+
+    worker.tick(10.0)
+    assert not worker.audio_only
+
+
+def test_resume_delay_doubles_per_overrun(worker):
+    for overrun in range(1, 4):
+        worker.load = 90.0
+        worker.tick()
+        worker.tick()
+        assert worker.audio_only and worker.budget_exceeded == overrun
+        delay = 300.0 * 2 ** (overrun - 1)
+
+        worker.load = 10.0
+        worker.tick()
+        worker.tick(1.0)
+        worker.tick(delay - 1)
+        assert worker.audio_only
+        worker.tick(1.0)
+        assert not worker.audio_only
+
+
+def test_finished_readers_keep_the_meter():
+    w = monitor.DecodeWorker(_input(), frame_interval=10, cpu_budget_percent=50)
+    meter = w.meter = monitor.LoudnessMeter(48000, 2)
+    detector = w.detector
+    reader = threading.Thread(target=lambda: None)
+    reader.start()
+    w._readers = [reader]
+
+    w._join_readers()
+
+    assert w.meter is meter and w.detector is detector and w._readers == []
+
+
+def test_stuck_reader_gets_its_own_meter():
+    w = monitor.DecodeWorker(_input(), frame_interval=10, cpu_budget_percent=50)
+    w.reader_join_timeout = 0.05
+    meter = w.meter = monitor.LoudnessMeter(48000, 2)
+    detector = w.detector
+    release = threading.Event()
+    reader = threading.Thread(target=release.wait, daemon=True)
+    reader.start()
+    w._readers = [reader]
+
+    try:
+        w._join_readers()
+    finally:
+        release.set()
+
+    assert w.meter is None  # start() creates a fresh one for the new process
+    assert w.detector is not detector
+    assert (w.detector.black_threshold_ms, w.detector.freeze_threshold_ms) == (500, 1000)
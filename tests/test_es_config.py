@@ -0,0 +1,73 @@
+"""
+ESConfigTracker: video parameter sets are found wherever they sit in a
+batch, not only in the first few PES starts of a PID.
+
+    python -m pytest -q tests/test_es_config.py
+"""
+
+import struct
+
+import pytest
+
+from monitor_module import monitor
+
+PMT_PID, VIDEO_PID = 0x1000, 0x100
+# x264 SPS: High profile, level 4.0, 1920x1080, 30 fps
+SPS = bytes.fromhex('67640028acd940780227e584000003000400000300f03c60c658')
+
+
+def _section(table_id: int, extension: int, body: bytes) -> bytes:
+    length = 5 + len(body) + 4
+    section = bytes([table_id, 0xB0 | (length >> 8), length & 0xFF, extension >> 8, extension & 0xFF, 0xC1, 0, 0])
+    section += body
+    return section + monitor.mpeg_crc32(section).to_bytes(4, 'big')
+
+
+def _packet(pid: int, cc: int, payload: bytes, start: bool) -> bytes:
+    return bytes([0x47, (0x40 if start else 0) | (pid >> 8), pid & 0xFF, 0x10 | cc]) + \
+        payload + b'\xff' * (184 - len(payload))
+
+
+def _capture(sps_at: int, pes_count: int = 12) -> bytes:
+    """PAT, PMT and one-packet H.264 PES; only PES number `sps_at` carries the SPS"""
+    pat = _section(0x00, 1, struct.pack('>HH', 1, 0xE000 | PMT_PID))
+    pmt = _section(0x02, 1, struct.pack('>HH', 0xE000 | VIDEO_PID, 0xF000) +
+                   bytes([0x1B]) + struct.pack('>HH', 0xE000 | VIDEO_PID, 0xF000))
+    out = _packet(0, 0, b'\x00' + pat, True) + _packet(PMT_PID, 0, b'\x00' + pmt, True)
+    for i in range(pes_count):
+        es = b'\x00\x00\x00\x01\x09\xf0'  # Access unit delimiter
+        if i == sps_at:
+            es += b'\x00\x00\x00\x01' + SPS
+        es += b'\x00\x00\x01\x01' + b'\x9a' * 32  # Non-IDR slice
+        pes = b'\x00\x00\x01\xe0\x00\x00\x80\x00\x00' + es
+        out += _packet(VIDEO_PID, i & 15, pes, True)
+    return out
+
+
+def _tracker():
+    source = monitor.InputSource(
+        input_id=1, input_name='synthetic', input_url='udp://239.0.0.1:5000', input_type='MPEGTS_UDP',
+        input_protocol='udp', input_port=5000, channel_id=1, channel_name='synthetic', probe_id=1,
+        is_primary=True, enabled=True
+    )
+    demux = monitor.TSDemux('synthetic')
+    analyzer = demux.register('tr101290', monitor.TR101290Analyzer(source))
+    return demux, demux.register('es_config', monitor.ESConfigTracker(analyzer.psi))
+
+
+@pytest.mark.parametrize('sps_at', (0, 3, 9))
+def test_sps_found_in_any_pes_start(sps_at):
+    demux, tracker = _tracker()
+    demux.feed(_capture(sps_at))
+
+    assert tracker.headers[VIDEO_PID] == SPS
+    video = tracker.video[VIDEO_PID]
+    assert (video.profile, video.width, video.height) == ('High', 1920, 1080)
+
+
+def test_no_sps_in_batch_keeps_previous_configuration():
+    demux, tracker = _tracker()
+    demux.feed(_capture(sps_at=7))
+    demux.feed(_capture(sps_at=-1))
+
+    assert tracker.headers[VIDEO_PID] == SPS
@@ -0,0 +1,78 @@
+"""
+Per-window loudness: listener report windows build up a stateful meter,
+one-shot probe windows are not decoded (too short for a gating block).
+
+    python -m pytest -q tests/test_loudness_windows.py
+"""
+
+import numpy as np
+import pytest
+
+from monitor_module import monitor
+
+SAMPLE_RATE = 48000
+
+
+def _sine_pcm(seconds: float, amplitude: float = 0.1, frequency: float = 997.0) -> bytes:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    tone = (amplitude * np.sin(2 * np.pi * frequency * t)).astype('<f4')
+    return np.repeat(tone[:, None], 2, axis=1).tobytes()  # Stereo, interleaved
+
+
+def _monitor(udp_mode: str):
+    m = monitor.PackagerMonitor.__new__(monitor.PackagerMonitor)
+    m.config = monitor.MonitorConfig(udp_mode=udp_mode)
+    m.demuxers = {}
+    m.codec_cache = {}
+    m.decode_workers = {}
+    m.loudness_meters = {}
+    return m
+
+
+def _input():
+    return monitor.InputSource(
+        input_id=7, input_name='tone', input_url='udp://239.0.0.7:5000', input_type='MPEGTS_UDP',
+        input_protocol='udp', input_port=5000, channel_id=7, channel_name='tone', probe_id=1,
+        is_primary=True, enabled=True
+    )
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    """Replace the external tools: 'pcm' returns `decoded.window` seconds of tone, calls are recorded"""
+    calls = []
+
+    def run_piped(commands, data, binary=()):
+        calls.append(set(commands))
+        results = {}
+        if 'pcm' in commands:
+            results['pcm'] = (0, _sine_pcm(run_piped.window), '')
+        return results
+
+    run_piped.window = 1.0
+    run_piped.calls = calls
+    monkeypatch.setattr(monitor, 'run_piped', run_piped)
+    return run_piped
+
+
+def test_probe_windows_are_not_decoded_for_loudness(decoded):
+    m = _monitor('probe')
+    decoded.window = 0.07
+    for _ in range(10):
+        _, qoe = m._analyze_stream_with_ffprobe(_input(), b'', 8.0, contiguous=False)
+
+    assert all('pcm' not in commands for commands in decoded.calls)
+    assert m.loudness_meters == {}
+    assert qoe.audio_loudness_lufs == 0.0 and qoe.audio_loudness_i == 0.0
+
+
+def test_listener_windows_build_up_loudness(decoded):
+    m = _monitor('listener')
+    decoded.window = 1.0
+    for _ in range(4):
+        _, qoe = m._analyze_stream_with_ffprobe(_input(), b'', 8.0, contiguous=True)
+
+    assert all('pcm' in commands for commands in decoded.calls)
+    # 997 Hz sine at -20 dBFS in both channels: -3.01 LUFS per channel at full scale, -20 dB, +3.01 dB for two
+    assert qoe.audio_loudness_lufs == pytest.approx(-20.0, abs=0.1)
+    assert qoe.audio_loudness_i == pytest.approx(-20.0, abs=0.1)
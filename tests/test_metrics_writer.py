@@ -0,0 +1,110 @@
+"""
+MetricsWriter error handling: transient InfluxDB failures are spooled and
+replayed, permanent rejects (4xx) are dropped so they never block the spool.
+
+    python -m pytest -q tests/test_metrics_writer.py
+"""
+
+import threading
+import time
+
+import urllib3
+from influxdb_client.rest import ApiException
+
+from monitor_module import monitor
+
+
+class FakeWriteApi:
+    """Records written lines; rejects lines starting with 'bad' (400) and fails everything while down"""
+
+    def __init__(self):
+        self.lines = []
+        self.down = False
+        self.lock = threading.Lock()
+
+    def write(self, bucket, org, record):
+        if self.down:
+            raise urllib3.exceptions.ProtocolError('Connection aborted.')
+        if any(line.startswith('bad') for line in record):
+            raise ApiException(status=400, reason='Bad Request: field type conflict')
+        with self.lock:
+            self.lines.extend(line for line in record if not line.startswith('metrics_writer'))
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def _writer(api, spool):
+    return monitor.MetricsWriter(api, 'bucket', 'org', flush_interval=0.02, spool=spool,
+                                 replay_rate=1e6, retry_interval=0.05)
+
+
+def test_retryable_errors():
+    assert monitor.write_error_retryable(urllib3.exceptions.ProtocolError('reset'))
+    assert monitor.write_error_retryable(urllib3.exceptions.ReadTimeoutError(None, '/api/v2/write', 'timed out'))
+    assert monitor.write_error_retryable(ConnectionRefusedError())
+    assert monitor.write_error_retryable(ApiException(status=503))
+    assert monitor.write_error_retryable(ApiException(status=429))
+    assert not monitor.write_error_retryable(ApiException(status=400))
+    assert not monitor.write_error_retryable(ApiException(status=401))
+    assert not monitor.write_error_retryable(ValueError('malformed record'))
+
+
+def test_replay_drops_rejected_record_and_drains(tmp_path):
+    spool = monitor.MetricsSpool(str(tmp_path))
+    for lines in (['good1 v=1i'], ['bad v="text"'], ['good2 v=2i']):
+        spool.append('bucket', 'org', lines)
+
+    api = FakeWriteApi()
+    writer = _writer(api, spool)
+    try:
+        _wait_for(lambda: spool.empty)
+        writer.write('bucket', 'org', 'live v=3i')
+        _wait_for(lambda: 'live v=3i' in api.lines)
+    finally:
+        writer.close()
+
+    assert api.lines == ['good1 v=1i', 'good2 v=2i', 'live v=3i']
+    assert writer.dropped_points == 1
+    assert writer.replayed_points == 2
+    assert writer.spooled_points == 0
+
+
+def test_live_reject_is_dropped_not_spooled(tmp_path):
+    spool = monitor.MetricsSpool(str(tmp_path))
+    api = FakeWriteApi()
+    writer = _writer(api, spool)
+    try:
+        writer.write('bucket', 'org', 'bad v="text"')
+        _wait_for(lambda: writer.dropped_points == 1)
+        writer.write('bucket', 'org', 'live v=1i')
+        _wait_for(lambda: 'live v=1i' in api.lines)
+    finally:
+        writer.close()
+
+    assert writer.spooled_points == 0
+    assert spool.empty
+
+
+def test_outage_is_spooled_and_replayed_in_order(tmp_path):
+    spool = monitor.MetricsSpool(str(tmp_path))
+    api = FakeWriteApi()
+    api.down = True
+    writer = _writer(api, spool)
+    try:
+        for i in range(3):
+            writer.write('bucket', 'org', f'm v={i}i')
+            _wait_for(lambda: writer.spooled_points == i + 1)
+        api.down = False
+        _wait_for(lambda: spool.empty)
+        writer.write('bucket', 'org', 'm v=3i')
+        _wait_for(lambda: 'm v=3i' in api.lines)
+    finally:
+        writer.close()
+
+    assert api.lines == [f'm v={i}i' for i in range(4)]
+    assert writer.dropped_points == 0
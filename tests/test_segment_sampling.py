@@ -0,0 +1,94 @@
+"""
+HLS segment sampling: only the newest new segments are downloaded per cycle,
+and a rendition's sampled position only moves past segments that were fetched.
+
+    python -m pytest -q tests/test_segment_sampling.py
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from monitor_module import monitor
+
+
+class FakeSession:
+    """Serves every segment except those in `missing` (404), records the URLs asked for"""
+
+    def __init__(self):
+        self.missing = set()
+        self.requested = []
+
+    async def get(self, url):
+        name = url.rsplit('/', 1)[-1]
+        self.requested.append(name)
+        status = 404 if name in self.missing else 200
+        return SimpleNamespace(status_code=status, content=b'x' * 1000, transfer_ms=5.0, connect_ms=1.0,
+                               attempts=1, raise_for_status=lambda: _raise_for_status(status))
+
+    async def run(self, func):
+        return func()
+
+
+def _raise_for_status(status):
+    if status >= 400:
+        raise RuntimeError(f'HTTP {status}')
+
+
+def _playlist(media_sequence: int, count: int):
+    segments = [SimpleNamespace(uri=f'seg-{n}.ts', duration=2.0) for n in range(media_sequence, media_sequence + count)]
+    return SimpleNamespace(media_sequence=media_sequence, segments=segments)
+
+
+def _monitor(sample_segments: int = 2):
+    m = monitor.PackagerMonitor.__new__(monitor.PackagerMonitor)
+    m.config = monitor.MonitorConfig(packager_url='http://packager', hls_sample_segments=sample_segments,
+                                     min_segment_size=1)
+    m.pushed = []
+    m._push_segment_metric = m.pushed.append
+    return m
+
+
+def _cycle(m, playlist, state, session):
+    session.requested.clear()
+    variant = SimpleNamespace(uri='/live/CH/CH_R0.m3u8')
+    asyncio.run(m._sample_segments('CH', 'R0', m._new_segments(playlist, state), variant, session, state))
+    return list(session.requested)
+
+
+def test_only_the_newest_new_segments_are_sampled():
+    m, state, session = _monitor(), monitor.RenditionState(), FakeSession()
+
+    assert _cycle(m, _playlist(100, 6), state, session) == ['seg-104.ts', 'seg-105.ts']
+    assert state.sampled_through == 105
+    # Five new segments since the last poll: still only the newest two
+    assert _cycle(m, _playlist(105, 6), state, session) == ['seg-109.ts', 'seg-110.ts']
+    assert _cycle(m, _playlist(106, 6), state, session) == ['seg-111.ts']
+    assert _cycle(m, _playlist(106, 6), state, session) == []
+
+
+def test_limit_is_configurable():
+    m, state, session = _monitor(sample_segments=4), monitor.RenditionState(), FakeSession()
+
+    assert _cycle(m, _playlist(100, 6), state, session) == ['seg-102.ts', 'seg-103.ts', 'seg-104.ts', 'seg-105.ts']
+
+
+def test_failed_segment_is_retried_next_cycle():
+    m, state, session = _monitor(), monitor.RenditionState(), FakeSession()
+    _cycle(m, _playlist(100, 6), state, session)
+
+    session.missing = {'seg-106.ts'}
+    assert _cycle(m, _playlist(101, 6), state, session) == ['seg-106.ts']
+    assert state.sampled_through == 105
+
+    session.missing = set()
+    assert _cycle(m, _playlist(102, 6), state, session) == ['seg-106.ts', 'seg-107.ts']
+    assert state.sampled_through == 107
+    assert [metric.segment_number for metric in m.pushed] == [104, 105, 106, 107]
+
+
+def test_media_sequence_reset_samples_the_newest():
+    m, state, session = _monitor(), monitor.RenditionState(), FakeSession()
+    _cycle(m, _playlist(500, 6), state, session)
+
+    assert _cycle(m, _playlist(0, 6), state, session) == ['seg-4.ts', 'seg-5.ts']
+    assert state.sampled_through == 5
@@ -0,0 +1,169 @@
+"""
+TR 101 290 engine equivalence: the vectorized NumPy engine must count exactly
+what the per-packet Python reference engine counts.
+
+    python -m pytest -q tests/test_tr101290_engines.py
+
+Per-engine timing on a realistic packet mix is a CLI benchmark, not a test:
+
+    python 1_packager_monitor_service.py benchmark-tr101290
+"""
+
+import random
+import struct
+
+import pytest
+
+from monitor_module import monitor
+
+PMT_PID = 0x1000
+VIDEO_PID, AUDIO_PID, SUBTITLE_PID = 0x100, 0x101, 0x102
+UNREFERENCED_PID = 0x300
+
+
+# ============================================================================
+# SYNTHETIC CAPTURES
+# ============================================================================
+
+def _crc32_mpeg(data: bytes) -> int:
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) & 0xFFFFFFFF if crc & 0x80000000 else (crc << 1) & 0xFFFFFFFF
+    return crc
+
+
+def _section(table_id: int, extension: int, body: bytes) -> bytes:
+    length = 5 + len(body) + 4
+    header = bytes([table_id, 0xB0 | (length >> 8), length & 0xFF,
+                    extension >> 8, extension & 0xFF, 0xC1, 0, 0])
+    section = header + body
+    return section + struct.pack('>I', _crc32_mpeg(section))
+
+
+def _pat() -> bytes:
+    return _section(0x00, 1, struct.pack('>HH', 1, 0xE000 | PMT_PID))
+
+
+def _pmt() -> bytes:
+    body = struct.pack('>HH', 0xE000 | VIDEO_PID, 0xF000)
+    body += bytes([0x1B]) + struct.pack('>HH', 0xE000 | VIDEO_PID, 0xF000)
+    body += bytes([0x0F]) + struct.pack('>HH', 0xE000 | AUDIO_PID, 0xF000)
+    body += bytes([0x06]) + struct.pack('>HH', 0xE000 | SUBTITLE_PID, 0xF003) + bytes([0x6A, 1, 0])
+    return _section(0x02, 1, body)
+
+
+def make_capture(packets: int, seed: int, error_rate: float = 0.01) -> bytes:
+    """TS capture with PAT/PMT every 200 packets and injected sync, TEI, CC and PCR errors"""
+    rnd = random.Random(seed)
+    out = bytearray()
+    cc = {}
+    pcr = rnd.randint(0, 1 << 32)
+    count = 0
+
+    while count < packets:
+        if count % 200 == 0:
+            for pid, section in ((0, _pat()), (PMT_PID, _pmt())):
+                c = cc.get(pid, 0)
+                payload = bytes([0]) + section
+                out += bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10 | c]) + payload + b'\xff' * (184 - len(payload))
+                cc[pid] = (c + 1) & 15
+                count += 1
+            continue
+
+        pid = rnd.choice([VIDEO_PID, AUDIO_PID, AUDIO_PID, SUBTITLE_PID, UNREFERENCED_PID, 0x1FFF])
+        c = cc.get(pid, 0)
+        if rnd.random() < error_rate:
+            c = (c + 3) & 15  # CC discontinuity
+        packet = bytearray(188)
+        packet[0] = 0x46 if rnd.random() < error_rate else 0x47  # Sync byte error
+        packet[1] = (0x80 if rnd.random() < error_rate else 0) | (pid >> 8)  # TEI
+        packet[2] = pid & 0xFF
+        adaptation = 1
+        if pid == VIDEO_PID and rnd.random() < 0.2:
+            adaptation = 3
+            packet[4], packet[5] = 7, 0x10  # Adaptation field with a PCR
+            # PCR base ticks at 90 kHz: 10-30 ms apart, sometimes a gap over the 40 ms limit
+            if rnd.random() < error_rate * 5:
+                pcr += rnd.randint(4_500, 9_000)
+            else:
+                pcr += rnd.randint(900, 2_700)
+            base = pcr & ((1 << 33) - 1)
+            packet[6:10] = (base >> 1).to_bytes(4, 'big')
+            packet[10] = ((base & 1) << 7) | 0x7E
+        packet[3] = (adaptation << 4) | c
+        cc[pid] = (c + 1) & 15
+        out += packet
+        count += 1
+
+    return bytes(out)
+
+
+def _analyzer(engine: str) -> 'monitor.TR101290Analyzer':
+    source = monitor.InputSource(
+        input_id=1, input_name='synthetic', input_url='udp://239.0.0.1:5000', input_type='MPEGTS_UDP',
+        input_protocol='udp', input_port=5000, channel_id=1, channel_name='synthetic', probe_id=1,
+        is_primary=True, enabled=True
+    )
+    return monitor.TR101290Analyzer(source, engine=engine)
+
+
+def _cumulative(metrics) -> dict:
+    fields = monitor.TR101290_COUNTERS + ('pat_received', 'pmt_received', 'pcr_interval_ms')
+    return {name: getattr(metrics, name) for name in fields}
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.parametrize('seed', range(4))
+def test_engines_count_the_same_errors(seed, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(monitor.time, 'monotonic', lambda: now[0])
+
+    capture = make_capture(20000, seed)
+    demuxes = {}
+    for engine in ('python', 'numpy'):
+        demuxes[engine] = monitor.TSDemux('synthetic')
+        demuxes[engine].register('tr101290', _analyzer(engine))
+
+    # Uneven windows, so packets and PSI sections straddle batch boundaries
+    rnd = random.Random(seed)
+    offset = 0
+    while offset < len(capture):
+        size = rnd.randint(50, 3000) * 188 + rnd.randint(0, 187)
+        window = capture[offset:offset + size]
+        offset += size
+        now[0] += rnd.choice((0.04, 0.2, 0.7))  # Sometimes beyond the 0.5 s PAT/PMT limit
+        for demux in demuxes.values():
+            demux.feed(window)
+        assert _cumulative(demuxes['numpy'].consumers['tr101290'].metrics) == \
+            _cumulative(demuxes['python'].consumers['tr101290'].metrics)
+
+    python_totals = _cumulative(demuxes['python'].consumers['tr101290'].cumulative)
+    numpy_totals = _cumulative(demuxes['numpy'].consumers['tr101290'].cumulative)
+    assert numpy_totals == python_totals
+    # The injected errors were actually seen
+    for name in ('sync_byte_error', 'transport_error', 'continuity_count_error', 'pcr_accuracy_error', 'unreferenced_pid'):
+        assert python_totals[name] > 0, name
+
+
+def test_engines_agree_after_a_capture_gap(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(monitor.time, 'monotonic', lambda: now[0])
+
+    analyzers = {engine: _analyzer(engine) for engine in ('python', 'numpy')}
+    demuxes = {}
+    for engine, analyzer in analyzers.items():
+        demuxes[engine] = monitor.TSDemux('synthetic')
+        demuxes[engine].register('tr101290', analyzer)
+
+    for i, contiguous in enumerate((True, True, False, True)):
+        now[0] += 0.1
+        for demux in demuxes.values():
+            demux.feed(make_capture(5000, 100 + i), contiguous=contiguous)
+
+    assert _cumulative(analyzers['numpy'].cumulative) == _cumulative(analyzers['python'].cumulative)
+